@@ -0,0 +1,523 @@
+"""
+Замеры производительности конвейера чтение -> разбор -> запись -> отчёт.
+
+Этапы:
+    get_crc, crc16_modbus, make_frame, memory_read_frame - CRC и сборка кадров запросов
+    prepare_power_profile_item, parse_day - разбор получасовок
+    read_power_profile, read_power_profile_month - чтение из эмулятора счётчика (emulator.py, TCP)
+    power_profile_to_mysql - запись месяца в БД (SQLite вместо MySQL, если не задан --mysql)
+    power_profile_to_xlsx - выгрузка месяца по шаблону template.xlsx
+    create_report_Ny - html-отчёты по N годам синтетических получасовок (только с установленным pymysql)
+    startup - запуск: импорт psch.cli в новом процессе (бюджет --startup-budget, без тяжёлых зависимостей)
+
+Результаты сохраняются в JSON, сравнение с прошлым прогоном:
+
+    python bench.py --out bench_new.json --compare bench_old.json --threshold 0.2
+
+Код возврата 1, если какой-то этап стал медленнее больше чем на threshold
+или запуск не уложился в бюджет.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import date, datetime, timedelta
+
+from psch import emulator, profile, protocol, storage, transport
+from psch.meter import PSCH
+
+
+BENCH_SERIAL = 'bench'  # Заводской номер счётчика для замеров в БД
+STARTUP_BUDGET = 0.15  # Допустимое время запуска (импорт psch.cli в новом процессе), сек.
+STARTUP_LAZY_MODULES = ('serial', 'asyncio', 'pymysql', 'sqlite3', 'numpy', 'pyarrow', 'openpyxl')  # Не нужны при запуске
+
+
+def make_params(port_name_, report_dir_):
+    """
+    Параметры PSCH для замеров
+    """
+
+    return {
+        'port_name': port_name_,
+        'port_baudrate': 9600,
+        'port_parity': 'N',
+        'port_stopbits': 1,
+        'port_bytesize': 8,
+        'port_timeout': 0.3,
+        'counter_factory_number': BENCH_SERIAL,
+        'counter_identifier': 104,
+        'counter_divide': 1250,
+        'counter_transform': 1,
+        'counter_password': '000000',
+        'counter_top': 500,
+        'xlsx_template': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template.xlsx'),
+        'xlsx_result': os.path.join(report_dir_, 'result.xlsx'),
+        'report_dir': report_dir_,
+        'mysql_host': '',
+        'mysql_db': '',
+        'mysql_user': '',
+        'mysql_password': '',
+        'meter_info_cache': os.path.join(report_dir_, 'meter_info.json'),
+    }
+
+
+def make_days(date_from_, count_, seed_=1):
+    """
+    Синтетические суточные профили (DayProfile) за count_ суток начиная с date_from_
+    """
+
+    rnd = random.Random(seed_)
+    result = []
+
+    for k in range(count_):
+        day = profile.DayProfile(protocol.make_date_param(date_from_ + timedelta(days=k)), 1250, 1)
+
+        for hour in range(24):
+            day.set_hour(hour, struct.pack('>8H', *[rnd.randint(0, 3000) for i in range(8)]))
+
+        result.append(day)
+
+    return result
+
+
+class SqliteCursor:
+    """
+    Курсор sqlite3 с интерфейсом курсоров pymysql (запросы с %s и on duplicate key update)
+    """
+    def __init__(self, cursor_, dict_rows_=True):
+        self.cursor = cursor_
+        self.dict_rows = dict_rows_  # Строки словарями (DictCursor) или кортежами (Cursor, SSCursor)
+
+    def row(self, row_):
+        return dict(row_) if self.dict_rows else tuple(row_)
+
+    @staticmethod
+    def translate(query_):
+        query_ = query_.replace('%s', '?')
+
+        # Типы вычисляемых столбцов (sqlite3.PARSE_COLNAMES): дата и дата-время, как их отдаёт pymysql
+        query_ = re.sub(r'\b(date|max)\((\w+)\) as (\w+)',
+                        lambda m_: f'{m_.group(1)}({m_.group(2)}) as "{m_.group(3)} '
+                                   f'[{"date" if m_.group(1) == "date" else "timestamp"}]"',
+                        query_)
+
+        m = re.search(r'on duplicate key update (.*)$', query_, re.I | re.S)
+
+        if m is not None:
+            update = re.sub(r'values\((\w+)\)', r'excluded.\1', m.group(1))
+            query_ = query_[:m.start()] + 'on conflict (counterID, dt) do update set ' + update
+
+        return query_
+
+    def execute(self, query_, args_=None):
+        self.cursor.execute(self.translate(query_), args_ or ())
+
+    def executemany(self, query_, rows_):
+        self.cursor.executemany(self.translate(query_), rows_)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+
+        return self.row(row) if row is not None else None
+
+    def fetchall(self):
+        return [self.row(row) for row in self.cursor.fetchall()]
+
+    def fetchmany(self, size_=1):
+        return [self.row(row) for row in self.cursor.fetchmany(size_)]
+
+    def __iter__(self):
+        for row in self.cursor:
+            yield self.row(row)
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args_):
+        self.close()
+
+
+class SqliteConnection:
+    """
+    Подключение sqlite3 с интерфейсом pymysql (замена MySQL/MariaDB для замеров)
+    """
+    def __init__(self, file_name_):
+        self.db = sqlite3.connect(file_name_, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                  check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+
+    def cursor(self, cursor_class_=None):
+        # Класс курсора pymysql сравнивается по имени: pymysql для SQLite не нужен
+        dict_rows = cursor_class_ is None or any(c.__name__ == 'DictCursorMixin' for c in cursor_class_.__mro__)
+
+        return SqliteCursor(self.db.cursor(), dict_rows)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+
+sqlite3.register_adapter(datetime, lambda d_: d_.isoformat(' '))
+sqlite3.register_converter('timestamp', lambda b_: datetime.fromisoformat(b_.decode()))
+sqlite3.register_converter('date', lambda b_: date.fromisoformat(b_.decode()))
+
+
+def prepare_sqlite(file_name_, unique_key_=True):
+    """
+    Схема БД (counters, loadprofiles) в файле SQLite.
+    unique_key_ - с уникальным ключом (counterID, dt) в loadprofiles (False - старая схема без ключа)
+    """
+
+    db = SqliteConnection(file_name_)
+    cursor = db.cursor()
+    cursor.execute("create table if not exists counters (counterID integer primary key, serialNumber text)")
+    cursor.execute("create table if not exists loadprofiles (counterID integer, dt timestamp, "
+                   "activePowerConsumed real, reactiveEnergyConsumed real" +
+                   (", unique (counterID, dt))" if unique_key_ else ")"))
+    db.commit()
+
+    return db
+
+
+def add_counter(db_, serial_):
+    """
+    counterID счётчика serial_ в БД (добавляется при отсутствии)
+    """
+
+    row = storage.mysql_execute(db_, "select counterID from counters where serialNumber = %s", False, 'one', (serial_,))
+
+    if row is None:
+        storage.mysql_execute(db_, "insert into counters (serialNumber) values (%s)", True, None, (serial_,))
+        row = storage.mysql_execute(db_, "select counterID from counters where serialNumber = %s", False, 'one', (serial_,))
+
+    return row['counterID']
+
+
+def measure(func_, number_, repeat_):
+    """
+    Время одного вызова func_ (сек.): number_ вызовов в серии, repeat_ серий
+    """
+
+    times = [s / number_ for s in timeit.Timer(func_).repeat(repeat_, number_)]
+
+    return {
+        'number': number_,
+        'repeat': repeat_,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+
+
+class Bench:
+    """
+    Набор этапов замера. Каждый этап - метод stage_<имя>, возвращающий (функция, number, repeat)
+    """
+    def __init__(self, work_dir_, mysql_=None, years_=(1, 2, 3, 4, 5), quick_=False):
+        self.work_dir = work_dir_  # Папка для БД, отчётов и выгрузок
+        self.mysql = mysql_  # Параметры настоящей БД (host, db, user, password) или None - SQLite
+        self.years = years_  # Глубина отчётов в годах
+        self.quick = quick_  # Сокращённый прогон (меньше повторов)
+        self.bus = None
+        self.server = None
+        self.psch = None
+        self.port = None
+        self.startup_modules = []  # Тяжёлые модули, импортированные при запуске (этап startup)
+        self.month = make_days(date.today().replace(day=1) - timedelta(days=31), 31)
+
+    def repeat(self, repeat_):
+        return 1 if self.quick else repeat_
+
+    def open(self):
+        """
+        Эмулятор счётчика, PSCH и БД
+        """
+
+        self.bus = emulator.BusEmulator([emulator.MeterEmulator(104, days_=40, seed_=1)])
+        self.server, port = emulator.serve_tcp(self.bus)
+
+        params = make_params(f'tcp://127.0.0.1:{port}', self.work_dir)
+
+        if self.mysql is not None:
+            params['mysql_host'], params['mysql_db'], params['mysql_user'], params['mysql_password'] = self.mysql
+
+        self.psch = PSCH(params)
+        self.port = self.psch.port
+
+        if self.mysql is not None:
+            self.psch.mysql_connect()
+        else:
+            # Готовое подключение к SQLite: PSCH не подключается к MySQL сам (pymysql не нужен)
+            db_file = os.path.join(self.work_dir, 'bench.sqlite')
+            prepare_sqlite(db_file).close()
+            self.psch.db = SqliteConnection(db_file)
+            self.psch.mysql_unique_key = True  # В SQLite уникальный ключ создан вместе с таблицей
+
+        self.psch.mysql_counter_id = add_counter(self.psch.db, BENCH_SERIAL)
+
+    def close(self):
+        if self.psch is not None:
+            self.psch.mysql_close()
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+        if transport.gateway_pool is not None:
+            transport.gateway_pool.close()
+            transport.gateway_pool = None
+
+    def stage_get_crc(self):
+        return lambda: protocol.get_crc('680C0103F00082'), 20000, 5
+
+    def stage_crc16_modbus(self):
+        frame = bytes(134)
+
+        return lambda: protocol.crc16_modbus(frame), 2000, 5
+
+    def stage_make_frame(self):
+        return lambda: protocol.make_frame(104, b'\x08\x18\x00'), 20000, 5
+
+    def stage_memory_read_frame(self):
+        frames = protocol.FrameCache()
+
+        return lambda: frames.memory_read(104, 17, 3, 0xF000, profile.PROFILE_BLOCK_LEN), 20000, 5
+
+    def stage_prepare_power_profile_item(self):
+        hhx = struct.pack('>8H', *range(1000, 1008))
+        day = profile.DayProfile('010121', 1250, 1)
+        ppi1 = profile.PowerProfileItem(day, 0)
+        ppi2 = profile.PowerProfileItem(day, 1)
+
+        return lambda: self.psch.prepare_power_profile_item(ppi1, ppi2, hhx, 1250, 400), 20000, 5
+
+    def stage_parse_day(self):
+        meter = self.bus.meters[104]
+        date_param = protocol.make_date_param(date.today() - timedelta(days=1))
+        data = meter.read_memory(meter.headers[bytes.fromhex(date_param)], 24 * profile.PROFILE_RECORD_LEN + 8)
+
+        def parse():
+            day = profile.DayProfile(date_param)
+
+            for record_date, hour, values in profile.PowerProfileParser([date_param]).feed(data):
+                day.set_hour(hour, values)
+
+            return day.values()
+
+        return parse, 500, 5
+
+    def stage_read_power_profile(self):
+        date_param = protocol.make_date_param(date.today() - timedelta(days=1))
+
+        def read():
+            pointer = self.psch.read_power_profile_pointer_on_date(self.port, 104, date_param)
+
+            return self.psch.read_power_profile(self.port, 104, pointer, date_param, 1250, 1)
+
+        self.psch.open_channel(self.port, 104, '000000')
+
+        return read, 5, self.repeat(5)
+
+    def stage_read_power_profile_month(self):
+        date_to = date.today() - timedelta(days=1)
+
+        def read():
+            return self.psch.read_power_profile_range(self.port, 104, date_to - timedelta(days=30), date_to, 1250, 1)
+
+        return read, 1, self.repeat(3)
+
+    def stage_power_profile_to_mysql(self):
+        items = [item for day in self.month for item in day.items()]
+
+        return lambda: self.psch.power_profile_to_mysql(items), 1, self.repeat(5)
+
+    def stage_power_profile_to_xlsx(self):
+        items = [item for day in self.month for item in day.items()]
+        result = os.path.join(self.work_dir, 'month.xlsx')
+
+        return lambda: self.psch.power_profile_to_xlsx(items, self.psch.xlsx_template, result), 1, self.repeat(3)
+
+    def report_stage(self, years_):
+        """
+        Этап create_report по years_ годам получасовок (отдельный счётчик в БД на каждую глубину)
+        """
+
+        serial = f'{BENCH_SERIAL}-{years_}y'
+        db = self.psch.db
+        counter_id = add_counter(db, serial)
+
+        row = storage.mysql_execute(db, "select count(*) as n from loadprofiles where counterID = %s", False, 'one',
+                              (counter_id,))
+
+        if row['n'] == 0:
+            date_from = date.today() - timedelta(days=365 * years_)
+
+            for day in make_days(date_from, 365 * years_ + 1, years_):
+                rows = [(counter_id, item.date_time, item.a_plus, item.r_plus) for item in day.items()]
+                storage.mysql_execute_many(db, storage.MYSQL_UPSERT_LOADPROFILE, rows)
+
+        def report():
+            self.psch.counter_factory_number = serial
+            self.psch.mysql_counter_id = None  # counterID ищется по заводскому номеру
+            self.psch.create_report()
+
+        return report, 1, self.repeat(3)
+
+    def stage_startup(self):
+        code = f'import sys, psch.cli; print(",".join(m for m in {STARTUP_LAZY_MODULES!r} if m in sys.modules))'
+
+        def start():
+            r = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True, check=True)
+            self.startup_modules = [m for m in r.stdout.strip().split(',') if m]
+
+        return start, 1, self.repeat(5)
+
+    def stages(self):
+        """
+        Все этапы {имя: функция подготовки}
+        """
+
+        result = {name[len('stage_'):]: getattr(self, name) for name in dir(self) if name.startswith('stage_')}
+
+        # Отчёты читают БД курсором pymysql на стороне сервера (SSCursor) - без драйвера MySQL не замеряются
+        if importlib.util.find_spec('pymysql') is not None:
+            for years in self.years:
+                result[f'create_report_{years}y'] = lambda years_=years: self.report_stage(years_)
+
+        return result
+
+    def run(self, names_=None):
+        """
+        Прогон этапов names_ (все, если None)
+        :return: {этап: результаты замера}
+        """
+
+        result = {}
+
+        for name, prepare in self.stages().items():
+            if names_ and name not in names_:
+                continue
+
+            func, number, repeat = prepare()
+            func()  # Прогрев
+            result[name] = measure(func, number, repeat)
+
+            if self.psch.global_error:
+                result[name]['error'] = True
+                self.psch.global_error = False
+
+            print(f'{name:32} {result[name]["median"] * 1000:12.3f} мс')
+
+        return result
+
+
+def compare(old_, new_, threshold_):
+    """
+    Сравнение двух прогонов по медиане
+    :return: список этапов, ставших медленнее больше чем на threshold_
+    """
+
+    result = []
+
+    print(f'{"этап":32} {"было, мс":>12} {"стало, мс":>12} {"изм.":>8}')
+
+    for name, stage in new_['stages'].items():
+        old = old_['stages'].get(name)
+
+        if old is None:
+            print(f'{name:32} {"-":>12} {stage["median"] * 1000:12.3f}')
+            continue
+
+        ratio = stage['median'] / old['median'] if old['median'] > 0 else 1.0
+        mark = ''
+
+        if ratio > 1 + threshold_:
+            result.append(name)
+            mark = ' !'
+
+        print(f'{name:32} {old["median"] * 1000:12.3f} {stage["median"] * 1000:12.3f} {(ratio - 1) * 100:+7.1f}%{mark}')
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности psch')
+    parser.add_argument('--out', default='bench.json', help='Файл результатов (JSON)')
+    parser.add_argument('--compare', default=None, help='Файл прошлых результатов для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление (0.2 - на 20%%)')
+    parser.add_argument('--stages', default='', help='Этапы через запятую (по умолчанию все)')
+    parser.add_argument('--years', default='1,2,3,4,5', help='Глубина отчётов create_report в годах')
+    parser.add_argument('--mysql', default=None, help='Настоящая БД: host,db,user,password (иначе SQLite)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET, help='Бюджет запуска, сек.')
+    parser.add_argument('--quick', action='store_true', help='Один повтор для медленных этапов')
+    args = parser.parse_args()
+
+    mysql = tuple(args.mysql.split(',', 3)) if args.mysql else None
+    years = [int(y) for y in args.years.split(',') if y]
+    names = [s for s in args.stages.split(',') if s]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench = Bench(work_dir, mysql, years, args.quick)
+
+        try:
+            bench.open()
+            stages = bench.run(names)
+        finally:
+            bench.close()
+
+    over_budget = False  # Запуск не уложился в бюджет
+
+    if 'startup' in stages:
+        stages['startup']['modules'] = bench.startup_modules
+
+        if stages['startup']['median'] > args.startup_budget or bench.startup_modules:
+            over_budget = True
+            print(f'Запуск {stages["startup"]["median"] * 1000:.1f} мс (бюджет {args.startup_budget * 1000:.0f} мс), '
+                  f'импортированы при запуске: {", ".join(bench.startup_modules) or "-"}')
+
+    result = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'mysql': 'mysql' if mysql else 'sqlite',
+        },
+        'stages': stages,
+    }
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+
+        if compare(old, result, args.threshold):
+            sys.exit(1)
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
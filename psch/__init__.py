@@ -0,0 +1,25 @@
+"""
+Опрос электросчётчиков ПСЧ-4ТМ (СЭТ-4ТМ): профиль мощности в xlsx, файлы, MySQL и html-отчёты.
+
+Модули:
+    protocol - кадры запросов, CRC, форматы дат
+    profile - суточные профили мощности и их разбор
+    meter - работа со счётчиком (PSCH)
+    storage - json, MySQL, кэши на диске
+    export - выгрузка в xlsx, CSV, Parquet, Arrow
+    reports - html-отчёты
+    fleet - опрос линий и счётчиков
+    transport - шлюзы RS-485 <-> Ethernet
+    metrics - метрики опроса
+    emulator - эмулятор счётчиков для проверки без оборудования
+    cli - запуск из командной строки (main)
+
+Импорт пакета не открывает порты и не создаёт файлов, тяжёлые зависимости
+(pyserial, pymysql, numpy, pyarrow) импортируются режимами, которым они нужны
+"""
+
+import logging
+
+
+# Журнал пишет только запуск из командной строки (psch.cli.setup_logging), при импорте сообщения не выводятся
+logging.getLogger('psch2.py').addHandler(logging.NullHandler())
@@ -0,0 +1,4 @@
+from psch.cli import main
+
+
+main()
@@ -0,0 +1,233 @@
+"""
+Запуск из командной строки: python -m psch <ключ> (или python t.py <ключ>).
+
+Ключи: -test, -xlsx, -export, -mysql, -mysql-full, -mysql-migrate, -reports (см. README.md)
+"""
+
+import logging
+import sys
+from datetime import date, timedelta
+
+from psch.fleet import FleetRunner, ResultSink
+from psch.metrics import metrics
+
+
+logger = logging.getLogger('psch2.py')
+
+
+def setup_logging(file_name_):
+    """
+    Конфигурация модуля логов: запись в файл file_name_ (только при запуске из командной строки,
+    импорт пакета файлов не создаёт)
+    """
+
+    logger.setLevel(logging.INFO)
+    fh = logging.FileHandler(file_name_)
+    formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] [%(name)s] [%(message)s]')
+    fh.setFormatter(formatter)
+    logger.addHandler(fh)
+
+    return fh
+
+
+def mysql_migrate(params_):
+    """
+    Разовая миграция БД (ключ -mysql-migrate, счётчики не опрашиваются): уникальный ключ (counterID, dt)
+    в loadprofiles, после которого профиль пишется в БД через UPSERT.
+    Запускать вручную в окно обслуживания: нужна привилегия ALTER, на большой таблице ALTER TABLE идёт долго
+    """
+
+    result = False
+
+    try:
+        import pymysql
+
+        from psch.storage import mysql_add_unique_key
+
+        db = pymysql.connect(host=params_['mysql_host'],
+                             db=params_['mysql_db'],
+                             user=params_['mysql_user'],
+                             password=params_['mysql_password'],
+                             cursorclass=pymysql.cursors.DictCursor)
+
+        try:
+            result = mysql_add_unique_key(db)
+        finally:
+            db.close()
+    except:
+        logger.error(f'Ошибка при миграции БД {params_["mysql_host"]}.{params_["mysql_db"]}')
+
+    return result
+
+
+def run_mode(psch_, ext_cmd_, sink_=None):
+    """
+    Выполнение режима работы скрипта (ключа командной строки) для одного электросчётчика
+    с открытым каналом связи
+    :sink_: приёмник результатов (ResultSink), если запись должна идти в отдельном потоке
+    """
+
+    psch = psch_
+    psch.sink = sink_
+
+    # тесты
+    #ext_cmd_ = '-test'
+    if ext_cmd_ == '-test':
+        date_param = '190521'
+        pointer = psch.read_power_profile_pointer_on_date(psch.port,
+                                                          psch.counter_identifier,
+                                                          date_param)
+        items = psch.read_power_profile(psch.port,
+                                        psch.counter_identifier,
+                                        pointer,
+                                        date_param,
+                                        psch.counter_divide,
+                                        1)
+        psch.print_power_profile(items)
+        psch.print_power_profile_stats(items)
+
+    # Сохранение в ексель
+    #ext_cmd_ = '-xlsx'
+    if ext_cmd_ == '-xlsx':
+        #items = psch.read_power_profile_pointer_on_date(psch.port, psch.counter_identifier, '270521')
+
+        # Профиль мощности за вчера (для ускорения тестов)
+        # items = psch.get_prevday_power_profile(psch.port, psch.counter_identifier, psch.counter_divide, 1)
+
+        # Профиль мощности за прошлый месяц
+        items = psch.get_prevmonth_power_profile(psch.port,
+                                                 psch.counter_identifier,
+                                                 psch.counter_divide,
+                                                 1)
+
+        fn = f'{psch.report_dir}/{psch.counter_identifier}_{psch.prevmonth}.xlsx'
+        psch.submit(psch.power_profile_to_xlsx,
+                    items,
+                    psch.xlsx_template,
+                    fn)
+
+    # Выгрузка в CSV/Parquet/Arrow за прошлый месяц
+    #ext_cmd_ = '-export'
+    if ext_cmd_ == '-export':
+        last_day_prev_month = date.today().replace(day=1) - timedelta(days=1)
+
+        psch.power_profile_to_files(psch.port,
+                                    psch.counter_identifier,
+                                    last_day_prev_month.replace(day=1),
+                                    last_day_prev_month,
+                                    psch.counter_divide,
+                                    1)
+
+    # Сохранение в БД (только недостающие сутки)
+    #ext_cmd_ = '-mysql'
+    if ext_cmd_ == '-mysql':
+        psch.power_profile_to_mysql_incremental(psch.port,
+                                                psch.counter_identifier,
+                                                psch.counter_divide,
+                                                1,
+                                                psch.mysql_max_lookback_days)
+
+    # Сохранение в БД (перечитать все сутки)
+    #ext_cmd_ = '-mysql-full'
+    if ext_cmd_ == '-mysql-full':
+        psch.power_profile_to_mysql_by_days(psch.port,
+                                            psch.counter_identifier,
+                                            psch.counter_divide,
+                                            1,
+                                            psch.mysql_max_lookback_days)
+
+    # HTML-отчёты
+    #ext_cmd_ = '-reports'
+    if ext_cmd_ == '-reports':
+        psch.create_report()
+
+    return True
+
+
+def main(argv_=None):
+    """
+    :argv_: аргументы командной строки (по умолчанию sys.argv[1:])
+    """
+
+    argv = sys.argv[1:] if argv_ is None else argv_
+
+    ext_cmd = ''  # Параметр переданный скрипту
+
+    if len(argv) > 0:
+        ext_cmd = argv[0]
+
+    print(ext_cmd)
+
+    params = {
+        'log_file': 'log.txt',  # Файл журнала
+        'port_name': 'COM3',  # Имя com-порта (или адрес шлюза RS-485 <-> Ethernet: tcp://host:port, udp://host:port)
+        'port_baudrate': 9600,  # Скорость соединения
+        'port_parity': 'N',  # Четность
+        'port_stopbits': 1,  # Стоповые биты
+        'port_bytesize': 8,  # Размер байт
+        'port_timeout': 0.3,  # Таймаут
+        'counter_factory_number': '1103181104',  # Заводской номер электросчётчика
+        'counter_identifier': 104,  # Идентификатор электросчётчика (десятичное значение)
+        'counter_divide': 1250,  # Постоянная счетчика в зависимости от типа и варианта исполнения (ПСЧ-4ТМ.05МК)
+        'counter_transform': 400,  # Коэффициент трансформации (Следует узнать у энергетика)
+        'counter_password': '000000',  # Пароль для доступа к электросчётчику
+        'counter_top': 500,  # Предельное значение мощности
+        'xlsx_template': 'template.xlsx',  # Шаблон для выгруки ексел
+        'xlsx_result': 'result.xlsx',  # Результирующий файл ексель
+        'report_dir': 'C:/temp/Приморский край, Владивосток, Народный проспект, 20',  # Папка для отчётов и выгрузок
+        'report_title': 'ПСЧ: Приморский край, Владивосток, Народный проспект, 20',  # Заголовок графиков отчётов
+        'export_dir': '',  # Папка выгрузки профиля в CSV/Parquet/Arrow (ключ -export), пусто - report_dir
+        'export_formats': 'csv,parquet',  # Форматы выгрузки через запятую: csv, parquet, arrow
+        'mysql_host': 'localhost',  #
+        'mysql_db': 'electro',  #
+        'mysql_user': 'electro',  #
+        'mysql_password': '',  #
+        'mysql_max_lookback_days': 90,  # Глубина (в сутках) дозаписи профиля мощности в БД
+        'meter_info_cache': 'meter_info.json',  # Дисковый кэш метаданных счётчиков (ПО, флаги, время интегрирования)
+        'sink_queue_size': 8,  # Очередь записи результатов (суток), при заполнении опрос ждёт запись
+        'profile_cache': 'profile_cache.sqlite',  # Дисковый кэш прочитанных суток профиля мощности, пусто - без кэша
+        'metrics_file': '',  # Файл метрик в формате Prometheus (textfile collector), пусто - не писать
+        'metrics_json': '',  # Файл сводки прогона (JSON), пусто - не писать
+        'metrics_http_port': 0,  # Порт http-адреса /metrics на время работы, 0 - выключен
+        # Счётчики линии (если пусто - только счётчик, описанный выше). Недостающие параметры берутся выше, например:
+        # {'counter_identifier': 105, 'counter_factory_number': '1103181105', 'counter_transform': 200}
+        'counters': []
+    }
+
+    setup_logging(params['log_file'])
+
+    # Миграция БД - без опроса счётчиков
+    if ext_cmd == '-mysql-migrate':
+        mysql_migrate(params)
+        return
+
+    # Линии (com-порты) опрашиваются параллельно, счётчики одной линии - через один открытый порт
+    lines = [params]  # Параметры линий, для нескольких линий - по словарю как params на каждый com-порт
+
+    if params['metrics_http_port']:
+        metrics.serve_http(params['metrics_http_port'])
+
+    sink = ResultSink(params['sink_queue_size'])
+    fleet = FleetRunner(lines, sink)
+
+    try:
+        fleet.run(lambda psch, sink_: run_mode(psch, ext_cmd, sink_))
+    finally:
+        sink.close()  # Уже прочитанное дописывается и при остановке
+
+        transport = sys.modules.get('psch.transport')  # Импортируется только при работе через шлюзы
+
+        if transport is not None and transport.gateway_pool is not None:
+            transport.gateway_pool.close()
+
+    if params['metrics_file']:
+        metrics.write_prometheus(params['metrics_file'])
+
+    if params['metrics_json']:
+        metrics.write_json(params['metrics_json'])
+
+    metrics.close()
+
+
+if __name__ == '__main__':
+    main()
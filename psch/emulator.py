@@ -0,0 +1,462 @@
+"""
+Программный эмулятор электросчётчиков СЭТ-4ТМ / ПСЧ-4ТМ для тестов и замеров без оборудования.
+
+Поддерживаются запросы, которые использует PSCH (psch/meter.py):
+    00 - тест связи, 01 - открытие канала, 02 - закрытие канала,
+    0802 - коэффициенты трансформации, 0803 - версия ПО, 0804 - текущий указатель профиля,
+    0806 - время интегрирования, 0809 - программируемые флаги,
+    0328 - поиск заголовка суток, 081800 - состояние поиска,
+    06 03 - чтение памяти № 03h, 0C .. 03 - чтение памяти № 03h с индексом
+
+Память № 03h - кольцевой буфер 64 Кб с синтетическим профилем мощности
+(записи пар получасовок по 24 байта: час, дата в BCD, 4 байта заголовка, 8 слов данных).
+
+Линия (BusEmulator) умеет задержку ответа, скорость передачи, битовые ошибки и потерю байт.
+Доступ: через псевдотерминал (pty, POSIX) или TCP-сокет, например:
+
+    python -m psch.emulator --tcp 4001 --meters 104,105 --latency 0.02 --baudrate 9600
+    python -m psch.emulator --pty --bit-errors 0.0001 --drop 0.0001
+"""
+
+import argparse
+import math
+import os
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+import libscrc
+
+
+MEMORY_SIZE = 0x10000  # Размер памяти № 03h
+RECORD_LEN = 24  # Длина записи пары получасовок
+
+STATUS_OK = 0x00  # Успешное выполнение
+STATUS_BAD_COMMAND = 0x01  # Недопустимая команда или параметр
+STATUS_NO_ACCESS = 0x05  # Канал связи не открыт / неверный пароль
+
+
+def crc16(data_):
+    """
+    CRC-16/MODBUS, младшим байтом вперёд
+    """
+
+    return struct.pack('<H', libscrc.modbus(bytes(data_)))
+
+
+def bcd(value_):
+    """
+    Число (0 -> 99) в BCD: 23 -> 0x23
+    """
+
+    return (value_ // 10) * 16 + value_ % 10
+
+
+class MeterEmulator:
+    """
+    Эмулятор одного электросчётчика
+    """
+    def __init__(self, address_, password_='000000', days_=120, start_pointer_=0x1000,
+                 integration_time_=30, firmware_=b'\x21\x06\x07', search_polls_=3, seed_=None, max_block_=0xFF,
+                 outages_=()):
+        self.address = address_  # Идентификатор (сетевой адрес) счётчика
+        self.password = password_.encode()  # Пароль первого уровня
+        self.integration_time = integration_time_  # Время интегрирования, мин
+        self.firmware = firmware_  # Версия ПО (ответ на 0803)
+        self.flags = b'\x00\x00'  # Программируемые флаги (ответ на 0809)
+        self.search_polls = search_polls_  # Сколько опросов 081800 поиск "выполняется"
+        self.max_block = max_block_  # Наибольшее количество байт одного чтения памяти (зависит от версии ПО)
+        self.memory = bytearray(MEMORY_SIZE)  # Память № 03h
+        self.headers = {}  # Адреса записей часа 00 по датам {b'ddmmyy': адрес}
+        self.pointer = start_pointer_  # Текущий указатель (адрес следующей записи)
+        self.opened = False  # Канал связи открыт
+        self.search_left = 0  # Оставшиеся опросы до окончания поиска
+        self.search_result = None  # Найденный адрес (None - не найден)
+        self.random = random.Random(seed_)
+
+        # Профиль за days_ суток до текущего часа.
+        # outages_ - промежутки [(с, по)) отключения счётчика: записей за эти часы в памяти нет
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        hour = now.replace(hour=0) - timedelta(days=days_)
+
+        while hour < now:
+            if not any(start <= hour < end for start, end in outages_):
+                self.write_record(hour)
+
+            hour += timedelta(hours=1)
+
+    def make_values(self, hour_):
+        """
+        Синтетические значения пары получасовок (A+, A-, R+, R- каждой получасовки)
+        """
+
+        result = []
+
+        for half in range(2):
+            t = hour_.hour + half / 2
+            load = 1200 + 800 * math.sin((t - 6) / 24 * 2 * math.pi) + self.random.randint(0, 150)
+            result.extend([int(load), self.random.randint(0, 20), int(load * 0.3), self.random.randint(0, 10)])
+
+        return result
+
+    def write_record(self, hour_):
+        """
+        Запись пары получасовок часа hour_ по текущему указателю (по кольцу)
+        """
+
+        date_ = bytes((bcd(hour_.day), bcd(hour_.month), bcd(hour_.year % 100)))
+
+        if date_ not in self.headers:  # Первая запись суток (час 00, если счётчик не был отключён)
+            self.headers[date_] = self.pointer
+
+        record = bytes((bcd(hour_.hour),)) + date_ + bytes((0x01, self.integration_time, 0x00, 0x00))
+        record += struct.pack('>8H', *self.make_values(hour_))
+
+        for b in record:
+            self.memory[self.pointer] = b
+            self.pointer = (self.pointer + 1) % MEMORY_SIZE
+
+    def read_memory(self, address_, count_):
+        return bytes(self.memory[(address_ + i) % MEMORY_SIZE] for i in range(count_))
+
+    def reply(self, payload_):
+        """
+        Кадр ответа: адрес + payload_ + CRC
+        """
+
+        frame = bytes((self.address,)) + payload_
+
+        return frame + crc16(frame)
+
+    def handle(self, frame_):
+        """
+        Обработка кадра запроса
+        :return: кадр ответа или None (чужой адрес или ошибка CRC - счётчик молчит)
+        """
+
+        if len(frame_) < 4 or frame_[0] != self.address or libscrc.modbus(bytes(frame_)) != 0:
+            return None
+
+        cmd = frame_[1:-2]
+
+        if cmd[0] == 0x00:
+            return self.reply(bytes((STATUS_OK,)))
+
+        if cmd[0] == 0x01:
+            self.opened = cmd[1:] == self.password
+            return self.reply(bytes((STATUS_OK if self.opened else STATUS_NO_ACCESS,)))
+
+        if not self.opened:
+            return self.reply(bytes((STATUS_NO_ACCESS,)))
+
+        if cmd[0] == 0x02:
+            self.opened = False
+            return self.reply(bytes((STATUS_OK,)))
+
+        if cmd[:2] == b'\x08\x02':
+            return self.reply(struct.pack('>HHBBI', 1, 1, 0, 0, 0))
+
+        if cmd[:2] == b'\x08\x03':
+            return self.reply(self.firmware)
+
+        if cmd[:2] == b'\x08\x04':
+            return self.reply(struct.pack('>H', self.pointer))
+
+        if cmd[:2] == b'\x08\x06':
+            return self.reply(bytes((self.integration_time, 0x00)))
+
+        if cmd[:2] == b'\x08\x09':
+            return self.reply(self.flags)
+
+        if cmd[:2] == b'\x03\x28' and len(cmd) >= 9:
+            # Поиск заголовка суток: дата в байтах 6..8
+            self.search_left = self.search_polls
+            self.search_result = self.headers.get(bytes(cmd[6:9]))
+            return self.reply(bytes((STATUS_OK,)))
+
+        if cmd[:3] == b'\x08\x18\x00':
+            if self.search_left > 0:
+                self.search_left -= 1
+                state = 0x01  # Поиск выполняется
+            else:
+                state = 0x00
+
+            pointer = self.search_result if self.search_result is not None else 0xFFFF
+
+            return self.reply(bytes((state, 0x00, 0x00)) + struct.pack('>H', pointer))
+
+        if cmd[0] == 0x06 and len(cmd) == 5 and cmd[1] == 0x03:
+            address, count = struct.unpack('>HB', cmd[2:5])
+
+            if count <= self.max_block:
+                return self.reply(self.read_memory(address, count))
+
+        if cmd[0] == 0x0C and len(cmd) == 6 and cmd[2] == 0x03:
+            index = cmd[1]
+            address, count = struct.unpack('>HB', cmd[3:6])
+
+            if count <= self.max_block:
+                return self.reply(bytes((index,)) + self.read_memory(address, count))
+
+        return self.reply(bytes((STATUS_BAD_COMMAND,)))
+
+
+class BusEmulator:
+    """
+    Линия RS-485 с несколькими эмуляторами счётчиков и искажениями связи
+    """
+    def __init__(self, meters_, latency_=0.0, baudrate_=None, bit_errors_=0.0, drop_=0.0, seed_=None):
+        self.meters = {m.address: m for m in meters_}  # Счётчики линии по адресам
+        self.latency = latency_  # Задержка перед ответом, сек.
+        self.baudrate = baudrate_  # Скорость линии (None - без задержки передачи)
+        self.bit_errors = bit_errors_  # Вероятность ошибки в каждом бите ответа
+        self.drop = drop_  # Вероятность потери каждого байта ответа
+        self.random = random.Random(seed_)
+        self.lock = threading.Lock()  # Линия полудуплексная - один обмен за раз
+        self.requests = 0  # Обработано запросов
+
+    def corrupt(self, reply_):
+        """
+        Искажение ответа: битовые ошибки и потерянные байты
+        """
+
+        if self.bit_errors == 0 and self.drop == 0:
+            return reply_
+
+        result = bytearray()
+
+        for b in reply_:
+            if self.drop > 0 and self.random.random() < self.drop:
+                continue
+
+            if self.bit_errors > 0:
+                for bit in range(8):
+                    if self.random.random() < self.bit_errors:
+                        b ^= 1 << bit
+
+            result.append(b)
+
+        return bytes(result)
+
+    def transfer_time(self, count_):
+        """
+        Время передачи count_ байт по линии (10 бит на байт)
+        """
+
+        return count_ * 10 / self.baudrate if self.baudrate else 0.0
+
+    def handle(self, frame_):
+        """
+        Обмен: кадр запроса -> кадр ответа (или None)
+        """
+
+        with self.lock:
+            self.requests += 1
+
+            meter = self.meters.get(frame_[0]) if len(frame_) > 0 else None
+
+            reply = meter.handle(frame_) if meter is not None else None
+
+            delay = self.latency + self.transfer_time(len(frame_))
+
+            if reply is not None:
+                delay += self.transfer_time(len(reply))
+                reply = self.corrupt(reply)
+
+            if delay > 0:
+                time.sleep(delay)
+
+        return reply
+
+
+# Длина запроса (код запроса и параметры, без адреса и CRC) по коду запроса
+REQUEST_LENGTHS = {
+    0x00: 1,  # Тест связи
+    0x01: 7,  # Открытие канала: 01 + пароль (6 байт)
+    0x02: 1,  # Закрытие канала
+    0x03: 11,  # 0328: поиск заголовка суток
+    0x06: 5,  # Чтение памяти: 06, № памяти, адрес (2 байта), количество байт
+    0x0C: 6,  # Чтение памяти с индексом: 0C, индекс, № памяти, адрес (2 байта), количество байт
+}
+
+REQUEST_08_LENGTHS = {0x18: 3}  # Запросы 08 с параметром (081800 - состояние поиска), остальные 08 xx - 2 байта
+
+
+def request_length(buffer_):
+    """
+    Длина кадра запроса (адрес, запрос, CRC) по коду запроса в начале буфера,
+    0 - код запроса неизвестен или ещё не принят
+    """
+
+    if len(buffer_) < 2:
+        return 0
+
+    code = buffer_[1]
+
+    if code == 0x08:
+        if len(buffer_) < 3:
+            return 0
+
+        return REQUEST_08_LENGTHS.get(buffer_[2], 2) + 3
+
+    length = REQUEST_LENGTHS.get(code)
+
+    return length + 3 if length is not None else 0
+
+
+def split_frame(buffer_):
+    """
+    Длина первого полного кадра запроса в буфере или 0 (кадр ещё не принят целиком).
+
+    Конец кадра определяется по длине известного запроса, а не по первому префиксу с верным CRC:
+    у части кадров (например 0C) CRC сходится уже на неполном кадре.
+    Кадр неизвестного запроса заканчивается паузой между байтами (см. serve_stream)
+    """
+
+    length = request_length(buffer_)
+
+    if length == 0 or len(buffer_) < length:
+        return 0
+
+    return length
+
+
+def serve_stream(bus_, read_, write_, gap_=0.05):
+    """
+    Обслуживание потока байт (сокет, pty): запросы разделяются по длине известных запросов (split_frame),
+    кадр неизвестного запроса заканчивается паузой gap_. Кадр с неверным CRC счётчик молча отбрасывает
+    """
+
+    buffer = bytearray()
+    last_rx = time.monotonic()
+
+    while True:
+        data = read_()
+
+        if data is None:  # Поток закрыт
+            break
+
+        if data:
+            buffer += data
+            last_rx = time.monotonic()
+        elif buffer and time.monotonic() - last_rx > gap_:
+            # Пауза - конец кадра: неизвестный запрос или мусор (ответа не будет, если CRC не сошёлся)
+            reply = bus_.handle(bytes(buffer))
+            buffer.clear()
+
+            if reply:
+                write_(reply)
+
+        while True:
+            length = split_frame(buffer)
+
+            if length == 0:
+                break
+
+            reply = bus_.handle(bytes(buffer[:length]))
+            del buffer[:length]
+
+            if reply:
+                write_(reply)
+
+
+def serve_tcp(bus_, host_='127.0.0.1', port_=0):
+    """
+    TCP-сервер эмулятора (как шлюз RS-485 <-> Ethernet), работает в отдельном потоке
+    :return: (сервер, порт)
+    """
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            self.request.settimeout(0.01)
+
+            def read():
+                try:
+                    data = self.request.recv(1024)
+                    return data if data else None
+                except socket.timeout:
+                    return b''
+                except OSError:
+                    return None
+
+            serve_stream(bus_, read, self.request.sendall)
+
+    server = socketserver.ThreadingTCPServer((host_, port_), Handler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, server.server_address[1]
+
+
+def serve_pty(bus_):
+    """
+    Эмулятор на псевдотерминале (POSIX): к возвращаемому имени устройства
+    подключаются как к обычному com-порту (serial.Serial)
+    :return: имя устройства (например /dev/pts/5)
+    """
+
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    os.set_blocking(master, False)
+
+    def read():
+        try:
+            return os.read(master, 1024)
+        except BlockingIOError:
+            time.sleep(0.001)
+            return b''
+        except OSError:
+            return None
+
+    def write(data_):
+        os.write(master, data_)
+
+    threading.Thread(target=serve_stream, args=(bus_, read, write), daemon=True).start()
+
+    return os.ttyname(slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Эмулятор электросчётчиков СЭТ-4ТМ / ПСЧ-4ТМ')
+    parser.add_argument('--meters', default='104', help='Идентификаторы счётчиков через запятую')
+    parser.add_argument('--password', default='000000', help='Пароль счётчиков')
+    parser.add_argument('--days', type=int, default=120, help='Глубина профиля мощности, сутки')
+    parser.add_argument('--tcp', type=int, default=None, help='TCP-порт')
+    parser.add_argument('--pty', action='store_true', help='Псевдотерминал')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, сек.')
+    parser.add_argument('--baudrate', type=int, default=None, help='Скорость линии')
+    parser.add_argument('--bit-errors', type=float, default=0.0, help='Вероятность ошибки бита')
+    parser.add_argument('--drop', type=float, default=0.0, help='Вероятность потери байта')
+    parser.add_argument('--max-block', type=lambda v_: int(v_, 0), default=0xFF,
+                        help='Наибольшее количество байт одного чтения памяти (например 0x82)')
+    parser.add_argument('--seed', type=int, default=None, help='Зерно генератора случайных чисел')
+    args = parser.parse_args()
+
+    meters = [MeterEmulator(int(a), args.password, args.days, seed_=args.seed,
+                            max_block_=args.max_block) for a in args.meters.split(',')]
+    bus = BusEmulator(meters, args.latency, args.baudrate, args.bit_errors, args.drop, args.seed)
+
+    if args.tcp is not None:
+        server, port = serve_tcp(bus, '0.0.0.0', args.tcp)
+        print(f'TCP: tcp://127.0.0.1:{port}')
+
+    if args.pty:
+        print(f'PTY: {serve_pty(bus)}')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""
+Выгрузка профиля мощности в файлы: xlsx по шаблону (XlsxProfileWriter),
+CSV, Parquet и Arrow по счётчикам и месяцам (ProfileExporter)
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import zipfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from psch.profile import PROFILE_CHANNELS, PROFILE_CHANNEL_NAMES, import_numpy, profile_to_array
+
+
+logger = logging.getLogger('psch2.py')
+
+
+XLSX_PROFILE_SHEET = 'xl/worksheets/sheet2.xml'  # Лист "Профили нагрузки" в шаблоне xlsx
+XLSX_FIRST_DATA_ROW = 13  # Первая строка данных на листе профиля
+XLSX_DATE_CELL = 'AG1'  # Ячейка даты выгрузки в шапке листа профиля
+XLSX_CHUNK_ROWS = 1000  # Строк листа, записываемых за раз
+XLSX_WORKSHEET_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+XLSX_WORKSHEET_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+
+
+class XlsxProfileWriter:
+    """
+    Потоковая запись профилей мощности в xlsx по шаблону (template.xlsx).
+
+    Неизменные части шаблона (стили, тема, лист "Энергии на конец месяца", шапка листа профиля)
+    копируются как есть, строки данных пишутся сразу в XML листа по мере поступления,
+    поэтому память не зависит от количества строк.
+    В одну книгу можно добавить несколько листов профиля (счётчики, месяцы) за один проход.
+
+    Стили и объединения ячеек строк данных берутся из первой строки данных шаблона (XLSX_FIRST_DATA_ROW):
+    первое объединение строки - дата и время получасовки, второе - значение A+.
+    Если шаблон устроен иначе, конструктор поднимает ValueError
+    """
+    def __init__(self, template_, result_):
+        self.template = zipfile.ZipFile(template_)  # Шаблон
+        self.sheets = []  # Добавленные листы профиля [(название, файл листа)]
+
+        sheet = self.template.read(XLSX_PROFILE_SHEET).decode('utf-8')
+        data_start = sheet.index('<sheetData>') + len('<sheetData>')
+        data_end = sheet.index('</sheetData>')
+
+        # Начало XML листа: без размеров (заранее не известны) и с курсором в начале листа
+        self.head = re.sub(r'<dimension [^>]*/>', '', sheet[:data_start])
+        self.head = re.sub(r' topLeftCell="[^"]*"', '', self.head)
+        self.head = re.sub(r'<selection [^>]*/>', '<selection activeCell="A1" sqref="A1"/>', self.head)
+
+        # Конец XML листа: объединения ячеек шапки, объединения строк данных добавляются по числу строк
+        tail = sheet[data_end:]
+        self.header_merges = ''.join(m.group(0) for m in re.finditer(r'<mergeCell ref="[A-Z]+(\d+):[^"]*"/>', tail)
+                                     if int(m.group(1)) < XLSX_FIRST_DATA_ROW)
+
+        # Объединения ячеек строки данных (столбцы): [('A', 'I'), ('J', 'AC')]
+        self.row_merges = [(m.group(1), m.group(3))
+                           for m in re.finditer(r'<mergeCell ref="([A-Z]+)(\d+):([A-Z]+)(\d+)"/>', tail)
+                           if int(m.group(2)) == XLSX_FIRST_DATA_ROW and int(m.group(4)) == XLSX_FIRST_DATA_ROW]
+        self.row_merges.sort(key=lambda m_: (len(m_[0]), m_[0]))
+
+        if len(self.row_merges) < 2:
+            raise ValueError(f'В шаблоне {template_} строка {XLSX_FIRST_DATA_ROW} листа профиля должна содержать '
+                             f'объединения ячеек даты и значения, найдено: {self.row_merges}')
+
+        merges_start = tail.index('<mergeCells')
+        merges_end = tail.index('</mergeCells>') + len('</mergeCells>')
+        self.tail_start = tail[:merges_start]
+        self.tail_end = tail[merges_end:]
+
+        # Строки шапки и образец строки данных (ячейки со стилями)
+        rows = {int(m.group(1)): m.group(0)
+                for m in re.finditer(r'<row r="(\d+)"[^>]*>.*?</row>', sheet[data_start:data_end])}
+        self.template_rows = max(rows)  # Строки с оформлением в шаблоне (пустые строки после данных)
+        self.header_rows = [rows[r] for r in sorted(rows) if r < XLSX_FIRST_DATA_ROW]
+
+        cells = re.findall(r'<c r="([A-Z]+)%d" s="(\d+)"/>' % XLSX_FIRST_DATA_ROW,
+                           rows.get(XLSX_FIRST_DATA_ROW, ''))
+        values = {self.row_merges[0][0]: 'a', self.row_merges[1][0]: 'j'}  # Столбец -> поле строки данных
+        missing = set(values) - set(c for c, s in cells)
+
+        if missing:
+            raise ValueError(f'В шаблоне {template_} нет пустых ячеек со стилем {sorted(missing)} '
+                             f'в строке {XLSX_FIRST_DATA_ROW} листа профиля')
+
+        empty = ''.join(f'<c r="{c}%(r)s" s="{s}"/>' for c, s in cells)
+        self.empty_row = f'<row r="%(r)s">{empty}</row>'
+        self.data_row = '<row r="%(r)s">' + \
+            ''.join(f'<c r="{c}%(r)s" s="{s}" t="inlineStr"><is><t>%({values[c]})s</t></is></c>' if c in values
+                    else f'<c r="{c}%(r)s" s="{s}"/>' for c, s in cells) + '</row>'
+
+        # Стиль даты для ячейки даты выгрузки (AG1): стиль ячейки шаблона + формат "дд.мм.гг чч:мм"
+        self.styles = self.template.read('xl/styles.xml').decode('utf-8')
+        xfs = re.search(r'<cellXfs count="(\d+)">(.*?)</cellXfs>', self.styles, re.S)
+        xf_list = re.findall(r'<xf [^>]*?(?:/>|>.*?</xf>)', xfs.group(2))
+        date_cell = re.search(r'<c r="%s" s="(\d+)"/>' % XLSX_DATE_CELL, rows.get(1, ''))
+
+        if date_cell is None:
+            raise ValueError(f'В шаблоне {template_} нет пустой ячейки {XLSX_DATE_CELL} (дата выгрузки) '
+                             f'в шапке листа профиля')
+
+        ag1_style = int(date_cell.group(1))
+        date_xf = xf_list[ag1_style].replace('numFmtId="0"', 'numFmtId="22" applyNumberFormat="1"', 1)
+        self.date_style = len(xf_list)
+        self.styles = self.styles[:xfs.start()] + \
+            f'<cellXfs count="{len(xf_list) + 1}">{xfs.group(2)}{date_xf}</cellXfs>' + \
+            self.styles[xfs.end():]
+
+        self.result = zipfile.ZipFile(result_, 'w', zipfile.ZIP_DEFLATED)  # Результат (после проверки шаблона)
+
+    def add_sheet(self, title_, items_, created_=None):
+        """
+        Лист профиля мощности: строки items_ (PowerProfileItem, можно генератором) пишутся по мере получения
+        """
+
+        title = re.sub(r'[\[\]:*?/\\]', '_', title_)[:31]
+        titles = [t for t, f in self.sheets]
+        n = 1
+        while title in titles:
+            n += 1
+            title = f'{title_[:27]} ({n})'
+
+        file_name = f'xl/worksheets/profile{len(self.sheets) + 1}.xml'
+        self.sheets.append((title, file_name))
+
+        created = created_ or datetime.now()
+        serial = (created - datetime(1899, 12, 30)).total_seconds() / 86400  # Дата Excel
+
+        head = self.head
+        if len(self.sheets) > 1:
+            head = head.replace(' tabSelected="1"', '')
+
+        header = ''.join(self.header_rows)
+        header = re.sub(r'<c r="%s" s="\d+"/>' % XLSX_DATE_CELL,
+                        f'<c r="{XLSX_DATE_CELL}" s="{self.date_style}"><v>{serial}</v></c>', header)
+
+        with self.result.open(file_name, 'w') as f:
+            f.write((head + header).encode('utf-8'))
+
+            r = XLSX_FIRST_DATA_ROW
+            chunk = []
+
+            for item in items_:
+                chunk.append(self.data_row % {'r': r,
+                                              'a': escape(f'{item.date_param}  {item.time_param}'),
+                                              'j': escape(str(item.a_plus))})
+                r += 1
+
+                if len(chunk) >= XLSX_CHUNK_ROWS:
+                    f.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+
+            # Оформленные пустые строки до конца таблицы шаблона
+            last = max(r - 1, self.template_rows)
+
+            while r <= last:
+                chunk.append(self.empty_row % {'r': r})
+                r += 1
+
+            f.write(''.join(chunk).encode('utf-8'))
+
+            merges = [''.join(f'<mergeCell ref="{a}{i}:{b}{i}"/>' for a, b in self.row_merges)
+                      for i in range(XLSX_FIRST_DATA_ROW, last + 1)]
+            count = self.header_merges.count('<mergeCell ') + len(merges) * len(self.row_merges)
+
+            f.write((self.tail_start +
+                     f'<mergeCells count="{count}">{self.header_merges}' +
+                     ''.join(merges) + '</mergeCells>' + self.tail_end).encode('utf-8'))
+
+    def close(self):
+        """
+        Запись описания книги (листы, связи, типы) и остальных частей шаблона
+        """
+
+        try:
+            workbook = self.template.read('xl/workbook.xml').decode('utf-8')
+            rels = self.template.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+            types = self.template.read('[Content_Types].xml').decode('utf-8')
+
+            profile_target = XLSX_PROFILE_SHEET[len('xl/'):]
+            rel_id = re.search(r'<Relationship Id="(\w+)"[^>]*Target="%s"/>' % profile_target, rels).group(1)
+
+            sheets = re.search(r'<sheets>.*?</sheets>', workbook).group(0)
+            sheets = re.sub(r'<sheet [^>]*r:id="%s"/>' % rel_id, '', sheets)
+            sheet_id = max(int(i) for i in re.findall(r'sheetId="(\d+)"', workbook))
+
+            new_sheets = ''
+            new_rels = ''
+            new_types = ''
+
+            for i, (title, file_name) in enumerate(self.sheets, start=1):
+                new_sheets += f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{sheet_id + i}" r:id="rIdP{i}"/>'
+                new_rels += f'<Relationship Id="rIdP{i}" Type="{XLSX_WORKSHEET_REL}" Target="{file_name[len("xl/"):]}"/>'
+                new_types += f'<Override PartName="/{file_name}" ContentType="{XLSX_WORKSHEET_TYPE}"/>'
+
+            workbook = workbook.replace(re.search(r'<sheets>.*?</sheets>', workbook).group(0),
+                                        sheets.replace('</sheets>', new_sheets + '</sheets>'))
+
+            if not self.sheets:
+                workbook = re.sub(r' activeTab="\d+"', '', workbook)
+
+            rels = re.sub(r'<Relationship Id="%s"[^>]*/>' % rel_id, '', rels)
+            rels = rels.replace('</Relationships>', new_rels + '</Relationships>')
+            types = re.sub(r'<Override PartName="/%s"[^>]*/>' % re.escape(XLSX_PROFILE_SHEET), '', types)
+            types = types.replace('</Types>', new_types + '</Types>')
+
+            replaced = {
+                'xl/workbook.xml': workbook,
+                'xl/_rels/workbook.xml.rels': rels,
+                '[Content_Types].xml': types,
+                'xl/styles.xml': self.styles,
+                # Список листов в свойствах документа больше не совпадает с шаблоном
+                'docProps/app.xml': '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                                    '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/'
+                                    'extended-properties"><Application>Microsoft Excel</Application></Properties>',
+            }
+
+            for info in self.template.infolist():
+                if info.filename == XLSX_PROFILE_SHEET:
+                    continue
+
+                if info.filename in replaced:
+                    self.result.writestr(info.filename, replaced[info.filename].encode('utf-8'))
+                else:
+                    self.result.writestr(info.filename, self.template.read(info.filename))
+        finally:
+            self.result.close()
+            self.template.close()
+
+
+EXPORT_FORMATS = ('csv', 'parquet', 'arrow')  # Форматы выгрузки профиля мощности в файлы
+EXPORT_CHUNK_DAYS = 7  # Суток в одной порции записи (группа строк Parquet, пакет Arrow)
+EXPORT_CSV_HEADER = 'meter,dt,a_plus,a_minus,r_plus,r_minus\n'  # Заголовок CSV
+
+
+def arrow_available():
+    """
+    Установлены ли PyArrow и NumPy (нужны для выгрузки в Parquet и Arrow)
+    """
+
+    return importlib.util.find_spec('pyarrow') is not None and import_numpy() is not None
+
+
+class ProfileExporter(ABC):
+    """
+    Потоковая выгрузка профиля мощности одного электросчётчика в файлы по месяцам:
+    <папка>/<заводской номер>/<гггг_мм>.<формат>.
+
+    Сутки (DayProfile) принимаются по мере чтения, файл месяца открывается с первыми сутками месяца
+    и закрывается при переходе к следующему, поэтому память не зависит от длины диапазона.
+    Файл месяца перезаписывается целиком. Пишутся только полученные из счётчика получасовки.
+    Формат задаётся наследником: open_month, write_day, close_month (без них наследник не создаётся)
+    """
+    extension = ''  # Расширение файлов формата
+
+    def __init__(self, dir_, meter_):
+        self.dir = dir_  # Папка выгрузки
+        self.meter = str(meter_)  # Заводской номер электросчётчика
+        self.month = None  # Текущий месяц (гггг_мм)
+        self.files = []  # Записанные файлы
+
+    def add_day(self, day_):
+        """
+        Дописать сутки (сутки отдаются по порядку)
+        """
+
+        month = f'20{day_.date_param[4:6]}_{day_.date_param[2:4]}'
+
+        if month != self.month:
+            self.close()
+
+            file_name = os.path.join(self.dir, self.meter, f'{month}.{self.extension}')
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+
+            self.open_month(file_name)
+            self.month = month
+            self.files.append(file_name)
+
+        self.write_day(day_)
+
+    def close(self):
+        """
+        Закрыть файл текущего месяца
+        """
+
+        if self.month is not None:
+            self.close_month()
+            self.month = None
+
+            logger.info(f'Успешное сохранение профиля нагрузки в файл {self.files[-1]}')
+
+    @abstractmethod
+    def open_month(self, file_name_):
+        """
+        Открыть файл месяца file_name_
+        """
+
+    @abstractmethod
+    def write_day(self, day_):
+        """
+        Записать сутки day_ (DayProfile) в файл текущего месяца
+        """
+
+    @abstractmethod
+    def close_month(self):
+        """
+        Дописать и закрыть файл текущего месяца
+        """
+
+
+class CsvProfileExporter(ProfileExporter):
+    """
+    Выгрузка профиля мощности в CSV (дата-время "гггг-мм-дд чч:мм:сс", значения в кВт/квар)
+    """
+    extension = 'csv'
+
+    def __init__(self, dir_, meter_):
+        super().__init__(dir_, meter_)
+        self.file = None  # Открытый файл месяца
+
+    def open_month(self, file_name_):
+        self.file = open(file_name_, 'w', encoding='utf-8', newline='')
+        self.file.write(EXPORT_CSV_HEADER)
+
+    def write_day(self, day_):
+        values = day_.values()
+        rows = []
+
+        for i in range(48):
+            if day_.received[i // 2]:
+                pos = i * PROFILE_CHANNELS
+                rows.append(f'{self.meter},{day_.date_time(i)},{values[pos]},{values[pos + 1]},'
+                            f'{values[pos + 2]},{values[pos + 3]}\n')
+
+        self.file.write(''.join(rows))
+
+    def close_month(self):
+        self.file.close()
+        self.file = None
+
+
+class ArrowProfileExporter(ProfileExporter):
+    """
+    Выгрузка профиля мощности в Parquet (format_='parquet') или в файл Arrow IPC (format_='arrow').
+    Типы колонок: meter - строка, dt - timestamp (мс), a_plus ... r_minus - float64.
+    Сутки копятся порциями по EXPORT_CHUNK_DAYS и переводятся в колонки одним проходом (profile_to_array).
+    Нужны PyArrow и NumPy
+    """
+    def __init__(self, dir_, meter_, format_='parquet'):
+        import pyarrow
+
+        super().__init__(dir_, meter_)
+        self.extension = format_
+        self.writer = None  # Запись файла месяца (ParquetWriter или RecordBatchFileWriter)
+        self.days = []  # Ещё не записанные сутки месяца
+        self.schema = pyarrow.schema([('meter', pyarrow.string()), ('dt', pyarrow.timestamp('ms'))] +
+                                     [(name, pyarrow.float64()) for name in PROFILE_CHANNEL_NAMES])
+
+    def open_month(self, file_name_):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if self.extension == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(file_name_, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(file_name_, self.schema)
+
+    def write_day(self, day_):
+        self.days.append(day_)
+
+        if len(self.days) >= EXPORT_CHUNK_DAYS:
+            self.flush()
+
+    def flush(self):
+        """
+        Записать накопленные сутки одной порцией
+        """
+
+        if len(self.days) == 0:
+            return
+
+        import pyarrow
+
+        values = profile_to_array(self.days)
+        values = values[values['valid']]
+
+        columns = [pyarrow.repeat(self.meter, len(values)).cast(pyarrow.string()),
+                   pyarrow.array(values['dt'].astype('datetime64[ms]'))] + \
+                  [pyarrow.array(values[name]) for name in PROFILE_CHANNEL_NAMES]
+
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.days = []
+
+    def close_month(self):
+        try:
+            self.flush()
+        finally:
+            self.writer.close()
+            self.writer = None
+            self.days = []
@@ -0,0 +1,232 @@
+"""
+Опрос линий и счётчиков: несколько счётчиков одной линии через один порт (BusPoller),
+линии параллельно (FleetRunner), запись результатов в отдельном потоке (ResultSink)
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from psch.meter import PSCH, open_port
+
+
+logger = logging.getLogger('psch2.py')
+
+
+class BusPoller:
+    """
+    Опрос нескольких электросчётчиков одной линии RS-485 через один открытый порт.
+
+    Счётчики линии перечислены в params_['counters'] (идентификатор, пароль, постоянная,
+    коэффициент трансформации, заводской номер ...), недостающие параметры берутся из params_.
+    Для каждого счётчика создаётся свой PSCH (свои параметры и флаг ошибки), порт общий
+    """
+    def __init__(self, params_, stop_event_=None):
+        self.params = params_
+        self.port = open_port(params_)  # Общий порт линии
+        self.meters = []  # PSCH каждого счётчика линии
+        self.stop_event = stop_event_  # Остановка опроса (оставшиеся счётчики не опрашиваются)
+
+        if self.port is not None:
+            for counter in params_.get('counters') or [{}]:
+                meter_params = dict(params_)
+                meter_params.update(counter)
+
+                psch = PSCH(meter_params, self.port)
+                psch.stop_event = stop_event_
+                self.meters.append(psch)
+
+    def poll(self, job_):
+        """
+        Опрос счётчиков линии друг за другом, без переоткрытия порта:
+        тест связи, открытие канала, job_(psch), закрытие канала
+
+        :job_: функция от PSCH
+        :return: {counter_identifier: результат job_ (None, если счётчик недоступен)}
+        """
+
+        result = {}
+
+        for psch in self.meters:
+            r = None
+
+            if psch.stopping():
+                break
+
+            if psch.test_counter(psch.port, psch.counter_identifier):
+                logger.info(f'Тест электросчётчика {psch.counter_identifier} пройден')
+
+                if psch.open_channel(psch.port, psch.counter_identifier, psch.counter_password):
+                    try:
+                        r = job_(psch)
+                    finally:
+                        # Канал закрывается и при ошибке или остановке опроса
+                        psch.close_channel(psch.port, psch.counter_identifier)
+                else:
+                    """
+                    Одна из причин - это неверный пароль 
+                    """
+                    logger.error(f'Неудалось открыт канал с электросчётком {psch.counter_identifier}')
+            else:
+                logger.error(f'Тест электросчётчика {psch.counter_identifier} не пройден')
+
+            result[psch.counter_identifier] = r
+
+        return result
+
+    def close(self):
+        """
+        Закрытие порта линии (и кэшей профилей мощности счётчиков)
+        """
+
+        for psch in self.meters:
+            if psch.profile_cache is not None:
+                psch.profile_cache.close()
+
+        if self.port is not None:
+            try:
+                self.port.close()
+            except:
+                pass
+
+            self.port = None
+
+
+class ResultSink:
+    """
+    Приёмник результатов опроса: отдельный поток, по очереди выполняющий задания записи
+    (MySQL, xlsx, файлы) от всех потоков опроса.
+    Ограниченная очередь (maxsize_) притормаживает опрос, если запись не успевает,
+    пока запись идёт, опрос читает следующие сутки - время линии и время БД не складываются
+    """
+    def __init__(self, maxsize_=0):
+        self.queue = queue.Queue(maxsize_)  # Задания (функция, аргументы)
+        self.errors = 0  # Количество заданий, завершившихся исключением
+        self.tasks = 0  # Выполнено заданий
+        self.busy = 0.0  # Время выполнения заданий (сек.)
+        self.blocked = 0.0  # Время ожидания опроса из-за заполненной очереди (сек.)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='ResultSink', daemon=True)
+        self.thread.start()
+
+    def put(self, func_, *args_):
+        """
+        Поставить задание в очередь (ждёт, если очередь заполнена)
+        """
+
+        started = time.monotonic()
+
+        self.queue.put((func_, args_))
+
+        with self.lock:
+            self.blocked += time.monotonic() - started
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+
+            if task is None:
+                break
+
+            func, args = task
+            started = time.monotonic()
+
+            try:
+                func(*args)
+            except:
+                logger.error(f'Ошибка при записи результатов опроса ({getattr(func, "__name__", func)})')
+                self.errors += 1
+
+            self.tasks += 1
+            self.busy += time.monotonic() - started
+
+    def close(self):
+        """
+        Дождаться выполнения всех заданий и остановить поток
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+
+        logger.info(f'Запись результатов: заданий {self.tasks}, ошибок {self.errors}, '
+                    f'запись {round(self.busy, 3)} сек., ожидание опроса {round(self.blocked, 3)} сек.')
+
+
+class FleetRunner:
+    """
+    Параллельный опрос нескольких линий (com-портов).
+    Каждая линия опрашивается в своём потоке своим BusPoller, ошибка одной линии не влияет на другие,
+    результаты записываются через общий приёмник ResultSink
+    """
+    def __init__(self, lines_, sink_=None):
+        self.lines = lines_  # Параметры линий (как params, у каждой свой port_name и counters)
+        self.sink = sink_  # Общий приёмник результатов
+        self.stop_event = threading.Event()  # Остановка опроса (Ctrl+C): чтение прерывается, каналы закрываются
+
+    def run(self, job_):
+        """
+        Опрос всех линий параллельно
+        :job_: функция (psch, sink), выполняется для каждого счётчика с открытым каналом
+        :return: сводка {port_name: {'duration': сек, 'meters': счётчиков, 'polled': опрошено, 'errors': [...]}}
+        """
+
+        result = {}
+
+        if len(self.lines) == 0:
+            return result
+
+        with ThreadPoolExecutor(max_workers=len(self.lines)) as pool:
+            futures = {pool.submit(self.run_line, line, job_): line['port_name'] for line in self.lines}
+
+            try:
+                for future in as_completed(futures):
+                    result[futures[future]] = future.result()
+            except KeyboardInterrupt:
+                logger.error('Опрос прерван, закрытие каналов связи')
+                self.stop_event.set()
+                raise
+
+        for port_name, line_result in result.items():
+            logger.info(f'Линия {port_name}: {line_result["duration"]} сек., '
+                        f'опрошено {line_result["polled"]} из {line_result["meters"]}, '
+                        f'ошибок {len(line_result["errors"])}')
+
+        return result
+
+    def run_line(self, line_, job_):
+        """
+        Опрос одной линии (выполняется в потоке пула)
+        """
+
+        result = {'duration': 0.0, 'meters': 0, 'polled': 0, 'errors': []}
+
+        started = time.monotonic()
+        poller = None
+
+        try:
+            poller = BusPoller(line_, self.stop_event)
+
+            if poller.port is None:
+                result['errors'].append(f'Не удалось открыть порт {line_["port_name"]}')
+            else:
+                polled = poller.poll(lambda psch: job_(psch, self.sink))
+
+                result['meters'] = len(poller.meters)
+
+                for psch in poller.meters:
+                    if polled.get(psch.counter_identifier) is not None and not psch.global_error:
+                        result['polled'] += 1
+                    else:
+                        result['errors'].append(f'Электросчётчик {psch.counter_identifier} не опрошен')
+        except Exception as e:
+            logger.error(f'Ошибка при опросе линии {line_["port_name"]}: {e}')
+            result['errors'].append(str(e))
+        finally:
+            if poller is not None:
+                poller.close()
+
+        result['duration'] = round(time.monotonic() - started, 3)
+
+        return result
@@ -0,0 +1,1443 @@
+"""
+Работа с электросчётчиком ПСЧ-4ТМ (СЭТ-4ТМ) по com-порту или через шлюз: открытие канала связи,
+чтение метаданных и профиля мощности, запись результатов в БД, xlsx, файлы и отчёты.
+
+Зависимости отдельных режимов (pyserial, asyncio-транспорт, pymysql, выгрузка в файлы, отчёты)
+импортируются при первом использовании, чтобы запуск не платил за то, что режиму не нужно
+"""
+
+import logging
+import struct
+import time
+from datetime import date, datetime, timedelta
+
+from psch.metrics import metrics, opcode_name
+from psch.profile import (HALF_HOURS, PROFILE_BLOCK_LEN, PROFILE_MAX_BLOCK_LEN, PROFILE_MEMORY_SIZE, PROFILE_RECORD_LEN,
+                          DayProfile, PowerProfileParser, expected_header_address, expected_records, is_day_header,
+                          profile_stats)
+from psch.protocol import (FrameCache, check_crc, get_crc, get_gap_timeout, make_date_param, make_true_date,
+                           next_pointer, str_to_hex)
+from psch.storage import (MYSQL_BATCH_SIZE, MYSQL_INSERT_LOADPROFILE, MYSQL_UPSERT_LOADPROFILE, MeterInfo,
+                          ProfileCache, load_json, mysql_execute, mysql_execute_many, mysql_has_unique_key, update_json)
+
+
+logger = logging.getLogger('psch2.py')
+
+
+def open_port(params_):
+    """
+    Открытие com-порта (или соединения со шлюзом) по параметрам линии
+    :return: serial.Serial (transport.LinkPort для шлюза) или None при ошибке
+    """
+
+    result = None
+
+    try:
+        if '://' in params_['port_name']:
+            from psch import transport
+
+            # Шлюз RS-485 <-> Ethernet (tcp://host:port, udp://host:port) или com-порт через asyncio (serial://COM3)
+            result = transport.get_gateway_pool().port(params_['port_name'],
+                                                       params_['port_timeout'],
+                                                       params_['port_baudrate'])
+        else:
+            import serial
+
+            result = serial.Serial(
+                port=params_['port_name'],  # Имя com-порта
+                baudrate=params_['port_baudrate'],  # Скорость соединения
+                parity=params_['port_parity'],  # Четность
+                stopbits=params_['port_stopbits'],  # Стоповые биты
+                bytesize=params_['port_bytesize'],  # Размер байт
+                timeout=params_['port_timeout']  # Таймаут
+            )
+
+        logger.info(f'Инициализация com-порта {params_["port_name"]} прошла успешно')
+    except:
+        logger.error(f'Инициализация com-порта {params_["port_name"]} произошла с ошибкой')
+
+    return result
+
+
+class PSCH:
+    def __init__(self, params_, port_=None):
+        self.global_error = False  # Флаг глобальной ошибки, после которой невозможно работать метадам класса
+
+        logger.info('Инициализация приложения')
+
+        #
+        self.port = None
+        self.port_name = params_['port_name']  # Имя com-порта (адрес шлюза) - метка линии в метриках
+        self.counter_factory_number = params_['counter_factory_number']  # Заводской номер электросчётчика
+        self.counter_identifier = params_[
+            'counter_identifier']  # Идентификатор электросчётчика (десятичное значение)
+        self.counter_divide = params_[
+            'counter_divide']  # Постоянная электросчётчика в зависимости от типа и варианта исполнения
+        self.counter_transform = params_[
+            'counter_transform']  # Коэффициент трансформации (Следует узнать у энергетика)
+        self.counter_password = params_['counter_password']  # Пароль для доступа к электросчётчику
+        self.counter_top = params_['counter_top']  # Предельное значение мощности
+        self.xlsx_template = params_['xlsx_template']  # Шаблон для выгруки ексел
+        self.xlsx_result = params_['xlsx_result']  # Результирующий файл ексель
+        self.prevmonth = ''  # Параметр для результирующего фаля ексель. гггг_мм (2021_06)
+        self.mysql_host = params_['mysql_host']  #
+        self.mysql_db = params_['mysql_db']  #
+        self.mysql_user = params_['mysql_user']  #
+        self.mysql_password = params_['mysql_password']  #
+        self.report_dir = params_.get('report_dir', '.')  # Папка для отчётов и выгрузок
+        self.report_title = params_.get('report_title', 'ПСЧ')  # Заголовок графиков отчётов
+        self.export_dir = params_.get('export_dir', '') or self.report_dir  # Папка выгрузки профиля в CSV/Parquet/Arrow
+        self.export_formats = params_.get('export_formats', 'csv')  # Форматы выгрузки через запятую (csv,parquet,arrow)
+        self.meter_info_cache = params_.get('meter_info_cache', 'meter_info.json')  # Дисковый кэш метаданных счётчиков
+        self.profile_cache = None  # Дисковый кэш суточных профилей мощности (ProfileCache)
+
+        if params_.get('profile_cache', ''):
+            self.profile_cache = ProfileCache(params_['profile_cache'])
+
+        self.meter_info = {}  # Метаданные счётчиков на время открытого канала {counter_identifier: MeterInfo}
+        self.frames = FrameCache()  # Кэш кадров запросов
+        self.db = None  # Подключение к БД (открывается при первой записи)
+        self.mysql_counter_id = None  # counterID электросчётчика в БД
+        self.mysql_unique_key = False  # Есть ли в loadprofiles уникальный ключ (counterID, dt)
+
+        self.mysql_max_lookback_days = params_.get('mysql_max_lookback_days', 90)  # Глубина дозаписи в БД (сутки)
+        self.sink = None  # Приёмник результатов (ResultSink), если запись идёт в отдельном потоке
+        self.stop_event = None  # Событие остановки опроса (FleetRunner), чтение прекращается между блоками
+        self.request_retries = params_.get('request_retries', 3)  # Повторов запроса при ошибке CRC или без ответа
+        self.request_backoff = params_.get('request_backoff', 0.05)  # Пауза перед первым повтором (сек.), дальше x2
+        self.missing_half_hours = []  # Не прочитанные получасовки [(гггг-мм-дд, '21:00-21:30'), ...]
+
+        if port_ is not None:  # Порт общий для нескольких счётчиков линии (BusPoller)
+            self.port = port_
+        else:
+            self.port = open_port(params_)
+
+            if self.port is None:
+                self.global_error = True
+
+    def stopping(self):
+        """
+        Запрошена остановка опроса
+        """
+
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def submit(self, func_, *args_):
+        """
+        Запись результата: через приёмник результатов (в его потоке), если он задан, иначе сразу
+        """
+
+        if self.sink is not None:
+            self.sink.put(func_, *args_)
+        else:
+            func_(*args_)
+
+    def prepare_command(self, cmd):
+        """
+        Добавляет в конец команды crc
+
+        cmd (string) - команда для отправки в com-порт
+        result (string)
+        """
+
+        result = ''
+        if not self.global_error:
+            try:
+                crc = get_crc(cmd)
+                result = f'{cmd}{crc}'
+            except:
+                logger.error(f'Ошибка при добавлении CRC к команде: {cmd}')
+                self.global_error = True
+
+        return result
+
+    def send_to_port(self, port_, counter_identifier_, cmd, answer_len_=None):
+        """
+        Посылает запрос в com-порт (hex-строки, оставлено для совместимости, см. send_frame).
+
+        cmd - должен быть без crc на конце. Функция сама его подставит
+        """
+
+        return self.send_frame(port_, counter_identifier_, str_to_hex(cmd), answer_len_).hex()
+
+    def send_frame(self, port_, counter_identifier_, payload_, answer_len_=None):
+        """
+        Посылает запрос в com-порт.
+
+        payload_ (bytes) - код запроса с параметрами, без адреса и crc. Функция сама их подставит
+        answer_len_ - ожидаемая длина кадра ответа в байтах (вместе с адресом и CRC), если известна
+        result (bytes) - кадр ответа целиком
+        """
+
+        result = b''
+
+        if not self.global_error:
+            try:
+                frame = self.frames.request(counter_identifier_, payload_)
+            except:
+                logger.error(f'Ошибка при добавлении CRC к команде: {bytes(payload_).hex()}')
+                self.global_error = True
+
+        if not self.global_error:
+            result = self.request(port_, frame, answer_len_)
+
+        return result
+
+    def request(self, port_, frame_, answer_len_=None):
+        """
+        Обмен с проверкой CRC ответа: при ошибке CRC или отсутствии ответа запрос повторяется
+        до request_retries раз с нарастающей паузой.
+        result (bytes) - кадр ответа с верным CRC или b'' (ответа так и не получено)
+        """
+
+        result = b''
+
+        for attempt in range(self.request_retries + 1):
+            if attempt > 0:
+                metrics.retry(self.port_name, opcode_name(frame_[1:]))
+                time.sleep(self.request_backoff * 2 ** (attempt - 1))
+
+            r = self.exchange(port_, frame_, answer_len_)
+
+            if self.global_error:
+                break
+
+            if check_crc(r):
+                result = r
+                break
+
+        return result
+
+    def exchange(self, port_, frame_, answer_len_=None):
+        """
+        Отправка готового кадра в com-порт и чтение ответа.
+
+        Чтение ответа прекращается как только пришёл полный кадр с верным CRC,
+        либо после межсимвольной паузы, либо по общему таймауту порта.
+        Через шлюз (transport.LinkPort) обмен выполняет цикл событий GatewayPool (Link.request)
+        """
+
+        result = bytearray()
+
+        cmd_print = False  # Флаг печати ввода/вывода команд в консоль
+
+        if not self.global_error:
+            try:
+                if cmd_print:
+                    print(f'TX:    {frame_.hex()}')
+
+                start = time.monotonic()
+
+                if hasattr(port_, 'request'):
+                    # Шлюз: ответ ждёт цикл событий, без опроса буфера из этого потока
+                    result += port_.request(frame_, answer_len_)
+                else:
+                    port_.flushInput()
+                    port_.flushOutput()
+                    port_.write(frame_)
+
+                    gap = get_gap_timeout(port_.baudrate)  # Пауза конца кадра
+                    poll = gap / 10  # Период опроса входного буфера порта
+                    end_time = time.monotonic() + port_.timeout
+
+                    if answer_len_ is not None:
+                        end_time += answer_len_ * 11 / port_.baudrate  # Время передачи ответа (11 бит на символ)
+                    last_rx = None  # Время получения последнего байта
+
+                    while True:
+                        waiting = port_.inWaiting()
+
+                        if waiting:
+                            result += port_.read(waiting)
+                            last_rx = time.monotonic()
+
+                            if answer_len_ is None or len(result) >= answer_len_:
+                                if check_crc(result):
+                                    break
+                        else:
+                            now = time.monotonic()
+
+                            # Кадр начался, но байты перестали приходить
+                            if last_rx is not None and now - last_rx > gap:
+                                break
+
+                            if now > end_time:
+                                break
+
+                            time.sleep(poll)
+
+                metrics.observe_exchange(self.port_name,
+                                         opcode_name(frame_[1:]),
+                                         time.monotonic() - start,
+                                         len(frame_),
+                                         len(result),
+                                         len(result) > 0 and not check_crc(result),
+                                         len(result) == 0)
+
+                if cmd_print:
+                    print(f'RX:    {result.hex()}')
+                    print('')
+            except:
+                logger.error(f'Ошибка при отправке команды электросчётчику: {frame_.hex()}')
+                self.global_error = True
+
+        return bytes(result)
+
+    def test_counter(self, port_, counter_identifier_):
+        """
+        Проверка, доступен ли счётчик
+        Проверка строиться на посылке счётчику короткой строки, если в ответ пришла посылаемая строка,
+        то тест пройден
+        """
+
+        result = False
+
+        if not self.global_error:
+            try:
+                r = self.send_frame(port_, counter_identifier_, b'\x00', 4)
+                if len(r) > 0:
+                    logger.info(f'Тест связи с электросчётчиком №: {counter_identifier_} пройден')
+                    result = True
+            except:
+                logger.error(f'Тест связи с электросчётчиком №: {counter_identifier_} не пройден')
+                self.global_error = True
+
+        return result
+
+    def open_channel(self, port_, counter_identifier_, counter_password_):
+        """
+        Открытие канала связи со счётчиком
+        """
+
+        result = False
+        password = b''
+
+        if not self.global_error:
+            try:
+                password = counter_password_.encode()
+            except:
+                logger.error(f'Ошибка при конвертации пароля: {counter_password_}')
+                self.global_error = True
+
+        if not self.global_error:
+            try:
+                self.meter_info.pop(counter_identifier_, None)
+
+                r = self.send_frame(port_, counter_identifier_, b'\x01' + password, 4)
+
+                etalon_ansver = self.frames.ok_answer(counter_identifier_)
+
+                if len(r) != 0:
+                    if etalon_ansver == r:
+                        result = True
+            except:
+                logger.error(f'Ошибка при открытии канала с электросчётчиком №: {counter_identifier_}')
+                self.global_error = True
+
+        return result
+
+    def close_channel(self, port_, counter_identifier_):
+        """
+        Закрытие канала связи со счётчиком
+        """
+
+        result = False
+
+        if not self.global_error:
+            try:
+                self.meter_info.pop(counter_identifier_, None)
+
+                r = self.send_frame(port_, counter_identifier_, b'\x02', 4)
+
+                etalon_ansver = self.frames.ok_answer(counter_identifier_)
+
+                if len(r) != 0:
+                    if etalon_ansver == r:
+                        result = True
+            except:
+                logger.error(f'Ошибка при закрытии канала с электросчётчиком №: {counter_identifier_}')
+                self.global_error = True
+
+        return result
+
+    def read_meter_info(self, port_, counter_identifier_):
+        """
+        Метаданные электросчётчика (MeterInfo).
+        Читаются из счётчика один раз на открытый канал, флаги, время интегрирования и размер блока чтения памяти
+        берутся из дискового кэша (по заводскому номеру), если версия ПО не изменилась
+        """
+
+        result = self.meter_info.get(counter_identifier_)
+
+        if result is None and not self.global_error:
+            result = MeterInfo()
+
+            try:
+                # Прочитать версию ПО счетчика
+                r = self.send_frame(port_, counter_identifier_, b'\x08\x03')
+                result.firmware = r[1:-2].hex()  # Отсекаем номер счётчика и CRC
+
+                cache = load_json(self.meter_info_cache)
+                cached = cache.get(self.counter_factory_number)
+
+                if cached is not None and result.firmware != '' and cached['firmware'] == result.firmware and \
+                        'block_size' in cached:
+                    result.from_dict(cached)
+                else:
+                    # Прочитать установленные программируемые флаги из счетчика
+                    r = self.send_frame(port_, counter_identifier_, b'\x08\x09')
+                    result.flags = r[1:-2].hex()
+
+                    # Прочитать время интегрирования мощности массива профиля счетчика
+                    r = self.send_frame(port_, counter_identifier_, b'\x08\x06')
+                    if len(r) > 3:
+                        result.integration_time = r[1]
+
+                    # Размер блока чтения памяти зависит от версии ПО: берётся у счётчика с той же версией или пробой
+                    same = [c for c in cache.values()
+                            if c.get('firmware') == result.firmware and 'block_size' in c and result.firmware != '']
+
+                    probed = True  # Размер блока известен точно (можно сохранять в кэш)
+
+                    if same:
+                        result.block_size = same[0]['block_size']
+                    else:
+                        block_size = self.probe_block_size(port_, counter_identifier_)
+                        probed = block_size is not None
+
+                        if probed:
+                            result.block_size = block_size  # Иначе на этот раз - блоками по 82h, проба в следующий
+
+                    if result.firmware != '' and probed and not self.global_error:
+                        update_json(self.meter_info_cache, self.counter_factory_number, result.to_dict())
+
+                # Прочитать текущий указатель первого (или единственного) базового массива профиля мощности счетчика
+                r = self.send_frame(port_, counter_identifier_, b'\x08\x04')
+                if len(r) > 4:
+                    result.pointer = struct.unpack_from('>H', r, 1)[0]
+            except:
+                logger.error(f'Ошибка при чтении метаданных электросчётчика №: {counter_identifier_}')
+                self.global_error = True
+
+            if not self.global_error:
+                self.meter_info[counter_identifier_] = result
+
+        return result
+
+    @metrics.timed('pointer_search')
+    def read_power_profile_pointer_on_date(self, port_, counter_identifier_, date_):
+        """
+        Поиск указателя базового массива профиля мощности на заданную дату.
+        Сначала адрес берётся из индекса заголовков или расчётом от текущего указателя (read_indexed_pointer),
+        поиск в счётчике (до 10 сек.) - только если адрес не подтвердился
+        :date_: ddmmyy
+        :return: указатель (int) или None
+        """
+
+        result = None
+
+        if not self.global_error:
+            # Версия ПО, флаги, время интегрирования и текущий указатель (один раз на открытый канал)
+            self.read_meter_info(port_, counter_identifier_)
+
+            result = self.read_indexed_pointer(port_, counter_identifier_, date_)
+
+            if result is not None:
+                return result
+
+            metrics.inc('psch_pointer_lookups_total', (('port', self.port_name), ('source', 'search')))
+
+            #  Найти адрес заголовка на дату
+            self.send_frame(port_, counter_identifier_, b'\x03\x28\x00\xff\xff\xff' + str_to_hex(date_) + b'\xff\x1e', 4)
+
+            # Найти указатель базаового массива профиля мощности на начало искомой даты
+            dt_end = datetime.now() + timedelta(seconds=10)  # Время не больше которого должен идти поиск
+            p = 1
+            while p != 0:
+                r = self.send_frame(port_, counter_identifier_, b'\x08\x18\x00', 8)
+
+                if len(r) == 8:
+                    p = r[1] & 0x0F  # Состояние поиска (0 - поиск завершён)
+                    result = struct.unpack_from('>H', r, 4)[0]
+
+                if dt_end < datetime.now():
+                    logger.error(
+                        f'Ошибка при попытке найти указатель электросчётка №: {counter_identifier_} на дату: {make_true_date(date_)}')
+                    self.global_error = True
+                    break
+
+                if self.global_error:
+                    break
+
+        if self.global_error:
+            result = None
+
+        return result
+
+    def read_indexed_pointer(self, port_, counter_identifier_, date_):
+        """
+        Указатель на дату date_ (ddmmyy) без поиска в счётчике: адрес из индекса заголовков (ProfileCache)
+        или ожидаемый адрес от текущего указателя (0804) и времени интегрирования (0806).
+        Адрес подтверждается чтением 7 байт заголовка (0603)
+        :return: указатель или None (адрес не известен или не подтвердился)
+        """
+
+        candidates = []  # [(адрес, источник)]
+        indexed = None  # Сохранённый заголовок суток
+
+        if self.profile_cache is not None:
+            indexed = self.profile_cache.get_header(self.counter_factory_number, date_)
+
+            if indexed is not None:
+                candidates.append((indexed[0], 'index'))
+
+        info = self.meter_info.get(counter_identifier_)
+
+        if info is not None:
+            expected = expected_header_address(info.pointer, info.integration_time, date_, datetime.now())
+
+            if expected is not None and (indexed is None or expected != indexed[0]):
+                candidates.append((expected, 'computed'))
+
+        for address, source in candidates:
+            if self.global_error:
+                break
+
+            header = self.read_header(port_, counter_identifier_, address)
+
+            # Из индекса - заголовок должен совпасть целиком, расчётный - начинаться с часа 00 нужной даты
+            if source == 'index':
+                valid = header == indexed[1]
+            else:
+                valid = is_day_header(header, date_)
+
+            if valid:
+                metrics.inc('psch_pointer_lookups_total', (('port', self.port_name), ('source', source)))
+                return address
+
+        return None
+
+    def read_header(self, port_, counter_identifier_, pointer_):
+        """
+        7 байт из памяти № 03h c адреса pointer_ (заголовок записи профиля), b'' если не прочитаны
+        """
+
+        result = b''
+
+        if not self.global_error:
+            r = self.send_frame(port_, counter_identifier_, b'\x06\x03' + struct.pack('>H', pointer_) + b'\x07', 10)
+
+            if len(r) == 10:
+                result = r[1:8]
+
+        return result
+
+    def read_7bit_header(self, port_, counter_identifier_, date_, pointer_):
+        """
+        Прочитать 7 байт информации (заголовок профиля) из памяти № 03h c адреса "pointer"
+        """
+
+        result = False
+
+        if not self.global_error:
+            r = self.read_header(port_, counter_identifier_, pointer_)
+
+            part = b'\x00' + str_to_hex(date_) + b'\x01\x1e'
+
+            if r.find(part) == -1:
+                result = True
+
+        return result
+
+    def read_transformation_coefficient(self, port_, counter_identifier_):
+        """
+        Прочитать установленные коэффициенты трансформации счетчика
+        """
+
+        result = {
+            'kn': 0,  # Кн
+            'kt': 0,  # Кт
+            'dimensionality': 0,  # Признак размерности кВт ч
+            'whole_part': 0,  # Целая часть Кн*Кт/100000
+            'fractional_part': 0  # Дробная часть Кн*Кт/100
+        }
+
+        r = self.send_frame(port_, counter_identifier_, b'\x08\x02', 13)
+
+        if not self.global_error:
+            if len(r) == 13:
+                (result['kn'],
+                 result['kt'],
+                 result['dimensionality'],
+                 result['whole_part'],
+                 result['fractional_part']) = struct.unpack_from('>HHBBI', r, 1)
+
+        return result
+
+    def read_power_profile_line(self, port_, counter_identifier_, index_, pointer_, bytes_count_=PROFILE_BLOCK_LEN):
+        """
+        Прочитать первую или очередную строку с данными профиля мощности
+
+        index_ (int) не должен быть равным 0 (проблемы CRC). Только 1 -> 255
+        pointer_ (int) - адрес в памяти № 03h
+        bytes_count_ (int) - количество байт для считывания
+        result (memoryview) - данные без номера счётчика, индекса и CRC,
+            None - блок не прочитан (после всех повторов), global_error при этом не ставится
+        """
+
+        result = None
+
+        ma = 3  # № адреса памяти
+
+        frame = self.frames.memory_read(counter_identifier_, index_, ma, pointer_, bytes_count_)
+        # Ответ: адрес, индекс, данные, CRC
+        r = self.request(port_, frame, bytes_count_ + 4)
+
+        # Отсекаем номер счётчика и индекс, отсекаем CRC
+        if len(r) == bytes_count_ + 4 and r[1] == index_:
+            result = memoryview(r)[2:-2]
+        elif not self.global_error:
+            logger.error(f'Не прочитан блок памяти № 03h электросчётчика №: {counter_identifier_} '
+                         f'с адреса {pointer_:04X}')
+
+        return result
+
+    def probe_block_size(self, port_, counter_identifier_):
+        """
+        Наибольшее количество байт, которое счётчик отдаёт одним чтением памяти № 03h (0C).
+        Сначала пробуется FFh, если счётчик отказал - двоичный поиск между 82h (читает проприетарная утилита) и FFh.
+        Отказом считается только ответ счётчика с кодом ошибки (кадр с верным CRC), а не шум на линии.
+        result - размер блока или None, если проба не удалась (нет ответа или ответ с ошибкой CRC после повторов)
+        """
+
+        def accepts(count_):
+            """
+            True - блок прочитан, False - счётчик ответил кодом ошибки, None - ответа нет или он чужой
+            """
+
+            frame = self.frames.memory_read(counter_identifier_, 1, 3, 0, count_)
+            r = self.request(port_, frame, count_ + 4)  # Пустой ответ, если CRC так и не сошёлся
+
+            if len(r) < 4 or r[0] != counter_identifier_:
+                return None
+
+            if len(r) == count_ + 4 and r[1] == 1:  # Адрес, индекс запроса, данные, CRC
+                return True
+
+            if len(r) == 4 and r[1] & 0x0F != 0:  # Адрес, байт состояния (код ошибки), CRC
+                return False
+
+            return None
+
+        result = PROFILE_MAX_BLOCK_LEN
+        accepted = accepts(result)
+
+        if accepted is False:
+            low, high = PROFILE_BLOCK_LEN, PROFILE_MAX_BLOCK_LEN  # low - принимается, high - нет
+
+            while high - low > 1 and accepted is not None and not self.global_error:
+                middle = (low + high) // 2
+                accepted = accepts(middle)
+
+                if accepted:
+                    low = middle
+                elif accepted is False:
+                    high = middle
+
+            result = low
+
+        if accepted is None or self.global_error:
+            logger.error(f'Не удалось определить размер блока чтения памяти электросчётчика №: {counter_identifier_}')
+            result = None
+        else:
+            logger.info(f'Электросчётчик №: {counter_identifier_} читает память блоками до {result:02X}h байт')
+
+        return result
+
+    def profile_block_len(self, counter_identifier_, pointer_, left_):
+        """
+        Количество байт следующего чтения памяти № 03h с адреса pointer_: не больше блока, который принимает
+        счётчик, не больше left_ (сколько ещё нужно) и не через адрес FFFFh (следующее чтение - с адреса 0)
+        """
+
+        info = self.meter_info.get(counter_identifier_)
+        block = info.block_size if info is not None else PROFILE_BLOCK_LEN
+
+        return max(0, min(block, left_, PROFILE_MEMORY_SIZE - pointer_))
+
+    def read_power_profile_records(self, port_, counter_identifier_, pointer_, dates_, parser_, failed_):
+        """
+        Чтение памяти № 03h подряд с адреса pointer_ (заголовок первых суток dates_) блоками наибольшего размера.
+        Читается ровно столько байт, сколько занимают ожидаемые записи суток dates_ (expected_records),
+        но не дальше текущего указателя (0804) и одной записи за ним. Если сутки на этом не закончились
+        (лишние записи в памяти), чтение продолжается, пока в блоках есть записи суток dates_.
+
+        Генератор, отдаёт записи (ddmmyy, час, 16 байт данных) каждого блока (список, может быть пустым),
+        адреса и длины не прочитанных блоков добавляются в failed_
+        """
+
+        info = self.meter_info.get(counter_identifier_)
+        integration_time = info.integration_time if info is not None else 30
+        now = datetime.now()
+
+        limit = PROFILE_MEMORY_SIZE  # Байт до текущего указателя (за ним - старые данные)
+
+        if info is not None and info.pointer is not None:
+            limit = (info.pointer - pointer_) % PROFILE_MEMORY_SIZE + PROFILE_RECORD_LEN
+
+        needed = sum(expected_records(d, integration_time, now) for d in dates_) * PROFILE_RECORD_LEN
+        needed = min(needed, limit)
+
+        offset = 0  # Прочитано байт с начала
+        index = 0  # Индекс запроса (1 -> 255, не должен быть равен 0)
+        more = True  # В последнем блоке были записи суток dates_
+
+        while not self.global_error:
+            if offset < needed:
+                left = needed - offset
+            elif more:
+                left = limit - offset
+            else:
+                break
+
+            count = self.profile_block_len(counter_identifier_, pointer_, left)
+
+            if count == 0:
+                break
+
+            index = index % 255 + 1
+            line = self.read_power_profile_line(port_, counter_identifier_, index, pointer_, count)
+
+            if line is None:
+                # Блок перечитывается отдельно, незаконченная запись перед ним - вместе с ним
+                failed_.append((pointer_, count))
+                parser_.buffer.clear()
+                records = []
+            else:
+                records = parser_.feed(line, pointer_)
+                more = len(records) > 0
+
+            pointer_ = next_pointer(pointer_, count)
+            offset += count
+
+            yield records
+
+    def recover_power_profile_blocks(self, port_, counter_identifier_, failed_, dates_, lost_=None):
+        """
+        Повторное чтение не прочитанных блоков памяти № 03h.
+        Каждый блок перечитывается частями по 82h байт с захватом по одной записи до и после него,
+        чтобы восстановить и записи на границах блока (их начало или конец был в соседних прочитанных блоках).
+        failed_ - список (адрес, длина) не прочитанных блоков, блоки перечитываются один раз и удаляются из списка
+        lost_ - список, в который добавляются (адрес, длина) блоков, не прочитанных и повторно
+        result - список записей (ddmmyy, час, 16 байт данных пары получасовок)
+        """
+
+        result = []
+
+        while failed_ and not self.global_error:
+            pointer_, count = failed_.pop(0)
+
+            start = (pointer_ - PROFILE_RECORD_LEN) % PROFILE_MEMORY_SIZE
+            left = count + 2 * PROFILE_RECORD_LEN
+            parser = PowerProfileParser(dates_)
+
+            if lost_ is not None:
+                lost_.append((pointer_, count))
+
+            while left > 0 and not self.global_error:
+                # Короткими блоками: на зашумлённой линии длинный кадр чаще приходит с ошибкой
+                count = min(self.profile_block_len(counter_identifier_, start, left), PROFILE_BLOCK_LEN)
+                line = self.read_power_profile_line(port_, counter_identifier_, start % 255 + 1, start, count)
+
+                if line is None:
+                    break
+
+                result.extend(parser.feed(line))
+                start = next_pointer(start, count)
+                left -= count
+
+            if lost_ is not None and left <= 0:
+                lost_.pop()  # Блок восстановлен
+
+        return result
+
+    def read_cached_day(self, port_, counter_identifier_, date_, divide_, transform_, pointer_=None):
+        """
+        Суточный профиль date_ из дискового кэша (ProfileCache).
+        Если адрес суток pointer_ уже найден поиском, он сравнивается с сохранённым,
+        иначе заголовок суток перечитывается из счётчика и сравнивается с сохранённым.
+        :return: DayProfile или None (суток нет в кэше или память счётчика уже перезаписана)
+        """
+
+        result = None
+
+        if self.profile_cache is not None and not self.global_error:
+            cached = self.profile_cache.get(self.counter_factory_number, date_)
+
+            if cached is not None:
+                address, header, raw = cached
+
+                if pointer_ is not None:
+                    valid = pointer_ == address
+                else:
+                    valid = self.read_header(port_, counter_identifier_, address) == header
+
+                if valid:
+                    result = DayProfile(date_, divide_, transform_)
+                    result.raw[:] = raw
+                    result.received[:] = b'\x01' * 24
+
+        return result
+
+    def cache_day(self, day_, parser_):
+        """
+        Сохранение заголовка суток в индекс заголовков, а полностью прочитанных прошедших суток - в дисковый кэш
+        """
+
+        if self.profile_cache is not None and day_.date_param in parser_.headers:
+            address, header = parser_.headers[day_.date_param]
+            self.profile_cache.put_header(self.counter_factory_number, day_.date_param, address, header)
+
+            if all(day_.received) and day_.date_param != make_date_param(date.today()):
+                self.profile_cache.put(self.counter_factory_number, day_.date_param, address, header, day_.raw)
+
+    def cache_gaps(self, date_, day_):
+        """
+        Сохранение прошедших суток date_ (ddmmyy), которых в памяти счётчика нет целиком
+        (day_ - прочитанный DayProfile или None, если записей суток в памяти нет),
+        чтобы дозапись в БД не перечитывала их при каждом запуске
+        """
+
+        if self.profile_cache is not None and date_ != make_date_param(date.today()):
+            half_hours = 0 if day_ is None else 2 * sum(day_.received)
+
+            if half_hours < 48:
+                self.profile_cache.put_gaps(self.counter_factory_number, date_, half_hours)
+
+    def add_missing_half_hours(self, day_):
+        """
+        Учёт не прочитанных получасовок суток (кроме ещё не наступивших)
+        """
+
+        missing = day_.missing()
+
+        if missing:
+            date_param = make_true_date(day_.date_param)
+            self.missing_half_hours.extend((date_param, HALF_HOURS[i]) for i in missing)
+            logger.error(f'Профиль мощности за {date_param} прочитан не полностью, '
+                         f'нет получасовок: {", ".join(HALF_HOURS[i] for i in missing)}')
+
+    def prepare_power_profile_item(self, ppi1, ppi2, hhx, divide_, transform_):
+        """
+        Парсим данные
+        ppi1: элеиент (PowerProfileItem()) перваой получасовки часа
+        ppi2: элеиент (PowerProfileItem()) второй получасовки часа
+        hhx: 16 байт (8 слов, старшим байтом вперёд) данных пары получасовок
+        """
+
+        if not self.global_error:
+            try:
+                day = ppi1.day
+
+                if (ppi2.day is day and ppi1.index % 2 == 0 and ppi2.index == ppi1.index + 1
+                        and day.divide == divide_ and day.transform == transform_):
+                    # Обе получасовки часа из одних суток - кладём слова как есть, без пересчёта туда-обратно
+                    day.set_hour(ppi1.index // 2, hhx)
+                    return
+
+                v = struct.unpack('>8H', hhx)
+
+                ppi1.a_plus = round((v[0] / divide_) * transform_, 2)
+                ppi1.a_minus = round((v[1] / divide_) * transform_, 2)
+                ppi1.r_plus = round((v[2] / divide_) * transform_, 2)
+                ppi1.r_minus = round((v[3] / divide_) * transform_, 2)
+
+                ppi2.a_plus = round((v[4] / divide_) * transform_, 2)
+                ppi2.a_minus = round((v[5] / divide_) * transform_, 2)
+                ppi2.r_plus = round((v[6] / divide_) * transform_, 2)
+                ppi2.r_minus = round((v[7] / divide_) * transform_, 2)
+            except:
+                logger.error(f'Ошибка при парсинге получасовок часа')
+                self.global_error = True
+
+    @metrics.timed('read_day')
+    def read_power_profile(self, port_, counter_identifier_, pointer_, date_, divide_, transform_):
+        """
+        Прочитать все значения профиля мощности на дату date_
+        pointer -  значение из функции read_power_profile_pointer_on_date()
+        :date: ddmmyy
+        """
+
+        result = []
+
+        parser = PowerProfileParser([date_])
+        day = DayProfile(date_, divide_, transform_)
+        failed = []  # Адреса и длины не прочитанных блоков
+
+        cached = None  # Сутки из дискового кэша
+
+        if not self.global_error and pointer_ is not None:
+            cached = self.read_cached_day(port_, counter_identifier_, date_, divide_, transform_, pointer_)
+
+            if cached is not None:
+                logger.info(f'Профиль мощности за {make_true_date(date_)} взят из кэша')
+                result = cached.items()
+
+        if not self.global_error and pointer_ is not None and cached is None:
+            try:
+                #print(f'Чтение профиля мощности за {make_true_date(date_)}')
+                logger.info(f'Чтение профиля мощности за {make_true_date(date_)}')
+
+                # Читаем пары получасовок суток
+                # Данных пар не обязательно должно быть 24 (по две на час)
+                for records in self.read_power_profile_records(port_, counter_identifier_, pointer_, [date_],
+                                                               parser, failed):
+                    for record_date, hour, values in records:
+                        day.set_hour(hour, values)
+
+                    # Пришла 24-я (последняя) пара получасовок целиком
+                    if day.received[23]:
+                        break
+
+                for record_date, hour, values in self.recover_power_profile_blocks(port_,
+                                                                                   counter_identifier_,
+                                                                                   failed,
+                                                                                   [date_]):
+                    day.set_hour(hour, values)
+
+                # Результат всегда будет содержать 48 получасовок за сутки,
+                # не прочитанные получасовки (item.valid == False) перечислены в missing_half_hours
+                if any(day.received):
+                    self.add_missing_half_hours(day)
+                    self.cache_day(day, parser)
+                    result = day.items()
+            except:
+                logger.error(f'Ошибка при чтении профиля мощности за {make_true_date(date_)}')
+                self.global_error = True
+
+        return result
+
+    def iter_power_profile_range(self, port_, counter_identifier_, date_from_, date_to_, divide_, transform_):
+        """
+        Прочитать профиль мощности за диапазон дат (date_from_ .. date_to_ включительно) одним проходом.
+        Указатель ищется только для первых суток, дальше память № 03h читается подряд
+        (сутки лежат в памяти друг за другом), а поток данных делится на сутки на стороне клиента.
+
+        Генератор, отдаёт суточные профили (DayProfile) по мере готовности суток.
+        Сутки, которых нет в памяти счётчика, пропускаются
+        """
+
+        days = []  # Даты диапазона в формате ddmmyy
+
+        d = date_from_
+        while d <= date_to_:
+            days.append(make_date_param(d))
+            d += timedelta(days=1)
+
+        if self.global_error or len(days) == 0:
+            return
+
+        # Первые сутки диапазона, которые есть в дисковом кэше, счётчик не читаем (только их заголовки)
+        while len(days) > 0:
+            cached = self.read_cached_day(port_, counter_identifier_, days[0], divide_, transform_)
+
+            if cached is None:
+                break
+
+            yield cached
+            days.pop(0)
+
+        if self.global_error or len(days) == 0:
+            return
+
+        logger.info(f'Чтение профиля мощности за {make_true_date(days[0])} - {make_true_date(days[-1])}')
+
+        pointer_ = self.read_power_profile_pointer_on_date(port_, counter_identifier_, days[0])
+
+        if pointer_ is None:
+            return
+
+        parser = PowerProfileParser(days)
+        day_index = {d: i for i, d in enumerate(days)}  # ddmmyy -> индекс в days
+        day = 0  # Индекс текущих (ещё не отданных) суток в days
+        profiles = {}  # Ещё не отданные сутки, в которые уже пришли записи {индекс в days: DayProfile}
+        failed = []  # Адреса и длины не прочитанных блоков (перечитываются перед отдачей неполных суток)
+        lost = []  # Блоки, не прочитанные и повторно (после них пропуски суток могут быть пропусками связи)
+
+        def add_records(records_):
+            for record_date, hour, values in records_:
+                record_day = day_index[record_date]
+
+                if record_day >= day:  # Записи уже отданных суток пропускаются
+                    if record_day not in profiles:
+                        profiles[record_day] = DayProfile(record_date, divide_, transform_)
+
+                    profiles[record_day].set_hour(hour, values)
+
+        def complete_day():
+            # Текущие сутки с дочитанными (по возможности) пропусками, None - записей нет
+            if failed and (day not in profiles or not all(profiles[day].received)):
+                add_records(self.recover_power_profile_blocks(port_, counter_identifier_, failed, days, lost))
+
+            profile = profiles.pop(day, None)
+
+            if profile is not None:
+                self.add_missing_half_hours(profile)
+                self.cache_day(profile, parser)
+
+            # Все блоки прочитаны - чего нет, того нет и в памяти счётчика
+            if not lost and not self.global_error and not self.stopping():
+                self.cache_gaps(days[day], profile)
+
+            return profile
+
+        try:
+            for records in self.read_power_profile_records(port_, counter_identifier_, pointer_, days, parser, failed):
+                add_records(records)
+
+                # Отдаём сутки, после которых уже пошли записи следующих суток
+                # или пришла 24-я (последняя) пара получасовок
+                while day < len(days) and (any(d > day for d in profiles) or
+                                           (day in profiles and profiles[day].received[23])):
+                    profile = complete_day()
+                    day += 1
+
+                    if profile is not None:
+                        yield profile
+
+                if day == len(days) or self.global_error or self.stopping():
+                    break
+
+            # Последние сутки без 24-й пары получасовок
+            if day < len(days) and day in profiles:
+                profile = complete_day()
+                day += 1
+                yield profile
+        except GeneratorExit:
+            raise
+        except:
+            logger.error(f'Ошибка при чтении профиля мощности за {make_true_date(days[min(day, len(days) - 1)])}')
+            self.global_error = True
+
+        for d in days[day:]:
+            logger.error(f'Не удалось прочитать профиль мощности за {make_true_date(d)}')
+
+    @metrics.timed('read_range')
+    def read_power_profile_range(self, port_, counter_identifier_, date_from_, date_to_, divide_, transform_):
+        """
+        Прочитать все значения профиля мощности за диапазон дат одним проходом по памяти счётчика
+        """
+
+        result = []
+
+        for day in self.iter_power_profile_range(port_,
+                                                 counter_identifier_,
+                                                 date_from_,
+                                                 date_to_,
+                                                 divide_,
+                                                 transform_):
+            result.extend(day.items())
+
+        return result
+
+    def get_prevday_power_profile(self, port_, counter_identifier_, divide_, transform_):
+        """
+        Прочитать все значения профиля мощности на вчера
+        """
+
+        result = []
+
+        dtn = datetime.now()  # Текущий тайм стемп
+        ydtn = dtn - timedelta(days=1)  # Вчерашний таймстемп (нужна исключительно дата)
+
+        date_param = f'{str(ydtn)[8:10]}{str(ydtn)[5:7]}{str(ydtn)[2:4]}'  # Формат даты для посылки в электросчётчик
+
+        if not self.global_error:
+            pointer_ = self.read_power_profile_pointer_on_date(port_, counter_identifier_, date_param)
+
+            if pointer_ is not None and self.read_7bit_header(port_, counter_identifier_, date_param, pointer_):
+                self.read_transformation_coefficient(port_, counter_identifier_)
+
+                result = self.read_power_profile(port_, counter_identifier_, pointer_, date_param, divide_, transform_)
+
+        return result
+
+    def get_prevmonth_power_profile(self, port_, counter_identifier_, divide_, transform_):
+        """
+        Прочитать все значения профиля мощности за прошлый месяц
+        """
+
+        result = []  # Массив суточных массивов профилей мощности
+
+        # последний день предыдущего месяца
+        last_day_prev_month = date.today().replace(day=1) - timedelta(days=1)
+
+        # Первый день предыдущего месяца
+        first_day_prev_month = date.today().replace(day=1) - timedelta(days=last_day_prev_month.day)
+
+        self.prevmonth = f'{str(first_day_prev_month)[0:4]}_{str(first_day_prev_month)[5:7]}'
+
+        if not self.global_error:
+            result = self.read_power_profile_range(port_,
+                                                   counter_identifier_,
+                                                   first_day_prev_month,
+                                                   last_day_prev_month,
+                                                   divide_,
+                                                   transform_)
+
+            self.close_channel(port_, counter_identifier_)
+
+        return result
+
+    def print_power_profile(self, power_profile_items_):
+        """
+        Вывод в консоль значений профиля мощности
+        """
+
+        for item in power_profile_items_:
+            print(f'{item.date_time} |'
+                  f'{item.date_param} '
+                  f'{item.time_param} | '
+                  f'{item.a_plus} | '
+                  f'{item.a_minus} | '
+                  f'{item.r_plus} | '
+                  f'{item.r_minus} |')
+
+    def print_power_profile_stats(self, power_profile_items_):
+        """
+        Вывод в консоль сумм, максимумов и средних профиля мощности по суткам и месяцам
+        """
+
+        days = list({id(item.day): item.day for item in power_profile_items_}.values())
+
+        stats = profile_stats(days)
+
+        for period in ('days', 'months'):
+            for key, channels in stats[period].items():
+                print(f'{key} | ' + ' | '.join(f"{name}: {v['sum']} / {v['max']} / {v['avg']}"
+                                               for name, v in channels.items()))
+
+    def power_profile_to_xlsx(self, power_profile_items_, template_xlsx_, result_xlsx_):
+        """
+        Сохранение профиля мощности в эсель файл result_xlsx_, по шаблону template_xlsx_
+        """
+
+        self.power_profile_to_xlsx_sheets([('Профили нагрузки', power_profile_items_)], template_xlsx_, result_xlsx_)
+
+    @metrics.timed('xlsx')
+    def power_profile_to_xlsx_sheets(self, sheets_, template_xlsx_, result_xlsx_):
+        """
+        Сохранение нескольких профилей мощности (счётчики, месяцы) в одну книгу result_xlsx_ по шаблону template_xlsx_,
+        каждый профиль - свой лист. sheets_ - [(название листа, PowerProfileItem-ы)], элементы можно отдавать
+        генератором (например из iter_power_profile_range) - строки пишутся в файл по мере получения
+        """
+
+        from psch.export import XlsxProfileWriter
+
+        writer = None
+
+        if not self.global_error:
+            try:
+                writer = XlsxProfileWriter(template_xlsx_, result_xlsx_)
+            except ValueError as e:  # Шаблон не подходит
+                logger.error(str(e))
+                self.global_error = True
+            except:
+                logger.error(f'Ошибка при попытке открыть шаблон {template_xlsx_}')
+                self.global_error = True
+
+        if not self.global_error:
+            try:
+                for title, items in sheets_:
+                    writer.add_sheet(title, items)
+            except:
+                logger.error(f'Ошибка при добавлении данных в шаблон {template_xlsx_}')
+                self.global_error = True
+
+        if writer is not None:
+            try:
+                writer.close()
+
+                if not self.global_error:
+                    logger.info(f'Успешное сохранение профиля нагрузки в файл {result_xlsx_}')
+            except:
+                logger.error(f'Ошибка при сохранении файла {result_xlsx_}')
+                self.global_error = True
+
+    @metrics.timed('export')
+    def power_profile_to_files(self, port_, counter_identifier_, date_from_, date_to_, divide_, transform_):
+        """
+        Выгрузка профиля мощности за диапазон дат в файлы форматов export_formats (CSV, Parquet, Arrow)
+        по счётчику и месяцу (см. ProfileExporter). Сутки пишутся по мере чтения из счётчика
+        """
+
+        from psch.export import (EXPORT_FORMATS, ArrowProfileExporter, CsvProfileExporter,
+                                 arrow_available)
+
+        exporters = []
+
+        for format_ in [f.strip() for f in self.export_formats.split(',') if f.strip()]:
+            if format_ not in EXPORT_FORMATS:
+                logger.error(f'Неизвестный формат выгрузки профиля мощности: {format_}')
+            elif format_ == 'csv':
+                exporters.append(CsvProfileExporter(self.export_dir, self.counter_factory_number))
+            elif not arrow_available():
+                logger.error(f'Для выгрузки профиля мощности в {format_} нужны пакеты pyarrow и numpy')
+            else:
+                exporters.append(ArrowProfileExporter(self.export_dir, self.counter_factory_number, format_))
+
+        if self.global_error or len(exporters) == 0:
+            return
+
+        for day in self.iter_power_profile_range(port_, counter_identifier_, date_from_, date_to_, divide_, transform_):
+            for exporter in exporters:
+                self.submit(exporter.add_day, day)
+
+        for exporter in exporters:
+            self.submit(exporter.close)
+
+    def mysql_connect(self):
+        """
+        Подключение к БД. Открывается один раз и используется всеми записями до mysql_close().
+        Не зависит от ошибок обмена со счётчиком (global_error): при записи через ResultSink
+        уже прочитанные сутки пишутся, даже если чтение следующих закончилось ошибкой
+        """
+
+        if self.db is None:
+            try:
+                import pymysql
+
+                self.db = pymysql.connect(
+                    host=self.mysql_host,
+                    db=self.mysql_db,
+                    user=self.mysql_user,
+                    password=self.mysql_password,
+                    cursorclass=pymysql.cursors.DictCursor)
+
+                logger.info(f'Успешное подключение к БД {self.mysql_host}.{self.mysql_db}')
+            except:
+                logger.error(f'Ошибка при подключении к БД {self.mysql_host}.{self.mysql_db}')
+
+            if self.db is not None:
+                self.mysql_unique_key = mysql_has_unique_key(self.db)
+
+                if not self.mysql_unique_key:
+                    logger.info('В loadprofiles нет уникального ключа (counterID, dt), запись идёт медленным запросом '
+                                'с проверкой NOT EXISTS. Ключ добавляется разово: python -m psch -mysql-migrate')
+
+        return self.db
+
+    def mysql_close(self):
+        """
+        Закрытие подключения к БД
+        """
+
+        if self.db is not None:
+            try:
+                self.db.close()
+            except:
+                pass
+
+            self.db = None
+
+    def read_mysql_counter_id(self, db_):
+        """
+        counterID электросчётчика в БД (по заводскому номеру), читается один раз
+        """
+
+        if self.mysql_counter_id is None:
+            query = "select counterID from counters where serialNumber = %s"
+            mysql_result = mysql_execute(db_, query, False, 'one', (self.counter_factory_number,))
+
+            if mysql_result != None:
+                self.mysql_counter_id = mysql_result['counterID']
+
+        return self.mysql_counter_id
+
+    @metrics.timed('mysql_write')
+    def power_profile_to_mysql(self, power_profile_items_):
+        """
+        Запись профиля мощности в БД пачками по MYSQL_BATCH_SIZE строк, каждая пачка - одна транзакция.
+        Повторная запись тех же получасовок не создаёт дублей.
+        Получасовки, которых не было в памяти счётчика, не пишутся (будут дочитаны при следующем запуске)
+        """
+
+        db = self.mysql_connect()
+
+        if db != None:
+            counter_id = self.read_mysql_counter_id(db)
+
+            if counter_id != None:
+                if self.mysql_unique_key:
+                    query = MYSQL_UPSERT_LOADPROFILE
+                    rows = [(counter_id, item.date_time, item.a_plus, item.r_plus)
+                            for item in power_profile_items_ if item.valid]
+                else:
+                    query = MYSQL_INSERT_LOADPROFILE
+                    rows = [(counter_id, item.date_time, item.a_plus, item.r_plus, counter_id, item.date_time)
+                            for item in power_profile_items_ if item.valid]
+
+                for i in range(0, len(rows), MYSQL_BATCH_SIZE):
+                    mysql_execute_many(db, query, rows[i:i + MYSQL_BATCH_SIZE])
+
+    @metrics.timed('mysql_sync')
+    def power_profile_to_mysql_by_days(self, port_, counter_identifier_, divide_, transform_, days_count_):
+        """
+        Записывает в БД профиль мощности за указанное количество дней
+        """
+
+        dtn = date.today()
+
+        # Вчера и days_count_ суток до него
+        for day in self.iter_power_profile_range(port_,
+                                                 counter_identifier_,
+                                                 dtn - timedelta(days=days_count_ + 1),
+                                                 dtn - timedelta(days=1),
+                                                 divide_,
+                                                 transform_):
+            self.submit(self.power_profile_to_mysql, day.items())
+
+        self.submit(self.mysql_close)
+
+    def read_mysql_complete_days(self, db_, date_from_):
+        """
+        Даты (начиная с date_from_), за которые в БД уже лежат все 48 получасовок электросчётчика
+        или все получасовки, которые есть в памяти счётчика (сутки с пропусками из ProfileCache.get_gaps)
+        """
+
+        result = set()
+
+        counter_id = self.read_mysql_counter_id(db_)
+
+        gaps = {}  # {дата: получасовок в памяти счётчика}
+
+        if self.profile_cache is not None:
+            for date_param, half_hours in self.profile_cache.get_gaps(self.counter_factory_number).items():
+                gaps[datetime.strptime(date_param, '%d%m%y').date()] = half_hours
+
+        if counter_id != None:
+            # Суток нет в памяти счётчика совсем - в БД писать нечего
+            result.update(d for d, half_hours in gaps.items() if half_hours == 0 and d >= date_from_)
+
+            query = "select date(dt) as d, count(*) as c, max(dt) as last_dt from loadprofiles " \
+                    "where counterID = %s and dt > %s group by date(dt)"
+            res = mysql_execute(db_, query, False, 'all', (counter_id, datetime.combine(date_from_, datetime.min.time())))
+
+            if res != None:
+                last_dt = None  # Последняя записанная получасовка
+
+                for item in res:
+                    if item['c'] >= min(48, gaps.get(item['d'], 48)):
+                        result.add(item['d'])
+
+                    if last_dt is None or item['last_dt'] > last_dt:
+                        last_dt = item['last_dt']
+
+                logger.info(f'Электросчётчик {self.counter_factory_number}: последняя получасовка в БД {last_dt}, '
+                            f'полных суток {len(result)}')
+
+        return result
+
+    @metrics.timed('mysql_sync')
+    def power_profile_to_mysql_incremental(self, port_, counter_identifier_, divide_, transform_, max_lookback_days_):
+        """
+        Дозапись в БД профиля мощности: из счётчика читаются только сутки (не старше max_lookback_days_),
+        которых в БД нет или которые записаны не полностью.
+        Сутки с пропусками в памяти самого счётчика (записаны в ProfileCache при чтении) считаются полными,
+        когда в БД есть все их получасовки
+        """
+
+        if self.global_error:
+            return
+
+        db = self.mysql_connect()
+
+        if db is None or self.read_mysql_counter_id(db) is None:
+            logger.error(f'Электросчётчик {self.counter_factory_number} не найден в БД')
+            return
+
+        dtn = date.today()
+        date_from = dtn - timedelta(days=max_lookback_days_)
+
+        complete = self.read_mysql_complete_days(db, date_from)
+
+        # Диапазоны недостающих суток [(первые сутки, последние сутки)], вчера - самые свежие
+        ranges = []
+
+        d = date_from
+        while d < dtn:
+            if d not in complete:
+                # Между диапазонами не больше одних полных суток - дешевле дочитать их подряд, чем снова искать указатель
+                if len(ranges) > 0 and (d - ranges[-1][1]).days <= 2:
+                    ranges[-1] = (ranges[-1][0], d)
+                else:
+                    ranges.append((d, d))
+
+            d += timedelta(days=1)
+
+        if len(ranges) == 0:
+            logger.info(f'Профиль мощности электросчётчика {self.counter_factory_number} в БД актуален')
+
+        for date_from_range, date_to_range in ranges:
+            for day in self.iter_power_profile_range(port_,
+                                                     counter_identifier_,
+                                                     date_from_range,
+                                                     date_to_range,
+                                                     divide_,
+                                                     transform_):
+                self.submit(self.power_profile_to_mysql, day.items())
+
+        self.submit(self.mysql_close)
+
+    @metrics.timed('report')
+    def create_report(self):
+        """
+        HTML-отчёты по профилю мощности из БД (графики Google Charts) в папку report_dir/<заводской номер>:
+        report_all.html, report_all_e.html - за весь период, report_month.html, report_month_e.html - за текущий месяц.
+
+        Строки читаются из БД один раз потоково (курсор на стороне сервера) и сразу пишутся во все четыре файла
+        """
+
+        last_day_prev_month = date.today().replace(day=1) - timedelta(days=1)  # последний день предыдущего месяца
+        month_start = datetime.combine(last_day_prev_month + timedelta(days=1), datetime.min.time())
+
+        if self.global_error:
+            return
+
+        opened = self.db is None  # Подключение открыто для отчёта (закрыть в конце)
+        db = self.mysql_connect()
+
+        if db is None:
+            return
+
+        counter_id = self.read_mysql_counter_id(db)
+
+        if counter_id is not None:
+            from psch.reports import write_reports
+
+            cursor = None
+            report_dir = f'{self.report_dir}/{self.counter_factory_number}'  # У каждого счётчика линии свои отчёты
+
+            try:
+                import pymysql
+
+                cursor = db.cursor(pymysql.cursors.SSCursor)
+                cursor.execute("select dt, activePowerConsumed from loadprofiles where counterID = %s order by dt",
+                               (counter_id,))
+
+                write_reports(cursor, report_dir, self.report_title, self.counter_transform, self.counter_top,
+                              month_start)
+
+                logger.info(f'Отчёты электросчётчика {self.counter_factory_number} сохранены в {report_dir}')
+            except:
+                logger.error(f'Ошибка при выгрузке отчётов в {report_dir}')
+                self.global_error = True
+            finally:
+                if cursor is not None:
+                    try:
+                        cursor.close()
+                    except:
+                        pass
+
+        if opened:
+            self.mysql_close()
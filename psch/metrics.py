@@ -0,0 +1,359 @@
+"""
+Метрики опроса электросчётчиков и этапов обработки.
+
+Обмены с счётчиками (PSCH.exchange) учитываются по линии и коду запроса:
+время ответа (гистограмма), байты туда/обратно, ошибки CRC, таймауты, повторы.
+Этапы (поиск указателя, чтение, запись в БД, xlsx, отчёты) - гистограммой длительности.
+
+Выгрузка:
+    Metrics.to_prometheus() / write_prometheus() - текстовый формат Prometheus (для node_exporter textfile),
+    Metrics.serve_http() - локальный http-адрес /metrics на время работы скрипта,
+    Metrics.summary() / write_json() - сводка прогона в JSON
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+
+logger = logging.getLogger('psch2.py')
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Границы гистограммы времени ответа
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)  # Границы гистограммы длительности этапов
+
+# Описания метрик для Prometheus {имя: (тип, описание)}
+METRICS_HELP = {
+    'psch_request_duration_seconds': ('histogram', 'Время обмена запрос-ответ со счётчиком'),
+    'psch_requests_total': ('counter', 'Запросов к счётчикам'),
+    'psch_bytes_sent_total': ('counter', 'Отправлено байт'),
+    'psch_bytes_received_total': ('counter', 'Принято байт'),
+    'psch_crc_errors_total': ('counter', 'Ответов с неверным CRC'),
+    'psch_timeouts_total': ('counter', 'Запросов без ответа (таймаут)'),
+    'psch_retries_total': ('counter', 'Повторов запросов'),
+    'psch_stage_duration_seconds': ('histogram', 'Длительность этапа обработки'),
+    'psch_pointer_lookups_total': ('counter', 'Указателей на дату: из индекса заголовков, расчётом, поиском в счётчике'),
+}
+
+
+def opcode_name(payload_):
+    """
+    Код запроса для метрик: первый байт, для запросов чтения параметров (08), поиска (03)
+    и памяти (06) - вместе со вторым байтом (0804, 0328, 0603 ...)
+    """
+
+    if len(payload_) == 0:
+        return ''
+
+    if payload_[0] in (0x03, 0x06, 0x08) and len(payload_) > 1:
+        return bytes(payload_[:2]).hex().upper()
+
+    return bytes(payload_[:1]).hex().upper()
+
+
+class Histogram:
+    """
+    Гистограмма с накопительными корзинами (как в Prometheus) и min/max для сводки
+    """
+    def __init__(self, buckets_):
+        self.buckets = buckets_  # Верхние границы корзин
+        self.counts = [0] * (len(buckets_) + 1)  # Попадания в корзины (последняя - +Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value_):
+        i = 0
+
+        while i < len(self.buckets) and value_ > self.buckets[i]:
+            i += 1
+
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value_
+        self.min = value_ if self.min is None else min(self.min, value_)
+        self.max = value_ if self.max is None else max(self.max, value_)
+
+    def quantile(self, q_):
+        """
+        Оценка квантиля по корзинам (верхняя граница корзины)
+        """
+
+        if self.count == 0:
+            return None
+
+        rank = q_ * self.count
+        total = 0
+
+        for i, c in enumerate(self.counts):
+            total += c
+
+            if total >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+def escape_label_value(value_):
+    """
+    Значение метки для текстового формата Prometheus: обратная косая черта, кавычка и перевод строки экранируются
+    """
+
+    return str(value_).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels_):
+    return ','.join(f'{k}="{escape_label_value(v)}"' for k, v in labels_)
+
+
+class Metrics:
+    """
+    Набор метрик прогона (общий для всех потоков опроса)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # {(имя, метки): значение}
+        self.histograms = {}  # {(имя, метки): Histogram}
+        self.started = datetime.now()  # Начало прогона
+        self.http_server = None
+
+    def inc(self, name_, labels_, value_=1):
+        """
+        Увеличить счётчик name_ с метками labels_ (кортеж пар (метка, значение))
+        """
+
+        with self.lock:
+            key = (name_, labels_)
+            self.counters[key] = self.counters.get(key, 0) + value_
+
+    def observe(self, name_, labels_, value_, buckets_=LATENCY_BUCKETS):
+        """
+        Добавить значение в гистограмму name_
+        """
+
+        with self.lock:
+            key = (name_, labels_)
+            h = self.histograms.get(key)
+
+            if h is None:
+                h = Histogram(buckets_)
+                self.histograms[key] = h
+
+            h.observe(value_)
+
+    def observe_exchange(self, port_, opcode_, seconds_, sent_, received_, crc_error_, timeout_):
+        """
+        Учёт одного обмена запрос-ответ
+        """
+
+        labels = (('port', port_), ('opcode', opcode_))
+
+        self.observe('psch_request_duration_seconds', labels, seconds_)
+        self.inc('psch_requests_total', labels)
+        self.inc('psch_bytes_sent_total', labels, sent_)
+        self.inc('psch_bytes_received_total', labels, received_)
+
+        if crc_error_:
+            self.inc('psch_crc_errors_total', labels)
+
+        if timeout_:
+            self.inc('psch_timeouts_total', labels)
+
+    def retry(self, port_, opcode_):
+        """
+        Учёт повтора запроса
+        """
+
+        self.inc('psch_retries_total', (('port', port_), ('opcode', opcode_)))
+
+    @contextlib.contextmanager
+    def stage(self, name_):
+        """
+        Замер длительности этапа: with metrics.stage('xlsx'): ...
+        """
+
+        start = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.observe('psch_stage_duration_seconds', (('stage', name_),), time.monotonic() - start, STAGE_BUCKETS)
+
+    def timed(self, name_):
+        """
+        Декоратор замера длительности этапа (метода)
+        """
+
+        def decorator(func_):
+            @functools.wraps(func_)
+            def wrapper(*args_, **kwargs_):
+                with self.stage(name_):
+                    return func_(*args_, **kwargs_)
+
+            return wrapper
+
+        return decorator
+
+    def to_prometheus(self):
+        """
+        Метрики в текстовом формате Prometheus
+        """
+
+        lines = []
+
+        with self.lock:
+            for name, (kind, help_) in METRICS_HELP.items():
+                counters = [(labels, v) for (n, labels), v in self.counters.items() if n == name]
+                histograms = [(labels, h) for (n, labels), h in self.histograms.items() if n == name]
+
+                if not counters and not histograms:
+                    continue
+
+                lines.append(f'# HELP {name} {help_}')
+                lines.append(f'# TYPE {name} {kind}')
+
+                for labels, value in sorted(counters):
+                    lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+
+                for labels, h in sorted(histograms, key=lambda x_: x_[0]):
+                    total = 0
+
+                    for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+                        total += count
+                        le = format_labels(labels + (('le', bound),))
+                        lines.append(f'{name}_bucket{{{le}}} {total}')
+
+                    lines.append(f'{name}_sum{{{format_labels(labels)}}} {h.sum}')
+                    lines.append(f'{name}_count{{{format_labels(labels)}}} {h.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_name_):
+        """
+        Запись метрик в файл (для textfile collector node_exporter). Файл заменяется целиком
+        """
+
+        try:
+            with open(file_name_ + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+
+            os.replace(file_name_ + '.tmp', file_name_)
+        except:
+            logger.error(f'Ошибка при записи метрик в файл {file_name_}')
+
+    def summary(self):
+        """
+        Сводка прогона: обмены по линиям и кодам запросов, этапы
+        """
+
+        requests = {}
+        stages = {}
+        lookups = {}
+
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                if name == 'psch_pointer_lookups_total':
+                    source = dict(labels)['source']
+                    lookups[source] = lookups.get(source, 0) + value
+
+            for (name, labels), h in self.histograms.items():
+                d = dict(labels)
+
+                if name == 'psch_request_duration_seconds':
+                    item = h.to_dict()
+
+                    for counter, key in (('psch_bytes_sent_total', 'bytes_sent'),
+                                         ('psch_bytes_received_total', 'bytes_received'),
+                                         ('psch_crc_errors_total', 'crc_errors'),
+                                         ('psch_timeouts_total', 'timeouts'),
+                                         ('psch_retries_total', 'retries')):
+                        item[key] = self.counters.get((counter, labels), 0)
+
+                    requests.setdefault(d['port'], {})[d['opcode']] = item
+                elif name == 'psch_stage_duration_seconds':
+                    stages[d['stage']] = h.to_dict()
+
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'duration': round((datetime.now() - self.started).total_seconds(), 3),
+            'requests': requests,
+            'stages': stages,
+            'pointer_lookups': lookups,
+        }
+
+    def write_json(self, file_name_):
+        """
+        Запись сводки прогона в JSON
+        """
+
+        try:
+            with open(file_name_, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        except:
+            logger.error(f'Ошибка при записи сводки метрик в файл {file_name_}')
+
+    def serve_http(self, port_, host_='127.0.0.1'):
+        """
+        Локальный http-сервер метрик (GET /metrics - Prometheus, GET /summary - JSON) в отдельном потоке
+        """
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/summary':
+                    body = json.dumps(metrics.summary(), ensure_ascii=False).encode()
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.http_server = ThreadingHTTPServer((host_, port_), Handler)
+            threading.Thread(target=self.http_server.serve_forever, name='Metrics', daemon=True).start()
+            logger.info(f'Метрики доступны по адресу http://{host_}:{self.http_server.server_address[1]}/metrics')
+        except:
+            logger.error(f'Ошибка при запуске http-сервера метрик на порту {port_}')
+            self.http_server = None
+
+        return self.http_server
+
+    def close(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+
+metrics = Metrics()  # Метрики текущего прогона
@@ -0,0 +1,503 @@
+"""
+Профиль мощности: суточные профили (DayProfile), получасовки (PowerProfileItem),
+разбор записей памяти № 03h (PowerProfileParser), суммы/максимумы/средние по каналам
+"""
+
+import functools
+import struct
+from datetime import date, datetime
+
+from psch.protocol import make_date_param, make_true_date, make_true_date_time
+
+
+def import_numpy():
+    """
+    NumPy, если установлен, иначе None. Импортируется при первом расчёте, а не при запуске
+    """
+
+    try:
+        import numpy
+    except ImportError:  # Без NumPy работает обычный (медленный) вариант расчётов
+        numpy = None
+
+    return numpy
+
+
+def half_hour_time():
+    """
+    :return: Возвращает список получасовых промежутков (00:00 - 00:30, 00:30 - 01:00 ... 23:30 - 23:59)
+    """
+
+    def add_zero(s_):
+        result_ = s_
+        if len(result_) == 1:
+            result_ = '0' + result_
+
+        return result_
+
+    result = list()
+
+    items_list = [i for i in range(0, 48)]
+
+    l1 = 0
+    l_fl = True
+    l2 = 0
+
+    r1 = 0
+    r_fl = True
+    r2 = 30
+    for i in range(len(items_list)):
+        l1s = add_zero(str(l1))
+        l2s = add_zero(str(l2))
+        r1s = add_zero(str(r1))
+        r2s = add_zero(str(r2))
+
+        if i == 47:
+            r1s = '23'
+            r2s = '59'
+
+        s = l1s + ':' + l2s + '-' + r1s + ':' + r2s
+        result.append(s)
+
+        if r_fl:
+            r1 += 1
+            r2 = 0
+            r_fl = False
+        else:
+            r2 = 30
+            r_fl = True
+
+        if l_fl:
+            l1 = r1 - 1
+            l2 = 30
+            l_fl = False
+        else:
+            l1 = r1
+            l2 = 0
+            l_fl = True
+
+    return result
+
+
+HALF_HOURS = half_hour_time()  # Получасовки суток (00:00-00:30 ... 23:30-23:59)
+PROFILE_CHANNELS = 4  # Значений в получасовке: A+, A-, R+, R-
+PROFILE_DAY_WORDS = 48 * PROFILE_CHANNELS  # Слов в суточном профиле
+PROFILE_CHANNEL_NAMES = ('a_plus', 'a_minus', 'r_plus', 'r_minus')  # Каналы получасовки
+
+
+class DayProfile:
+    """
+    Суточный профиль мощности в компактном виде.
+
+    Сырые значения (импульсы) 48 получасовок по 4 канала (A+, A-, R+, R-) хранятся одним массивом
+    слов старшим байтом вперёд - ровно так, как они лежат в памяти счётчика.
+    Значения в кВт/квар (с учётом counter_divide и counter_transform) считаются при первом обращении
+    """
+    __slots__ = ('date_param', 'raw', 'received', 'divide', 'transform', 'scaled', 'date_times')
+
+    def __init__(self, date_, divide_=1, transform_=1):
+        self.date_param = date_  # Дата снятия (ддммгг)
+        self.raw = bytearray(PROFILE_DAY_WORDS * 2)  # Сырые значения 48 x 4 слов
+        self.received = bytearray(24)  # Признаки полученных из счётчика пар получасовок по часам
+        self.divide = divide_  # Постоянная электросчётчика
+        self.transform = transform_  # Коэффициент трансформации
+        self.scaled = None  # Посчитанные значения в кВт/квар
+        self.date_times = None  # Посчитанные даты-времена получасовок
+
+    def set_hour(self, hour_, data_):
+        """
+        Записать 16 байт данных пары получасовок часа hour_
+        """
+
+        pos = hour_ * PROFILE_CHANNELS * 4
+        self.raw[pos:pos + PROFILE_CHANNELS * 4] = data_
+        self.received[hour_] = 1
+        self.scaled = None
+
+    def values(self):
+        """
+        Значения в кВт/квар: список 48 x 4 (A+, A-, R+, R- каждой получасовки подряд)
+        """
+
+        if self.scaled is None:
+            divide_ = self.divide
+            transform_ = self.transform
+            self.scaled = [round((v / divide_) * transform_, 2)
+                           for v in struct.unpack(f'>{PROFILE_DAY_WORDS}H', self.raw)]
+
+        return self.scaled
+
+    def set_value(self, position_, value_):
+        """
+        Записать значение в кВт/квар value_ в слово position_ (получасовка * 4 + канал) сырых значений.
+        Слово подбирается так, чтобы values() вернул ровно value_, иначе ValueError
+        """
+
+        word = round(value_ / self.transform * self.divide)
+
+        if not 0 <= word <= 0xFFFF or round((word / self.divide) * self.transform, 2) != value_:
+            raise ValueError(f'Значение {value_} нельзя записать словом счётчика '
+                             f'(постоянная {self.divide}, коэффициент трансформации {self.transform})')
+
+        struct.pack_into('>H', self.raw, position_ * 2, word)
+
+        if self.scaled is not None:
+            self.scaled[position_] = value_
+
+    def date_time(self, index_):
+        """
+        Дата время получасовки index_ для построения графика (время из второй части получасовки)
+        """
+
+        if self.date_times is None:
+            self.date_times = [make_true_date_time(self.date_param, t) for t in HALF_HOURS]
+
+        return self.date_times[index_]
+
+    def items(self):
+        """
+        Список из 48 PowerProfileItem (представлений получасовок этих суток)
+        """
+
+        return [PowerProfileItem(self, i) for i in range(48)]
+
+    def missing(self):
+        """
+        Номера не полученных получасовок (0 -> 47). Для текущих суток - только уже прошедших часов
+        """
+
+        hours = 24
+
+        if self.date_param == make_date_param(date.today()):
+            hours = datetime.now().hour
+
+        return [h * 2 + k for h in range(hours) if not self.received[h] for k in range(2)]
+
+
+def profile_value_property(channel_):
+    """
+    Свойство PowerProfileItem для значения канала channel_ (0 - A+, 1 - A-, 2 - R+, 3 - R-).
+    Запись идёт в сырые значения суток (слово счётчика), поэтому не теряется при пересчёте;
+    значение, которое нельзя получить из слова при постоянной и коэффициенте суток, не принимается (ValueError)
+    """
+
+    def getter(self):
+        return self.day.values()[self.index * PROFILE_CHANNELS + channel_]
+
+    def setter(self, value_):
+        self.day.set_value(self.index * PROFILE_CHANNELS + channel_, value_)
+
+    return property(getter, setter)
+
+
+def profile_field_property(name_, doc_, default_):
+    """
+    Свойство PowerProfileItem name_, которое по умолчанию берётся из суток (default_(item)),
+    а после присваивания хранится в самой получасовке (как у прежних атрибутов)
+    """
+
+    def getter(self):
+        if self.fields is not None and name_ in self.fields:
+            return self.fields[name_]
+
+        return default_(self)
+
+    def setter(self, value_):
+        if self.fields is None:
+            self.fields = {}
+
+        self.fields[name_] = value_
+
+    return property(getter, setter, doc=doc_)
+
+
+class PowerProfileItem:
+    """
+    Элемент профиля мощности (одна получасовка DayProfile)
+    """
+    __slots__ = ('day', 'index', 'fields')
+
+    def __init__(self, day_=None, index_=0):
+        if day_ is None:
+            day_ = DayProfile('')
+
+        self.day = day_  # Суточный профиль
+        self.index = index_  # Номер получасовки в сутках (0 -> 47)
+        self.fields = None  # Присвоенные дата/время {имя: значение} (по умолчанию берутся из суток)
+
+    a_plus = profile_value_property(0)  # A+ кВт
+    a_minus = profile_value_property(1)  # A- кВт
+    r_plus = profile_value_property(2)  # R+ квар
+    r_minus = profile_value_property(3)  # R- квар
+
+    @property
+    def valid(self):
+        """
+        Получасовка получена из счётчика (иначе значения нулевые)
+        """
+
+        return self.day.received[self.index // 2] == 1
+
+    date_param = profile_field_property('date_param', 'Дата снятия (гггг-мм-дд)',
+                                        lambda self: make_true_date(self.day.date_param))
+    time_param = profile_field_property('time_param', 'Временной промежуток снятия (21:00-21:30 ...)',
+                                        lambda self: HALF_HOURS[self.index])
+    date_time = profile_field_property('date_time', 'Дата время для построения графика (время из второй части)',
+                                       lambda self: self.day.date_time(self.index))
+
+
+PROFILE_BLOCK_LEN = 0x82  # Количество байт для считывания из памяти № 03h за раз (82 в проприетарной утилите)
+PROFILE_MAX_BLOCK_LEN = 0xFF  # Наибольшее количество байт одного чтения (поле длины в запросе - 1 байт)
+PROFILE_RECORD_LEN = 24  # Длина записи пары получасовок в памяти № 03h (заголовок 8 байт + данные 16 байт)
+BCD_HOURS = {int(f'{h:02d}', 16): h for h in range(24)}  # Час в BCD -> час
+PROFILE_MEMORY_SIZE = 0x10000  # Размер памяти № 03h (кольцевой буфер)
+
+
+def is_day_header(header_, date_):
+    """
+    Заголовок header_ (байты из памяти № 03h) - запись часа 00 суток date_ (ddmmyy)
+    """
+
+    return len(header_) >= 4 and header_[0] == 0 and bytes(header_[1:4]) == bytes.fromhex(date_)
+
+
+def expected_records(date_, integration_time_, now_):
+    """
+    Сколько записей суток date_ (ddmmyy) должно быть в памяти № 03h к моменту now_:
+    запись пишется по окончании каждых двух интервалов интегрирования (для 30 мин - 24 записи в сутки),
+    для текущих суток - только уже закончившиеся
+    """
+
+    minutes = integration_time_ * 2 if integration_time_ else 60
+    day_start = datetime.strptime(date_, '%d%m%y')
+    elapsed = min((now_ - day_start).total_seconds(), 24 * 60 * 60)
+
+    return max(0, int(elapsed // (minutes * 60)))
+
+
+def expected_header_address(pointer_, integration_time_, date_, now_):
+    """
+    Ожидаемый адрес записи часа 00 суток date_ (ddmmyy) в памяти № 03h.
+
+    Текущий указатель (0804) - адрес следующей записи, записи по PROFILE_RECORD_LEN байт пишутся подряд
+    по окончании каждых двух интервалов интегрирования (0806). Если в памяти нет пропусков (отключений питания)
+    и часы счётчика идут вместе с нашими, адрес совпадает с адресом заголовка суток, поэтому его нужно проверить
+    :return: адрес или None (суток ещё нет в памяти или их уже затёрла кольцевая запись)
+    """
+
+    if pointer_ is None or not integration_time_:
+        return None
+
+    day_start = datetime.strptime(date_, '%d%m%y')
+    records = int((now_ - day_start).total_seconds() // (integration_time_ * 2 * 60))
+
+    if records <= 0 or records * PROFILE_RECORD_LEN >= PROFILE_MEMORY_SIZE:
+        return None
+
+    return (pointer_ - records * PROFILE_RECORD_LEN) % PROFILE_MEMORY_SIZE
+
+
+@functools.lru_cache(maxsize=16)
+def scale_table(divide_, transform_):
+    """
+    Значения в кВт/квар для всех 16-битных слов профиля (индекс - слово) при постоянной divide_
+    и коэффициенте трансформации transform_. Округление как в DayProfile.values(), чтобы выгрузки
+    через NumPy совпадали с xlsx и mysql до сотых
+    """
+
+    return tuple(round((v / divide_) * transform_, 2) for v in range(0x10000))
+
+
+def profile_to_array(days_):
+    """
+    Профиль мощности за несколько суток (список DayProfile) в структурированный массив NumPy.
+    Сырые данные всех суток декодируются одним проходом (слова старшим байтом вперёд)
+
+    Поля: dt (datetime64[m]), a_plus, a_minus, r_plus, r_minus (кВт/квар), valid (получасовка получена)
+    """
+
+    numpy = import_numpy()
+
+    rows = len(days_) * 48
+
+    raw = numpy.frombuffer(b''.join(bytes(d.raw) for d in days_), dtype='>u2').reshape(rows, PROFILE_CHANNELS)
+
+    # Пересчёт импульсов в кВт/квар таблицей значений всех 16-битных слов (то же округление, что в DayProfile)
+    values = numpy.empty((rows, PROFILE_CHANNELS), dtype='f8')
+    tables = {}  # Таблицы по (постоянная, коэффициент трансформации)
+
+    for i, d in enumerate(days_):
+        key = (d.divide, d.transform)
+
+        if key not in tables:
+            tables[key] = numpy.array(scale_table(*key), dtype='f8')
+
+        values[i * 48:(i + 1) * 48] = tables[key][raw[i * 48:(i + 1) * 48]]
+
+    valid = numpy.frombuffer(b''.join(bytes(d.received) for d in days_), dtype='u1').astype(bool)
+
+    # Время получасовки - окончание промежутка, для последней 23:59
+    minutes = numpy.arange(30, 24 * 60 + 1, 30)
+    minutes[-1] = 24 * 60 - 1
+    base = numpy.array([datetime.strptime(d.date_param, '%d%m%y') for d in days_], dtype='datetime64[m]')
+
+    result = numpy.empty(rows, dtype=[('dt', 'datetime64[m]')] +
+                                     [(name, 'f8') for name in PROFILE_CHANNEL_NAMES] +
+                                     [('valid', '?')])
+
+    result['dt'] = (base[:, None] + minutes.astype('timedelta64[m]')).ravel()
+
+    for i, name in enumerate(PROFILE_CHANNEL_NAMES):
+        result[name] = values[:, i]
+
+    result['valid'] = numpy.repeat(valid, 2)
+
+    return result
+
+
+def make_profile_stats(values_):
+    """
+    Сумма, максимум и среднее по каналам для списка получасовок [(A+, A-, R+, R-), ...]
+    """
+
+    result = {}
+
+    for i, name in enumerate(PROFILE_CHANNEL_NAMES):
+        column = [v[i] for v in values_]
+
+        result[name] = {
+            'sum': round(sum(column), 2),
+            'max': max(column) if len(column) > 0 else 0.0,
+            'avg': round(sum(column) / len(column), 2) if len(column) > 0 else 0.0
+        }
+
+    return result
+
+
+def profile_stats(days_):
+    """
+    Суммы, максимумы и средние по каналам (A+, A-, R+, R-) за каждые сутки и за каждый месяц.
+    Учитываются только полученные из счётчика получасовки.
+    При наличии NumPy считается векторно, иначе обычными циклами
+
+    :return: {'days': {'гггг-мм-дд': {'a_plus': {'sum': .., 'max': .., 'avg': ..}, ...}}, 'months': {'гггг-мм': {...}}}
+    """
+
+    numpy = import_numpy()
+
+    result = {'days': {}, 'months': {}}
+
+    if len(days_) == 0:
+        return result
+
+    if numpy is not None:
+        data = profile_to_array(days_)
+
+        # Получасовки, которых нет, в расчёт не идут
+        values = numpy.stack([numpy.where(data['valid'], data[name], numpy.nan)
+                              for name in PROFILE_CHANNEL_NAMES], axis=-1).reshape(len(days_), 48, PROFILE_CHANNELS)
+
+        groups = {}  # {'гггг-мм': [индексы суток]}
+
+        for i, d in enumerate(days_):
+            true_date = make_true_date(d.date_param)
+            result['days'][true_date] = make_profile_stats_array(values[i])
+            groups.setdefault(true_date[0:7], []).append(i)
+
+        for month, indexes in groups.items():
+            result['months'][month] = make_profile_stats_array(values[indexes].reshape(-1, PROFILE_CHANNELS))
+    else:
+        groups = {}  # {'гггг-мм': [получасовки]}
+
+        for d in days_:
+            values = d.values()
+            valid = [values[i * PROFILE_CHANNELS:(i + 1) * PROFILE_CHANNELS]
+                     for i in range(48) if d.received[i // 2]]
+
+            true_date = make_true_date(d.date_param)
+            result['days'][true_date] = make_profile_stats(valid)
+            groups.setdefault(true_date[0:7], []).extend(valid)
+
+        for month, valid in groups.items():
+            result['months'][month] = make_profile_stats(valid)
+
+    return result
+
+
+def make_profile_stats_array(values_):
+    """
+    Сумма, максимум и среднее по каналам для массива NumPy получасовок (n x 4, отсутствующие - nan)
+    """
+
+    numpy = import_numpy()
+
+    result = {}
+
+    count = int(numpy.count_nonzero(~numpy.isnan(values_[:, 0])))
+
+    for i, name in enumerate(PROFILE_CHANNEL_NAMES):
+        column = values_[:, i]
+
+        result[name] = {
+            'sum': round(float(numpy.nansum(column)), 2),
+            'max': float(numpy.nanmax(column)) if count > 0 else 0.0,
+            'avg': round(float(numpy.nansum(column)) / count, 2) if count > 0 else 0.0
+        }
+
+    return result
+
+
+class PowerProfileParser:
+    """
+    Потоковый разбор записей пар получасовок из данных памяти № 03h.
+
+    Запись: час и дата (ддммгг) в BCD, ещё 4 байта заголовка, затем 8 слов данных
+    (A+, A-, R+, R- первой и второй получасовки часа).
+    Данные подаются по мере получения блоков (feed), каждый байт просматривается один раз,
+    незаконченная запись в конце блока дожидается следующего блока
+    """
+    def __init__(self, dates_):
+        self.dates = {bytes.fromhex(d): d for d in dates_}  # Ожидаемые даты {b'ддммгг': 'ddmmyy'}
+        self.buffer = bytearray()  # Ещё не разобранный хвост данных
+        self.address = None  # Адрес в памяти № 03h первого байта буфера (если известен)
+        self.headers = {}  # Адреса и заголовки записей часа 00 {ddmmyy: (адрес, 7 байт заголовка)}
+
+    def feed(self, data_, address_=None):
+        """
+        Добавить очередную порцию данных
+        :address_: адрес в памяти № 03h первого байта data_ (для учёта адресов суток в headers)
+        :return: список записей (ddmmyy, час, 16 байт данных пары получасовок)
+        """
+
+        result = []
+
+        buf = self.buffer
+
+        if address_ is not None:
+            self.address = (address_ - len(buf)) % 0x10000
+
+        buf += data_
+
+        pos = 0
+        end = len(buf) - PROFILE_RECORD_LEN
+
+        while pos <= end:
+            hour = BCD_HOURS.get(buf[pos])
+            date_ = self.dates.get(bytes(buf[pos + 1:pos + 4])) if hour is not None else None
+
+            if date_ is not None:
+                result.append((date_, hour, bytes(buf[pos + 8:pos + PROFILE_RECORD_LEN])))
+
+                if hour == 0 and self.address is not None:
+                    self.headers[date_] = ((self.address + pos) % 0x10000, bytes(buf[pos:pos + 7]))
+
+                pos += PROFILE_RECORD_LEN
+            else:
+                pos += 1
+
+        del buf[:pos]
+
+        if self.address is not None:
+            self.address = (self.address + pos) % 0x10000
+
+        return result
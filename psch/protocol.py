@@ -0,0 +1,263 @@
+"""
+Протокол СЭТ-4ТМ: сборка кадров запросов (адрес + запрос + CRC-16/MODBUS), проверка CRC ответов,
+форматы дат и указателей памяти счётчика, кэш кадров запросов
+"""
+
+import struct
+from datetime import datetime
+
+import libscrc
+
+
+FRAME_GAP_CHARS = 10  # Пауза (в символах) после которой кадр ответа считается законченным
+FRAME_GAP_MIN = 0.02  # Минимальная пауза конца кадра (сек.)
+
+
+def str_to_hex(s):
+    """
+    Преобразование строки в нстойщий hex (оставлено для совместимости)
+    string -> hex ('6800' - > '\x68\x00')
+    """
+
+    return bytes.fromhex(s)
+
+
+def int_to_hex_str(i):
+    """
+    Преобразование инта в строку хекса (оставлено для совместимости)
+
+    i: 0->255
+
+    1 dec -> 01 hex, 20 dec -> 14 hex
+    """
+
+    return f'{i:0>2X}'
+
+
+def validate_strhex(s):
+    """
+    Функция дополняет "слово"(пара байт) (оставлено для совместимости)
+    ps: Стоит обратить внимание, что если три символа, то 0 ставится в начале
+    """
+    result = s
+
+    if len(s) == 3:
+        result = f'0{s}'
+
+    if len(s) == 2:
+        result = f'00{s}'
+
+    if len(s) == 1:
+        result = f'000{s[0]}'
+
+    return result
+
+
+def get_crc(s):
+    """
+    CRC-16/MODBUS (оставлено для совместимости, кадры собирает make_frame)
+
+    s (string) - вида '6800' ('\x68\x00')
+    result (string) - CRC младшим байтом вперёд ('6800' -> '2fc0')
+    """
+
+    return struct.pack('<H', libscrc.modbus(str_to_hex(s))).hex()
+
+
+def make_frame(counter_identifier_, payload_):
+    """
+    Кадр запроса к электросчётчику: адрес + payload_ + CRC-16/MODBUS (младшим байтом вперёд)
+
+    counter_identifier_ (int) - идентификатор электросчётчика
+    payload_ (bytes) - код запроса с параметрами, например b'\x08\x03'
+    result (bytes)
+    """
+
+    frame = bytearray((counter_identifier_,))
+    frame += payload_
+    frame += struct.pack('<H', libscrc.modbus(bytes(frame)))
+
+    return bytes(frame)
+
+
+def make_crc16_table():
+    """
+    Таблица для побайтового расчёта CRC-16/MODBUS (полином A001h)
+    """
+
+    result = []
+
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        result.append(crc)
+
+    return result
+
+
+CRC16_TABLE = make_crc16_table()
+
+
+def crc16_modbus(data_, crc_=0xFFFF):
+    """
+    Табличный CRC-16/MODBUS
+
+    data_ (bytes) - данные
+    crc_ (int) - начальное значение, CRC уже посчитанной начальной части кадра
+    позволяет досчитывать CRC только для изменяемого хвоста кадра
+    """
+
+    for b in data_:
+        crc_ = (crc_ >> 8) ^ CRC16_TABLE[(crc_ ^ b) & 0xFF]
+
+    return crc_
+
+
+def check_crc(data):
+    """
+    Проверка CRC-16/MODBUS кадра ответа
+
+    data (bytes) - кадр целиком, вместе с CRC в последних двух байтах
+    CRC по всему кадру (включая его собственный CRC) для корректного кадра равен 0
+    """
+
+    return len(data) > 2 and libscrc.modbus(bytes(data)) == 0
+
+
+def get_gap_timeout(baudrate_, bits_=11):
+    """
+    Межсимвольный таймаут (сек.) для определения конца кадра ответа
+
+    baudrate_: скорость соединения
+    bits_: количество бит в символе (старт + данные + чётность + стоп)
+
+    Берётся время передачи FRAME_GAP_CHARS символов, но не меньше FRAME_GAP_MIN
+    (USB-адаптеры отдают принятые байты пачками с задержкой)
+    """
+
+    return max(bits_ * FRAME_GAP_CHARS / baudrate_, FRAME_GAP_MIN)
+
+
+def make_date_param(d_):
+    """
+    Дата в формате для посылки в электросчётчик: date(2021, 2, 18) -> ддммгг (180221)
+    """
+
+    return f'{d_:%d%m%y}'
+
+
+def next_pointer(pointer_, bytes_count_):
+    """
+    Указатель (int) на следующий блок памяти после чтения bytes_count_ байт с адреса pointer_.
+    Память кольцевая: после адреса FFFFh идёт 0 (чтения обрезаются по FFFFh, см. PSCH.profile_block_len)
+    """
+
+    result = pointer_ + bytes_count_
+
+    if result > 0xFFFF:  # Вышли за пределы адреса FFFFh
+        result -= 0x10000
+
+    return result
+
+
+def make_true_date(s_date):
+    """
+    Преобразоване даты вида ддммгг(180221) в 2021-02-18
+    """
+
+    try:
+        result = datetime.strptime(s_date, '%d%m%y')
+        #result = f'{str(result)[0:4]}.{str(result)[5:7]}.{str(result)[8:10]}'
+        result = f'{str(result)[0:10]}'
+    except:
+        result = s_date
+
+    return result
+
+
+def make_true_date_time(s_date, s_time):
+    """
+    Для БД или графиков
+
+    s_date: ддммгг (180221)
+    s_time: чч:мм-чч:мм (01:00-01:30)
+
+    return гггг-мм-дд чч:мм (2021-02-18 01:30:00) (берётся второе время получасовки)
+    """
+
+    dt = f'{s_date} {s_time[6:11]}'
+
+    try:
+        result = datetime.strptime(dt, '%d%m%y %H:%M')
+    except:
+        result = datetime.now()
+
+    return result
+
+
+class FrameCache:
+    """
+    Кэш кадров запросов к электросчётчикам (по идентификатору счётчика и коду запроса).
+
+    Кадры постоянных запросов и эталонный ответ собираются один раз.
+    В кадре чтения памяти (0C) подставляются только изменяемые поля,
+    а CRC досчитывается табличной функцией от сохранённого CRC неизменного начала кадра
+    """
+
+    # Запросы без параметров: тест, закрытие канала, коэффициенты, версия ПО, указатель,
+    # время интегрирования, флаги, состояние поиска заголовка
+    FIXED_PAYLOADS = (b'\x00', b'\x02', b'\x08\x02', b'\x08\x03', b'\x08\x04', b'\x08\x06', b'\x08\x09', b'\x08\x18\x00')
+
+    def __init__(self):
+        self.frames = {}  # Собранные кадры {(counter_identifier, payload): кадр}
+        self.memory_read_frames = {}  # Шаблоны кадров чтения памяти {counter_identifier: (кадр, CRC префикса)}
+
+    def request(self, counter_identifier_, payload_):
+        """
+        Кадр запроса. Постоянные запросы берутся из кэша, остальные собираются заново
+        """
+
+        if payload_ not in self.FIXED_PAYLOADS:
+            return make_frame(counter_identifier_, payload_)
+
+        key = (counter_identifier_, payload_)
+
+        result = self.frames.get(key)
+
+        if result is None:
+            result = make_frame(counter_identifier_, payload_)
+            self.frames[key] = result
+
+        return result
+
+    def ok_answer(self, counter_identifier_):
+        """
+        Эталонный ответ счётчика на успешную команду (адрес + 00 + CRC)
+        """
+
+        return self.request(counter_identifier_, b'\x00')
+
+    def memory_read(self, counter_identifier_, index_, memory_, pointer_, bytes_count_):
+        """
+        Кадр чтения памяти: адрес, 0C, индекс, № памяти, адрес в памяти (2 байта), количество байт, CRC
+        """
+
+        template = self.memory_read_frames.get(counter_identifier_)
+
+        if template is None:
+            frame = bytearray(9)
+            frame[0] = counter_identifier_
+            frame[1] = 0x0C
+            template = (frame, crc16_modbus(frame[0:2]))
+            self.memory_read_frames[counter_identifier_] = template
+
+        frame, crc = template
+
+        struct.pack_into('>BBHB', frame, 2, index_, memory_, pointer_, bytes_count_)
+        struct.pack_into('<H', frame, 7, crc16_modbus(memoryview(frame)[2:7], crc))
+
+        return bytes(frame)
@@ -0,0 +1,160 @@
+"""
+HTML-отчёты по профилю мощности из БД (графики Google Charts)
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+
+# Шаблоны html-отчётов. Данные - JSON-массив [время (мс от 1970-01-01, местное время как UTC), мощность, предел]
+REPORT_LINE_CHART = """<html>
+<head>
+<meta charset="utf-8">
+<script type="text/javascript" src="https://www.gstatic.com/charts/loader.js"></script>
+<script type="text/javascript">
+google.charts.load('current', {'packages':['corechart']});
+google.charts.setOnLoadCallback(drawChart);
+
+function toDate(ms) {
+var d = new Date(ms);
+return new Date(d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds());
+}
+
+function drawChart() {
+var data = new google.visualization.DataTable();
+data.addColumn('datetime', 'Дата');
+data.addColumn('number', 'Активная потреблённая');
+data.addColumn('number', 'Предел');
+data.addRows(ROWS.map(function (r) { return [toDate(r[0]), r[1], r[2]]; }));
+
+var options = {
+title: %(title)s,
+curveType: 'function',
+legend: { position: 'bottom' }
+};
+
+var chart = new google.visualization.LineChart(document.getElementById('curve_chart'));
+
+chart.draw(data, options);
+}
+</script>
+</head>
+<body>
+<div id="curve_chart" style="width: 100%%; height: 100%%"></div>
+<script type="text/javascript">
+var ROWS = ["""
+
+REPORT_ANNOTATION_CHART = """<html>
+<head>
+<meta charset="utf-8">
+<script type="text/javascript" src="https://www.gstatic.com/charts/loader.js"></script>
+<script type='text/javascript'>
+google.charts.load('current', {'packages':['annotationchart']});
+google.charts.setOnLoadCallback(drawChart);
+
+function toDate(ms) {
+var d = new Date(ms);
+return new Date(d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(), d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds());
+}
+
+function drawChart() {
+var data = new google.visualization.DataTable();
+data.addColumn('date', 'Дата');
+data.addColumn('number', 'Активная потреблённая');
+data.addColumn('number', 'Порог мощности');
+data.addRows(ROWS.map(function (r) { return [toDate(r[0]), r[1], r[2]]; }));
+
+var chart = new google.visualization.AnnotationChart(document.getElementById('chart_div'));
+
+var options = {
+displayAnnotations: true,
+displayDateBarSeparator: true,
+dateFormat: 'dd.MM.yyyy HH:mm'
+};
+
+chart.draw(data, options);
+}
+</script>
+</head>
+
+<body>
+<div id='chart_div' style='width: 100%%; height: 100%%;'></div>
+<script type="text/javascript">
+var ROWS = ["""
+
+REPORT_END = """];
+</script>
+</body>
+</html>
+"""
+
+REPORT_CHUNK_ROWS = 2000  # Строк отчёта, записываемых в файлы за раз
+EPOCH = datetime(1970, 1, 1)  # Начало отсчёта времени в данных отчётов
+
+
+def write_reports(rows_, report_dir_, title_, transform_, top_, month_start_):
+    """
+    Запись html-отчётов в папку report_dir_ (создаётся, если её нет):
+    report_all.html, report_all_e.html - за весь период, report_month.html, report_month_e.html - с month_start_.
+
+    rows_ - строки (dt, activePowerConsumed) по возрастанию dt, например курсор БД на стороне сервера.
+    Строки читаются один раз и сразу пишутся во все четыре файла
+    """
+
+    # https://developers.google.com/chart/interactive/docs/gallery/annotationchart?hl=ru
+    reports = {
+        'all': (f'{title_}; Все данные', 'report_all.html', 'report_all_e.html'),
+        'month': (f'{title_}; За текущий месяц', 'report_month.html', 'report_month_e.html'),
+    }
+
+    files = {}  # {'all' | 'month': [файл статичного графика, файл эксперементального графика]}
+
+    try:
+        os.makedirs(report_dir_, exist_ok=True)
+
+        for name, (title, file_name, file_name_e) in reports.items():
+            files[name] = [open(f'{report_dir_}/{file_name}', 'w', encoding='utf-8'),
+                           open(f'{report_dir_}/{file_name_e}', 'w', encoding='utf-8')]
+
+            # Строка JavaScript: кавычки, обратные косые и переводы строк экранирует json, </script> - замена '</'
+            title = json.dumps(title, ensure_ascii=False).replace('</', '<\\/')
+            files[name][0].write(REPORT_LINE_CHART % {'title': title})
+            files[name][1].write(REPORT_ANNOTATION_CHART % {'title': title})
+
+        ms = timedelta(milliseconds=1)
+        chunks = {'all': [], 'month': []}  # Строки данных, ещё не записанные в файлы
+        separators = {'all': '', 'month': ''}
+
+        def flush(name_):
+            if chunks[name_]:
+                s = separators[name_] + ','.join(chunks[name_])
+                separators[name_] = ','
+
+                for f in files[name_]:
+                    f.write(s)
+
+                chunks[name_].clear()
+
+        for dt, value in rows_:
+            row = f'[{(dt - EPOCH) // ms},{value * transform_},{top_}]'
+
+            chunks['all'].append(row)
+
+            if dt >= month_start_:
+                chunks['month'].append(row)
+
+            if len(chunks['all']) >= REPORT_CHUNK_ROWS:
+                flush('all')
+                flush('month')
+
+        flush('all')
+        flush('month')
+
+        for name in files:
+            for f in files[name]:
+                f.write(REPORT_END)
+    finally:
+        for name in files:
+            for f in files[name]:
+                f.close()
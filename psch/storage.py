@@ -0,0 +1,356 @@
+"""
+Хранение: json-файлы, запросы к MySQL, метаданные счётчиков (MeterInfo), дисковый кэш суток профиля (ProfileCache)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from psch.profile import PROFILE_BLOCK_LEN
+
+
+logger = logging.getLogger('psch2.py')
+
+json_lock = threading.Lock()  # json-файлы (кэш метаданных) обновляют потоки опроса линий (FleetRunner)
+
+
+def load_json(file_name_):
+    """
+    Чтение словаря из json-файла. Если файла нет или он испорчен - пустой словарь
+    """
+
+    result = {}
+
+    try:
+        with open(file_name_, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    except FileNotFoundError:
+        pass
+    except:
+        logger.error(f'Ошибка при чтении файла {file_name_}')
+
+    return result
+
+
+def save_json(file_name_, data_):
+    """
+    Запись словаря в json-файл. Пишется временный файл в той же папке и подменяет старый (os.replace),
+    так что читатель видит либо старый, либо новый файл целиком
+    """
+
+    temp_name = None
+
+    try:
+        fd, temp_name = tempfile.mkstemp(prefix=os.path.basename(file_name_) + '.',
+                                         suffix='.tmp',
+                                         dir=os.path.dirname(os.path.abspath(file_name_)))
+
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data_, f, ensure_ascii=False, indent=2)
+
+        os.replace(temp_name, file_name_)
+        temp_name = None
+    except:
+        logger.error(f'Ошибка при записи файла {file_name_}')
+    finally:
+        if temp_name is not None:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+
+
+def update_json(file_name_, key_, value_):
+    """
+    Запись одного ключа словаря json-файла: чтение, изменение и запись под блокировкой json_lock,
+    чтобы одновременные обновления из разных потоков не терялись
+    """
+
+    with json_lock:
+        data = load_json(file_name_)
+        data[key_] = value_
+        save_json(file_name_, data)
+
+
+def mysql_execute(db_connection, query, commit_flag, result_type, args=None):
+    """
+    Функция для выполнния любых типов запросов к MySQL
+    :dbCursor:   Указатель на курсор БД
+    :query:      Запрос к БД
+    :commitFlag: Делать ли коммит (True - Делать)
+    :resultType: Тип результата (one - первую строку результата, all - весь результат)
+    :args:       Параметры запроса (подставляются драйвером вместо %s)
+    """
+
+    result = None
+
+    error_flag = False
+
+    if db_connection:
+        dbCursor = db_connection.cursor()
+        try:
+            dbCursor.execute(query, args)
+        except:
+            error_flag = True
+            logger.error(f'Ошибка при выполнении запроса: {query}')
+
+        if not error_flag:
+            if commit_flag == True:
+                db_connection.commit()
+
+            if result_type == 'one':
+                result = dbCursor.fetchone()
+
+            if result_type == 'all':
+                result = dbCursor.fetchall()
+
+    return result
+
+
+def mysql_execute_many(db_connection, query, rows):
+    """
+    Выполнение одного запроса для пачки строк параметров одной транзакцией
+    :query: Запрос к БД с параметрами %s
+    :rows:  Список кортежей параметров
+    :return: True если пачка записана
+    """
+
+    result = False
+
+    if db_connection:
+        dbCursor = db_connection.cursor()
+        try:
+            dbCursor.executemany(query, rows)
+            db_connection.commit()
+            result = True
+        except:
+            logger.error(f'Ошибка при выполнении запроса: {query}')
+            try:
+                db_connection.rollback()
+            except:
+                pass
+
+    return result
+
+
+MYSQL_BATCH_SIZE = 1000  # Строк в одной транзакции записи профиля мощности
+
+# Запись профиля мощности при наличии уникального ключа (counterID, dt)
+MYSQL_UPSERT_LOADPROFILE = "insert into loadprofiles (counterID, dt, activePowerConsumed, reactiveEnergyConsumed) " \
+                           "values (%s, %s, %s, %s) " \
+                           "on duplicate key update " \
+                           "activePowerConsumed = values(activePowerConsumed), " \
+                           "reactiveEnergyConsumed = values(reactiveEnergyConsumed)"
+
+# Запись профиля мощности без уникального ключа (старая схема БД)
+MYSQL_INSERT_LOADPROFILE = "insert into loadprofiles (counterID, dt, activePowerConsumed, reactiveEnergyConsumed) " \
+                           "select %s, %s, %s, %s " \
+                           "FROM (SELECT 1) as dummytable " \
+                           "WHERE NOT EXISTS (SELECT 1 FROM loadprofiles WHERE counterID = %s and dt = %s)"
+
+# Уникальный ключ (counterID, dt) в loadprofiles: есть ли он
+MYSQL_UNIQUE_KEY_QUERY = "select index_name from information_schema.statistics " \
+                         "where table_schema = database() and table_name = 'loadprofiles' and non_unique = 0 " \
+                         "group by index_name " \
+                         "having group_concat(column_name order by seq_in_index) = 'counterID,dt'"
+
+# Разовая миграция (ключ -mysql-migrate): добавление уникального ключа
+MYSQL_ADD_UNIQUE_KEY = "alter table loadprofiles add unique key counter_dt (counterID, dt)"
+
+
+def mysql_has_unique_key(db_connection):
+    """
+    Есть ли в loadprofiles уникальный ключ (counterID, dt), нужный для записи через UPSERT
+    """
+
+    return mysql_execute(db_connection, MYSQL_UNIQUE_KEY_QUERY, False, 'one') is not None
+
+
+def mysql_add_unique_key(db_connection):
+    """
+    Разовая миграция БД: уникальный ключ (counterID, dt) в loadprofiles.
+    Нужна привилегия ALTER, на большой таблице ALTER TABLE идёт долго и может блокировать запись.
+    :return: True если ключ есть (уже был или добавлен)
+    """
+
+    result = mysql_has_unique_key(db_connection)
+
+    if result:
+        logger.info('Уникальный ключ (counterID, dt) в loadprofiles уже есть')
+    else:
+        mysql_execute(db_connection, MYSQL_ADD_UNIQUE_KEY, True, None)
+
+        result = mysql_has_unique_key(db_connection)
+
+        if result:
+            logger.info('В таблицу loadprofiles добавлен уникальный ключ (counterID, dt)')
+        else:
+            logger.error('Не удалось добавить уникальный ключ (counterID, dt) в loadprofiles (есть дубли или нет прав?)')
+
+    return result
+
+
+class MeterInfo:
+    """
+    Метаданные электросчётчика.
+    Читаются один раз на открытый канал связи, а неизменные (флаги, время интегрирования)
+    ещё и сохраняются на диск до смены версии ПО счётчика
+    """
+    def __init__(self):
+        self.firmware = ''  # Версия ПО (данные ответа на 0803, hex)
+        self.flags = ''  # Программируемые флаги (данные ответа на 0809, hex)
+        self.integration_time = 30  # Время интегрирования мощности массива профиля, мин (0806)
+        self.pointer = None  # Текущий указатель базового массива профиля мощности (0804)
+        self.block_size = PROFILE_BLOCK_LEN  # Наибольшее количество байт одного чтения памяти № 03h (проба)
+
+    def to_dict(self):
+        """
+        Неизменные до смены ПО поля для дискового кэша
+        """
+
+        return {
+            'firmware': self.firmware,
+            'flags': self.flags,
+            'integration_time': self.integration_time,
+            'block_size': self.block_size
+        }
+
+    def from_dict(self, d_):
+        self.firmware = d_['firmware']
+        self.flags = d_['flags']
+        self.integration_time = d_['integration_time']
+        self.block_size = d_.get('block_size', PROFILE_BLOCK_LEN)
+
+
+class ProfileCache:
+    """
+    Дисковый кэш (SQLite) сырых суточных профилей мощности из памяти № 03h.
+
+    Прошедшие сутки в памяти счётчика не меняются, пока их не затрёт кольцевая запись,
+    поэтому полностью прочитанные сутки хранятся по заводскому номеру счётчика и дате
+    вместе с адресом и 7 байтами заголовка суток. Перед использованием заголовок
+    перечитывается из счётчика (0603) и сравнивается с сохранённым.
+    Хранятся импульсы, поэтому другие counter_divide / counter_transform применяются без перечитывания.
+
+    Там же - индекс заголовков суток (адрес и 7 байт записи часа 00 всех суток, встреченных при чтении,
+    в том числе не полностью прочитанных): по нему указатель на дату проверяется одним чтением вместо поиска,
+    и прошедшие сутки, которых в памяти счётчика нет целиком (счётчик был выключен), с количеством
+    получасовок, которые в памяти есть: такие сутки не перечитываются при каждой дозаписи в БД
+    """
+    def __init__(self, file_name_):
+        self.file_name = file_name_  # Файл кэша
+        self.db = None  # Подключение (открывается при первом обращении)
+
+    def connect(self):
+        if self.db is None:
+            try:
+                import sqlite3
+
+                self.db = sqlite3.connect(self.file_name, timeout=30)
+                self.db.execute("create table if not exists profile_days ("
+                                "serial text, day text, address integer, header blob, raw blob, "
+                                "primary key (serial, day))")
+                self.db.execute("create table if not exists profile_headers ("
+                                "serial text, day text, address integer, header blob, "
+                                "primary key (serial, day))")
+                self.db.execute("create table if not exists profile_gaps ("
+                                "serial text, day text, half_hours integer, "
+                                "primary key (serial, day))")
+            except:
+                logger.error(f'Ошибка при открытии кэша профилей мощности {self.file_name}')
+                self.db = None
+
+        return self.db
+
+    def get(self, serial_, date_):
+        """
+        Сутки date_ (ddmmyy) счётчика serial_
+        :return: (адрес заголовка, 7 байт заголовка, сырые данные суток) или None
+        """
+
+        result = None
+
+        if self.connect() is not None:
+            try:
+                result = self.db.execute("select address, header, raw from profile_days where serial = ? and day = ?",
+                                         (serial_, date_)).fetchone()
+            except:
+                logger.error(f'Ошибка при чтении кэша профилей мощности {self.file_name}')
+
+        return result
+
+    def put(self, serial_, date_, address_, header_, raw_):
+        if self.connect() is not None:
+            try:
+                self.db.execute("insert or replace into profile_days (serial, day, address, header, raw) "
+                                "values (?, ?, ?, ?, ?)",
+                                (serial_, date_, address_, bytes(header_), bytes(raw_)))
+                self.db.commit()
+            except:
+                logger.error(f'Ошибка при записи в кэш профилей мощности {self.file_name}')
+
+    def get_header(self, serial_, date_):
+        """
+        Заголовок суток date_ (ddmmyy) счётчика serial_ из индекса (или из сохранённых суток)
+        :return: (адрес заголовка, 7 байт заголовка) или None
+        """
+
+        result = None
+
+        if self.connect() is not None:
+            try:
+                result = self.db.execute("select address, header from profile_headers where serial = ? and day = ? "
+                                         "union all "
+                                         "select address, header from profile_days where serial = ? and day = ?",
+                                         (serial_, date_, serial_, date_)).fetchone()
+            except:
+                logger.error(f'Ошибка при чтении индекса заголовков {self.file_name}')
+
+        return result
+
+    def put_header(self, serial_, date_, address_, header_):
+        if self.connect() is not None:
+            try:
+                self.db.execute("insert or replace into profile_headers (serial, day, address, header) "
+                                "values (?, ?, ?, ?)",
+                                (serial_, date_, address_, bytes(header_)))
+                self.db.commit()
+            except:
+                logger.error(f'Ошибка при записи в индекс заголовков {self.file_name}')
+
+    def get_gaps(self, serial_):
+        """
+        Прошедшие сутки счётчика serial_, прочитанные из счётчика не полностью из-за пропусков в его памяти
+        :return: {ddmmyy: количество получасовок в памяти счётчика}
+        """
+
+        result = {}
+
+        if self.connect() is not None:
+            try:
+                result = dict(self.db.execute("select day, half_hours from profile_gaps where serial = ?",
+                                              (serial_,)).fetchall())
+            except:
+                logger.error(f'Ошибка при чтении пропусков профиля мощности {self.file_name}')
+
+        return result
+
+    def put_gaps(self, serial_, date_, half_hours_):
+        if self.connect() is not None:
+            try:
+                self.db.execute("insert or replace into profile_gaps (serial, day, half_hours) values (?, ?, ?)",
+                                (serial_, date_, half_hours_))
+                self.db.commit()
+            except:
+                logger.error(f'Ошибка при записи пропусков профиля мощности {self.file_name}')
+
+    def close(self):
+        if self.db is not None:
+            try:
+                self.db.close()
+            except:
+                pass
+
+            self.db = None
@@ -0,0 +1,396 @@
+"""
+Транспорт до электросчётчиков на asyncio: шлюзы RS-485 <-> Ethernet (TCP, UDP) и com-порт.
+
+Все соединения обслуживаются одним циклом событий (GatewayPool) в отдельном потоке,
+соединение с каждым шлюзом открывается один раз и переиспользуется.
+
+Адрес линии задаётся строкой вместо имени com-порта:
+    tcp://192.168.1.10:4001
+    udp://192.168.1.10:4001
+    serial://COM3  (или serial:///dev/ttyUSB0)
+
+Link.request() - асинхронный запрос-ответ с чтением до полного кадра с верным CRC
+(соединение, закрытое шлюзом, открывается заново перед следующим запросом),
+LinkPort - синхронная обёртка для PSCH: запрос выполняется в цикле событий, поток опроса только ждёт результат.
+ReplayServer - локальный TCP-сервер, отвечающий записанными ответами счётчика (замена шлюза для проверки)
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from urllib.parse import urlparse
+
+from psch.protocol import check_crc, get_gap_timeout
+
+
+logger = logging.getLogger('psch2.py')
+
+CONNECT_TIMEOUT = 10  # Таймаут установки соединения со шлюзом (сек.)
+REQUEST_MARGIN = 1  # Запас к таймауту запроса на ожидание цикла событий GatewayPool (сек.)
+
+
+class LinkProtocol(asyncio.Protocol, asyncio.DatagramProtocol):
+    """
+    Протокол asyncio: складывает принятые байты в буфер соединения
+    """
+    def __init__(self, link_):
+        self.link = link_
+
+    def connection_made(self, transport):
+        self.link.transport = transport
+
+    def data_received(self, data):
+        self.link.feed(data)
+
+    def datagram_received(self, data, addr):
+        self.link.feed(data)
+
+    def connection_lost(self, exc):
+        self.link.transport = None
+
+    def error_received(self, exc):
+        logger.error(f'Ошибка обмена со шлюзом {self.link.url}: {exc}')
+
+
+class Link:
+    """
+    Соединение с одним шлюзом (или com-портом) в цикле событий GatewayPool
+    """
+    def __init__(self, url_, loop_):
+        self.url = url_  # Адрес линии (tcp://, udp://, serial://)
+        self.loop = loop_  # Цикл событий, в котором живёт соединение
+        self.transport = None  # Транспорт asyncio (None - соединение закрыто)
+        self.buffer = bytearray()  # Принятые и ещё не прочитанные байты
+        self.buffer_lock = threading.Lock()  # Буфер читается и из потоков опроса (LinkPort)
+        self.received = asyncio.Event()  # Пришли новые байты
+        self.request_lock = asyncio.Lock()  # Линия полудуплексная - один запрос за раз
+        self.serial = None  # Открытый serial.Serial (serial:// без pyserial-asyncio)
+        self.baudrate = 9600  # Скорость com-порта (serial://), нужна для повторного открытия
+        self.datagram = urlparse(url_).scheme == 'udp'  # Обмен датаграммами (UDP)
+
+    async def connect(self, baudrate_=9600):
+        """
+        Открытие соединения
+        """
+
+        url = urlparse(self.url)
+        self.baudrate = baudrate_
+
+        if url.scheme == 'tcp':
+            await self.loop.create_connection(lambda: LinkProtocol(self), url.hostname, url.port)
+        elif url.scheme == 'udp':
+            await self.loop.create_datagram_endpoint(lambda: LinkProtocol(self), remote_addr=(url.hostname, url.port))
+        elif url.scheme == 'serial':
+            port_name = url.netloc or url.path
+
+            try:
+                import serial_asyncio
+            except ImportError:  # Без pyserial-asyncio com-порт читается через add_reader (только POSIX)
+                serial_asyncio = None
+
+            if serial_asyncio is not None:
+                await serial_asyncio.create_serial_connection(self.loop, lambda: LinkProtocol(self), port_name,
+                                                              baudrate=baudrate_)
+            else:
+                self.open_serial(port_name, baudrate_)
+        else:
+            raise ValueError(f'Неизвестный тип линии: {self.url}')
+
+        logger.info(f'Соединение с {self.url} установлено')
+
+    def open_serial(self, port_name_, baudrate_):
+        """
+        Com-порт без pyserial-asyncio: неблокирующее чтение по готовности дескриптора
+        """
+
+        import serial
+
+        self.serial = serial.Serial(port=port_name_, baudrate=baudrate_, timeout=0)
+
+        def read_ready():
+            self.feed(self.serial.read(self.serial.in_waiting or 1))
+
+        self.loop.add_reader(self.serial.fileno(), read_ready)
+        self.transport = self
+
+    @property
+    def connected(self):
+        return self.transport is not None
+
+    def feed(self, data_):
+        """
+        Принятые байты (вызывается в цикле событий)
+        """
+
+        with self.buffer_lock:
+            self.buffer += data_
+
+        self.received.set()
+
+    def clear(self):
+        with self.buffer_lock:
+            self.buffer.clear()
+
+    def take(self, count_=None):
+        """
+        Забрать из буфера count_ (все, если None) принятых байт
+        """
+
+        with self.buffer_lock:
+            if count_ is None:
+                count_ = len(self.buffer)
+
+            result = bytes(self.buffer[:count_])
+            del self.buffer[:count_]
+
+        return result
+
+    def waiting(self):
+        with self.buffer_lock:
+            return len(self.buffer)
+
+    def write(self, data_):
+        """
+        Отправка (вызывается в цикле событий)
+        """
+
+        if not self.connected:
+            raise ConnectionError(f'Соединение с {self.url} закрыто')
+
+        if self.serial is not None:
+            self.serial.write(data_)
+        elif self.datagram:
+            self.transport.sendto(data_)
+        else:
+            self.transport.write(data_)
+
+    def close(self):
+        if self.serial is not None:
+            self.loop.remove_reader(self.serial.fileno())
+            self.serial.close()
+            self.serial = None
+            self.transport = None
+        elif self.transport is not None:
+            self.transport.close()
+
+    async def request(self, frame_, answer_len_=None, timeout_=0.3, gap_=0.02):
+        """
+        Асинхронный запрос-ответ.
+        Ответ читается до полного кадра с верным CRC (длиной answer_len_, если известна),
+        либо до межсимвольной паузы gap_, либо до общего таймаута timeout_.
+        Если шлюз закрыл соединение, перед запросом оно открывается заново
+        """
+
+        async with self.request_lock:
+            if not self.connected:
+                await asyncio.wait_for(self.connect(self.baudrate), CONNECT_TIMEOUT)
+
+            self.clear()
+            self.write(frame_)
+
+            end_time = self.loop.time() + timeout_
+
+            while True:
+                self.received.clear()
+
+                count = self.waiting()
+
+                if count > 0 and (answer_len_ is None or count >= answer_len_):
+                    with self.buffer_lock:
+                        complete = check_crc(self.buffer)
+
+                    if complete:
+                        break
+
+                if count > 0:
+                    wait = gap_  # Кадр начался - ждём не дольше паузы между байтами
+                else:
+                    wait = end_time - self.loop.time()
+
+                    if wait <= 0:
+                        break
+
+                try:
+                    await asyncio.wait_for(self.received.wait(), wait)
+                except asyncio.TimeoutError:
+                    if count > 0 or self.loop.time() >= end_time:
+                        break
+
+            return self.take()
+
+
+class LinkPort:
+    """
+    Синхронная обёртка над Link для PSCH (потоки опроса BusPoller, FleetRunner).
+    Запрос-ответ выполняет цикл событий GatewayPool (Link.request), поток только ждёт готовый кадр
+    """
+    def __init__(self, link_, timeout_=0.3, baudrate_=9600):
+        self.link = link_
+        self.timeout = timeout_  # Таймаут ожидания ответа
+        self.baudrate = baudrate_  # Скорость линии RS-485 за шлюзом (для расчёта паузы конца кадра)
+
+    def request(self, frame_, answer_len_=None):
+        """
+        Запрос-ответ, result (bytes) - принятый ответ (b'' - ответа нет).
+        Ошибка соединения (шлюз недоступен) поднимается исключением,
+        зависший запрос (цикл событий не ответил за таймаут линии с запасом) - TimeoutError
+        """
+
+        timeout = self.timeout
+        gap = get_gap_timeout(self.baudrate)
+
+        if answer_len_ is not None:
+            timeout += answer_len_ * 11 / self.baudrate  # Время передачи ответа (11 бит на символ)
+
+        wait = timeout + gap + REQUEST_MARGIN
+
+        if not self.link.connected:
+            wait += CONNECT_TIMEOUT  # Перед запросом соединение будет открыто заново
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.link.request(bytes(frame_), answer_len_, timeout, gap),
+            self.link.loop)
+
+        try:
+            return future.result(wait)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f'Нет результата запроса к {self.link.url} за {wait:.2f} сек.')
+
+    def close(self):
+        """
+        Соединение остаётся открытым в GatewayPool для следующих опросов
+        """
+
+        pass
+
+
+class GatewayPool:
+    """
+    Один цикл событий (в отдельном потоке) на все шлюзы.
+    Соединения хранятся по адресу линии и переиспользуются
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.links = {}  # {url: Link}
+        self.thread = threading.Thread(target=self.loop.run_forever, name='GatewayPool', daemon=True)
+        self.thread.start()
+
+    async def open(self, url_, baudrate_=9600):
+        """
+        Соединение с линией (в цикле событий пула). Открывается при первом обращении или после обрыва
+        """
+
+        link = self.links.get(url_)
+
+        if link is None:
+            link = Link(url_, self.loop)
+            self.links[url_] = link
+
+        if not link.connected:
+            await link.connect(baudrate_)
+
+        return link
+
+    def link(self, url_, baudrate_=9600, timeout_=10):
+        """
+        Соединение с линией из обычного (не asyncio) потока
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.open(url_, baudrate_), self.loop).result(timeout_)
+
+    def port(self, url_, timeout_=0.3, baudrate_=9600):
+        """
+        Объект с интерфейсом serial.Serial для PSCH
+        """
+
+        return LinkPort(self.link(url_, baudrate_), timeout_, baudrate_)
+
+    def close(self):
+        """
+        Закрытие всех соединений и остановка цикла событий
+        """
+
+        def close_all():
+            for link in self.links.values():
+                link.close()
+
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(close_all)
+        self.thread.join()
+        self.links = {}
+
+
+gateway_pool = None  # Общий пул соединений (создаётся при первом обращении)
+gateway_pool_lock = threading.Lock()
+
+
+def get_gateway_pool():
+    """
+    Общий пул соединений со шлюзами
+    """
+
+    global gateway_pool
+
+    with gateway_pool_lock:
+        if gateway_pool is None:
+            gateway_pool = GatewayPool()
+
+    return gateway_pool
+
+
+class ReplayServer:
+    """
+    Локальная замена шлюза для проверки транспорта: TCP-сервер,
+    отвечающий на известные кадры запросов записанными ответами счётчика
+    """
+    def __init__(self, replies_, delay_=0.0):
+        self.replies = replies_  # {кадр запроса (bytes): кадр ответа (bytes)}
+        self.delay = delay_  # Задержка ответа (сек.)
+        self.server = None
+        self.requests = []  # Принятые кадры запросов
+
+    async def handle(self, reader_, writer_):
+        buffer = bytearray()
+
+        while True:
+            data = await reader_.read(256)
+
+            if not data:
+                break
+
+            buffer += data
+
+            # Кадры запросов не разделены - ищем самый короткий известный кадр в начале буфера
+            for length in range(1, len(buffer) + 1):
+                request = bytes(buffer[:length])
+                reply = self.replies.get(request)
+
+                if reply is not None:
+                    del buffer[:length]
+                    self.requests.append(request)
+
+                    if self.delay > 0:
+                        await asyncio.sleep(self.delay)
+
+                    writer_.write(reply)
+                    await writer_.drain()
+                    break
+
+        writer_.close()
+
+    async def start(self, host_='127.0.0.1', port_=0):
+        """
+        Запуск сервера, возвращает адрес линии вида tcp://host:port
+        """
+
+        self.server = await asyncio.start_server(self.handle, host_, port_)
+        host, port = self.server.sockets[0].getsockname()[:2]
+
+        return f'tcp://{host}:{port}'
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
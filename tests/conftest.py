@@ -0,0 +1,34 @@
+"""
+Общие параметры тестов
+"""
+
+import pytest
+
+
+@pytest.fixture
+def params(tmp_path):
+    """
+    Параметры PSCH (как в t.py), кэши - во временной папке
+    """
+
+    return dict(port_name='',
+                port_baudrate=9600,
+                port_parity='N',
+                port_stopbits=1,
+                port_bytesize=8,
+                port_timeout=0.3,
+                counter_factory_number='1103181104',
+                counter_identifier=104,
+                counter_divide=1250,
+                counter_transform=1,
+                counter_password='000000',
+                counter_top=500,
+                xlsx_template='',
+                xlsx_result='',
+                mysql_host='',
+                mysql_db='',
+                mysql_user='',
+                mysql_password='',
+                report_dir=str(tmp_path),
+                meter_info_cache=str(tmp_path / 'meter_info.json'),
+                request_backoff=0.01)
@@ -0,0 +1,56 @@
+"""
+Вспомогательные классы тестов (импортируются тестами: from helpers import ...)
+"""
+
+from psch import emulator
+
+
+class EmulatorPort:
+    """
+    Порт с интерфейсом serial.Serial (то, что использует PSCH.exchange) поверх BusEmulator в этом же процессе
+    """
+    def __init__(self, bus_, timeout_=0.05, baudrate_=9600):
+        self.bus = bus_
+        self.timeout = timeout_
+        self.baudrate = baudrate_
+        self.buffer = bytearray()  # Ответ, ещё не прочитанный PSCH
+        self.pending = bytearray()  # Принятые байты запросов (делятся на кадры как в emulator.serve_stream)
+
+    def reply(self, frame_):
+        """
+        Ответ линии на кадр frame_ (None - ответа нет)
+        """
+
+        return self.bus.handle(frame_)
+
+    def flushInput(self):
+        self.buffer.clear()
+
+    def flushOutput(self):
+        pass
+
+    def write(self, data_):
+        self.pending += data_
+
+        while self.pending:
+            # Неизвестный запрос заканчивается паузой - здесь концом записи
+            length = emulator.split_frame(self.pending) or len(self.pending)
+            reply = self.reply(bytes(self.pending[:length]))
+            del self.pending[:length]
+
+            if reply:
+                self.buffer += reply
+
+        return len(data_)
+
+    def inWaiting(self):
+        return len(self.buffer)
+
+    def read(self, size_=1):
+        result = bytes(self.buffer[:size_])
+        del self.buffer[:size_]
+
+        return result
+
+    def close(self):
+        pass
@@ -0,0 +1,212 @@
+"""
+Чтение профиля мощности с эмулятора счётчика: разбор кадров, переход памяти через FFFFh,
+размер блока чтения, восстановление блоков и повторы запросов на зашумлённой линии
+"""
+
+import struct
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from helpers import EmulatorPort
+from psch import emulator
+from psch.meter import PSCH
+from psch.profile import PROFILE_RECORD_LEN, PowerProfileParser
+from psch.protocol import FrameCache, check_crc, make_date_param, make_frame
+
+DAYS = 12  # Суток профиля в памяти эмулятора
+
+
+def expected_days(meter_, days_):
+    """
+    Сырые значения суток days_ (ddmmyy) прямо из памяти эмулятора {ddmmyy: 24 x 16 байт}
+    """
+
+    result = {}
+
+    for d in days_:
+        address = meter_.headers[bytes.fromhex(d)]
+        data = meter_.read_memory(address, 24 * PROFILE_RECORD_LEN)
+        result[d] = b''.join(data[i + 8:i + PROFILE_RECORD_LEN] for i in range(0, len(data), PROFILE_RECORD_LEN))
+
+    return result
+
+
+def read_range(params_, port_, date_from_, date_to_):
+    psch = PSCH(params_, port_)
+
+    assert psch.open_channel(port_, 104, '000000')
+
+    result = {d.date_param: d for d in psch.iter_power_profile_range(port_, 104, date_from_, date_to_, 1250, 1)}
+
+    assert not psch.global_error
+
+    return result
+
+
+def past_range():
+    """
+    Все полные сутки в памяти эмулятора
+    """
+
+    today = date.today()
+
+    return today - timedelta(days=DAYS), today - timedelta(days=1)
+
+
+def check_range(meter_, days_):
+    date_from, date_to = past_range()
+    names = [make_date_param(date_from + timedelta(days=i)) for i in range((date_to - date_from).days + 1)]
+
+    assert sorted(days_) == sorted(names)
+
+    expected = expected_days(meter_, names)
+
+    for name, day in days_.items():
+        assert all(day.received), name
+        assert bytes(day.raw) == expected[name], name
+
+
+@pytest.mark.parametrize('index, pointer, count', [(1, 0, 0x82), (255, 0xFFFF, 0xFF), (17, 0x1234, 24)])
+def test_frame_cache_patches_crc(index, pointer, count):
+    frames = FrameCache()
+    frames.memory_read(104, 1, 3, 0x5555, 0x10)  # Шаблон кадра уже собран с другими полями
+
+    frame = frames.memory_read(104, index, 3, pointer, count)
+
+    assert bytes(frame) == make_frame(104, b'\x0C' + struct.pack('>BBHB', index, 3, pointer, count))
+    assert check_crc(frame)
+
+
+def request_frames(counter_identifier_):
+    """
+    Кадры всех запросов, которые PSCH посылает счётчику counter_identifier_
+    """
+
+    frames = FrameCache()
+
+    for payload in FrameCache.FIXED_PAYLOADS:
+        yield frames.request(counter_identifier_, payload)
+
+    yield frames.request(counter_identifier_, b'\x01' + b'000000')
+    yield frames.request(counter_identifier_, b'\x03\x28\x00\xff\xff\xff\x17\x10\x26\xff\x1e')
+
+    for pointer in list(range(0, 0x10000, 0x0FF1)) + [0x3034, 0xFFFF]:
+        yield frames.request(counter_identifier_, b'\x06\x03' + struct.pack('>H', pointer) + b'\x07')
+
+        for index in (1, 8, 255):
+            for count in (0x07, 0x82, 0xC0, 0xFF):
+                yield bytes(frames.memory_read(counter_identifier_, index, 3, pointer, count))
+
+
+def test_split_frame_returns_whole_requests():
+    # Например 680c08033034ff4500: CRC первых 8 байт уже сходится
+    for counter_identifier in range(1, 255):
+        for frame in request_frames(counter_identifier):
+            following = FrameCache().request(counter_identifier, b'\x00')
+
+            assert emulator.split_frame(frame[:-1]) == 0, frame.hex()
+            assert emulator.split_frame(frame + following) == len(frame), frame.hex()
+
+
+def test_parser_splits_records_across_blocks():
+    meter = emulator.MeterEmulator(104, days_=3, seed_=1)
+    day = make_date_param(date.today() - timedelta(days=1))
+    address = meter.headers[bytes.fromhex(day)] - 2 * PROFILE_RECORD_LEN
+    data = meter.read_memory(address, 30 * PROFILE_RECORD_LEN)
+
+    whole = PowerProfileParser([day]).feed(data)
+
+    parser = PowerProfileParser([day])
+    pieces = []
+
+    for start in range(0, len(data), 37):  # Блоки не кратны длине записи
+        pieces.extend(parser.feed(data[start:start + 37]))
+
+    assert [hour for d, hour, values in whole] == list(range(24))
+    assert pieces == whole
+
+
+def test_range_across_memory_end(params):
+    # Профиль начинается незадолго до конца памяти и продолжается с адреса 0
+    meter = emulator.MeterEmulator(104, days_=DAYS, start_pointer_=0xF000, seed_=1)
+    assert meter.pointer < 0xF000
+
+    days = read_range(params, EmulatorPort(emulator.BusEmulator([meter])), *past_range())
+
+    check_range(meter, days)
+
+
+@pytest.mark.parametrize('max_block', [0x82, 0xC0, 0xFF])
+def test_block_size_limits(params, max_block):
+    meter = emulator.MeterEmulator(104, days_=DAYS, start_pointer_=0xF000, seed_=1, max_block_=max_block)
+    bus = emulator.BusEmulator([meter])
+
+    days = read_range(params, EmulatorPort(bus), *past_range())
+
+    check_range(meter, days)
+
+    # Чтений памяти не больше, чем нужно блоками наибольшего размера (плюс заголовки, поиск и пробы)
+    assert bus.requests <= DAYS * 24 * PROFILE_RECORD_LEN // max_block + 30
+
+
+def test_noisy_line_recovery(params):
+    meter = emulator.MeterEmulator(104, days_=DAYS, seed_=1)
+    bus = emulator.BusEmulator([meter], bit_errors_=0.0002, seed_=3)
+
+    days = read_range(dict(params, request_retries=5), EmulatorPort(bus), *past_range())
+
+    check_range(meter, days)
+
+
+def test_lost_blocks_are_read_again(params):
+    """
+    Блоки, не прочитанные и после всех повторов, перечитываются перед отдачей суток
+    """
+
+    class LosingPort(EmulatorPort):
+        base = 0  # Адрес начала чтения подряд (заголовок первых суток)
+        lost = []  # Адреса блоков, ответы на которые потерялись
+
+        def reply(self, frame_):
+            if frame_[1] == 0x0C:
+                offset = (struct.unpack_from('>H', frame_, 4)[0] - self.base) % 0x10000
+
+                # Теряется каждый третий блок чтения подряд (перечитываются блоки с других адресов)
+                if offset % 0x82 == 0 and offset // 0x82 % 3 == 1:
+                    self.lost.append(offset)
+                    return None
+
+            return super().reply(frame_)
+
+    meter = emulator.MeterEmulator(104, days_=DAYS, seed_=1, max_block_=0x82)
+    port = LosingPort(emulator.BusEmulator([meter]))
+    port.base = meter.headers[bytes.fromhex(make_date_param(past_range()[0]))]
+
+    days = read_range(dict(params, request_retries=0), port, *past_range())
+
+    assert port.lost
+    check_range(meter, days)
+
+
+def test_retry_backoff(params):
+    class FlakyPort(EmulatorPort):
+        lost = 2  # Сколько ответов потерять
+
+        def reply(self, frame_):
+            if self.lost > 0:
+                self.lost -= 1
+                return None
+
+            return super().reply(frame_)
+
+    bus = emulator.BusEmulator([emulator.MeterEmulator(104, days_=1)])
+    port = FlakyPort(bus)
+    psch = PSCH(dict(params, request_backoff=0.05, request_retries=3), port)
+
+    start = time.monotonic()
+
+    assert psch.test_counter(port, 104)
+    assert bus.requests == 1  # Два запроса потеряны по дороге к линии
+    assert time.monotonic() - start >= 0.05 + 0.1  # Паузы перед повторами: 0.05, затем 0.1
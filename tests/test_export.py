@@ -0,0 +1,210 @@
+"""
+Выгрузка в файлы: xlsx по шаблону (оформление строк данных берётся из шаблона), выгрузка по месяцам
+в CSV, Parquet и Arrow (строки, схема, время получасовок, порции по EXPORT_CHUNK_DAYS суток)
+"""
+
+import csv
+import os
+import re
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from bench import make_days
+from psch import export
+from psch.export import XLSX_PROFILE_SHEET, CsvProfileExporter, ProfileExporter, XlsxProfileWriter
+from psch.profile import PROFILE_CHANNEL_NAMES, DayProfile
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'template.xlsx')
+
+
+def make_template(file_name_, change_):
+    """
+    Копия template.xlsx с изменённым XML листа профиля
+    """
+
+    with zipfile.ZipFile(TEMPLATE) as src, zipfile.ZipFile(file_name_, 'w') as dst:
+        for info in src.infolist():
+            data = src.read(info.filename)
+
+            if info.filename == XLSX_PROFILE_SHEET:
+                data = change_(data.decode('utf-8')).encode('utf-8')
+
+            dst.writestr(info, data)
+
+
+def write_day(template_, result_):
+    day = DayProfile('010121', 1250, 1)
+    day.set_hour(0, bytes(range(16)))
+
+    writer = XlsxProfileWriter(template_, result_)
+    writer.add_sheet('Профиль', day.items(), datetime(2021, 1, 2))
+    writer.close()
+
+    with zipfile.ZipFile(result_) as z:
+        return z.read('xl/worksheets/profile1.xml').decode('utf-8')
+
+
+def test_rows_use_template_styles(tmp_path):
+    # Другие номера стилей ячеек строк данных
+    template = str(tmp_path / 'template.xlsx')
+    make_template(template, lambda s_: s_.replace('<c r="A13" s="4"/>', '<c r="A13" s="40"/>')
+                                         .replace('<c r="J13" s="7"/>', '<c r="J13" s="70"/>'))
+
+    sheet = write_day(template, str(tmp_path / 'result.xlsx'))
+
+    assert '<c r="A13" s="40" t="inlineStr"><is><t>2021-01-01  00:00-00:30</t></is></c>' in sheet
+    assert re.search(r'<c r="J13" s="70" t="inlineStr"><is><t>[\d.]+</t></is></c>', sheet)
+    assert '<mergeCell ref="A13:I13"/><mergeCell ref="J13:AC13"/>' in sheet
+
+
+def test_unsuitable_template_raises(tmp_path):
+    # Нет объединений ячеек строк данных
+    template = str(tmp_path / 'template.xlsx')
+    make_template(template, lambda s_: re.sub(r'<mergeCell ref="[A-Z]+(\d+):[A-Z]+\1"/>',
+                                              lambda m_: '' if int(m_.group(1)) >= 13 else m_.group(0), s_))
+
+    with pytest.raises(ValueError, match='объединения'):
+        XlsxProfileWriter(template, str(tmp_path / 'result.xlsx'))
+
+    assert not os.path.exists(tmp_path / 'result.xlsx')
+
+
+def test_incomplete_exporter_is_not_created(tmp_path):
+    class NoCloseExporter(ProfileExporter):
+        def open_month(self, file_name_):
+            pass
+
+        def write_day(self, day_):
+            pass
+
+    with pytest.raises(TypeError):
+        NoCloseExporter(str(tmp_path), '1103181104')
+
+
+def export_days(exporter_, days_):
+    for day in days_:
+        exporter_.add_day(day)
+
+    exporter_.close()
+
+    return exporter_.files
+
+
+def expected_rows(days_):
+    """
+    Строки выгрузки: (dt, a_plus, a_minus, r_plus, r_minus) полученных получасовок
+    """
+
+    return [(day.date_time(i),) + tuple(day.values()[i * 4:i * 4 + 4])
+            for day in days_ for i in range(48) if day.received[i // 2]]
+
+
+@pytest.fixture
+def days():
+    """
+    27.01.2021 - 10.02.2021: в январе 5 суток, в феврале 10 (порции 7 + 3), 29.01 без часа 05, 03.02 без 23
+    """
+
+    result = make_days(date(2021, 1, 27), 15)
+    result[2].received[5] = 0
+    result[7].received[23] = 0
+
+    return result
+
+
+def test_csv_export(tmp_path, days):
+    files = export_days(CsvProfileExporter(str(tmp_path), '1103181104'), days)
+
+    assert files == [str(tmp_path / '1103181104' / '2021_01.csv'), str(tmp_path / '1103181104' / '2021_02.csv')]
+
+    rows = []
+
+    for file_name in files:
+        with open(file_name, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+
+            assert next(reader) == ['meter', 'dt'] + list(PROFILE_CHANNEL_NAMES)
+
+            for row in reader:
+                assert row[0] == '1103181104'
+                rows.append((datetime.fromisoformat(row[1]),) + tuple(float(v) for v in row[2:]))
+
+    assert len(rows) == 15 * 48 - 4
+    assert rows == expected_rows(days)
+    assert rows[0][0] == datetime(2021, 1, 27, 0, 30)
+    assert rows[-1][0] == datetime(2021, 2, 10, 23, 59)
+
+
+@pytest.mark.parametrize('format_', ['parquet', 'arrow'])
+@pytest.mark.parametrize('tz', ['UTC', 'Asia/Yekaterinburg', 'America/New_York'])
+def test_arrow_export(tmp_path, monkeypatch, days, format_, tz):
+    pyarrow = pytest.importorskip('pyarrow')
+    pytest.importorskip('numpy')
+
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    # Время получасовок пишется как есть (местное время счётчика), не зависит от часового пояса компьютера
+    monkeypatch.setenv('TZ', tz)
+    time.tzset()
+
+    try:
+        files = export_days(export.ArrowProfileExporter(str(tmp_path), '1103181104', format_), days)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert [os.path.basename(f) for f in files] == [f'2021_01.{format_}', f'2021_02.{format_}']
+
+    tables = []
+    chunks = []  # Строк в группах строк Parquet / пакетах Arrow
+
+    for file_name in files:
+        if format_ == 'parquet':
+            parquet = pyarrow.parquet.ParquetFile(file_name)
+            chunks.extend(parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups))
+            tables.append(parquet.read())
+        else:
+            with pyarrow.ipc.open_file(file_name) as reader:
+                chunks.extend(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+                tables.append(reader.read_all())
+
+    schema = tables[0].schema
+
+    assert schema.names == ['meter', 'dt'] + list(PROFILE_CHANNEL_NAMES)
+    assert schema.field('meter').type == pyarrow.string()
+    assert schema.field('dt').type == pyarrow.timestamp('ms')
+    assert schema.field('dt').type.tz is None
+    assert all(schema.field(name).type == pyarrow.float64() for name in PROFILE_CHANNEL_NAMES)
+
+    # Январь: 5 суток одной порцией, февраль: 7 + 3 суток
+    assert chunks == [5 * 48 - 2, 7 * 48 - 2, 3 * 48]
+
+    table = pyarrow.concat_tables(tables)
+    epoch = datetime(1970, 1, 1)
+    ms = timedelta(milliseconds=1)
+
+    assert set(table.column('meter').to_pylist()) == {'1103181104'}
+    assert table.column('dt').cast(pyarrow.int64()).to_pylist() == [(row[0] - epoch) // ms for row in expected_rows(days)]
+
+    rows = list(zip(*[table.column(name).to_pylist() for name in ['dt'] + list(PROFILE_CHANNEL_NAMES)]))
+
+    assert rows == expected_rows(days)
+
+
+def test_arrow_export_full_chunk(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    pytest.importorskip('numpy')
+
+    import pyarrow.ipc
+
+    # Ровно EXPORT_CHUNK_DAYS суток: одна порция, пустой порции при закрытии нет
+    files = export_days(export.ArrowProfileExporter(str(tmp_path), '1103181104', 'arrow'),
+                        make_days(date(2021, 2, 1), export.EXPORT_CHUNK_DAYS))
+
+    with pyarrow.ipc.open_file(files[0]) as reader:
+        assert reader.num_record_batches == 1
+        assert reader.read_all().num_rows == export.EXPORT_CHUNK_DAYS * 48
@@ -0,0 +1,125 @@
+"""
+Приёмник результатов (ResultSink) и параллельный опрос линий (FleetRunner) на эмуляторах шлюзов
+"""
+
+import threading
+import time
+
+import pytest
+
+from psch import emulator, transport
+from psch.fleet import FleetRunner, ResultSink
+
+
+def test_result_sink_drains_queue_on_close():
+    gate = threading.Event()
+    done = []
+
+    def fail():
+        raise ValueError('запись не удалась')
+
+    sink = ResultSink(2)
+    sink.put(gate.wait)  # Запись "зависла", очередь заполняется
+
+    def producer():
+        for i in range(10):
+            sink.put(done.append, i)
+
+        sink.put(fail)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    time.sleep(0.1)
+
+    assert thread.is_alive()  # Опрос ждёт места в очереди
+    assert sink.queue.qsize() == 2
+
+    gate.set()
+    thread.join(5)
+    sink.put(done.append, 10)
+    sink.close()
+
+    assert done == list(range(11))
+    assert not sink.thread.is_alive()
+    assert (sink.tasks, sink.errors) == (13, 1)
+    assert sink.blocked > 0
+
+
+@pytest.fixture
+def lines(params):
+    """
+    Две линии (TCP-эмуляторы шлюзов) по два счётчика: [(параметры линии, [MeterEmulator])]
+    """
+
+    result = []
+    servers = []
+
+    for n in range(2):
+        meters = [emulator.MeterEmulator(address, days_=1, seed_=address) for address in (104, 105)]
+        server, port = emulator.serve_tcp(emulator.BusEmulator(meters))
+        servers.append(server)
+
+        counters = [{'counter_identifier': m.address, 'counter_factory_number': f'{n}-{m.address}'} for m in meters]
+        result.append((dict(params, port_name=f'tcp://127.0.0.1:{port}', counters=counters), meters))
+
+    yield result
+
+    if transport.gateway_pool is not None:
+        transport.gateway_pool.close()
+        transport.gateway_pool = None
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_fleet_polls_all_lines(lines):
+    sink = ResultSink(4)
+    runner = FleetRunner([line for line, meters in lines], sink)
+    polled = []
+
+    def job(psch_, sink_):
+        info = psch_.read_meter_info(psch_.port, psch_.counter_identifier)
+        sink_.put(polled.append, (psch_.port_name, psch_.counter_identifier, info.firmware))
+
+        return True
+
+    result = runner.run(job)
+    sink.close()
+
+    assert sorted(result) == sorted(line['port_name'] for line, meters in lines)
+
+    for line_result in result.values():
+        assert (line_result['meters'], line_result['polled'], line_result['errors']) == (2, 2, [])
+
+    assert sorted(polled) == sorted((line['port_name'], m.address, m.firmware.hex()) for line, meters in lines
+                                    for m in meters)
+    assert not any(m.opened for line, meters in lines for m in meters)  # Каналы закрыты
+
+
+def test_fleet_stops_on_keyboard_interrupt(lines):
+    runner = FleetRunner([line for line, meters in lines])
+    started = []
+
+    def job(psch_, sink_):
+        started.append((psch_.port_name, psch_.counter_identifier))
+
+        if psch_.port_name == lines[0][0]['port_name']:
+            raise KeyboardInterrupt
+
+        # Вторая линия опрашивает, пока её не остановят
+        for i in range(500):
+            if psch_.stopping():
+                break
+
+            time.sleep(0.01)
+
+        return True
+
+    with pytest.raises(KeyboardInterrupt):
+        runner.run(job)
+
+    assert runner.stop_event.is_set()
+    # Следующие счётчики линий после остановки не опрашиваются
+    assert sorted(started) == sorted((line['port_name'], 104) for line, meters in lines)
+    assert not any(m.opened for line, meters in lines for m in meters)
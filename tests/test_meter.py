@@ -0,0 +1,138 @@
+"""
+PSCH на эмуляторе счётчика: размер блока чтения памяти № 03h, указатель на дату из индекса заголовков
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from helpers import EmulatorPort
+from psch import emulator
+from psch.meter import PSCH
+from psch.profile import PROFILE_BLOCK_LEN, PROFILE_RECORD_LEN
+from psch.protocol import make_date_param
+from psch.storage import ProfileCache, load_json
+
+
+class NoisyProbePort(EmulatorPort):
+    """
+    Чтения памяти длиннее 82h байт теряются на линии (шум, а не отказ счётчика)
+    """
+
+    def reply(self, frame_):
+        if frame_[1] == 0x0C and frame_[-3] > PROFILE_BLOCK_LEN:
+            return None
+
+        return super().reply(frame_)
+
+
+def open_meter(params_, port_):
+    psch = PSCH(params_, port_)
+
+    assert psch.open_channel(port_, 104, '000000')
+
+    return psch
+
+
+def test_block_size_probe_is_cached_per_firmware(params):
+    bus = emulator.BusEmulator([emulator.MeterEmulator(104, days_=5, max_block_=0xC0)])
+    psch = open_meter(params, EmulatorPort(bus))
+
+    assert psch.read_meter_info(psch.port, 104).block_size == 0xC0
+    assert load_json(params['meter_info_cache'])['1103181104']['block_size'] == 0xC0
+
+    # Счётчик с той же версией ПО не пробуется заново
+    requests = bus.requests
+    other = open_meter(dict(params, counter_factory_number='1103181105'), psch.port)
+
+    assert other.read_meter_info(other.port, 104).block_size == 0xC0
+    assert bus.requests - requests == 5  # Открытие канала, 0803, 0809, 0806, 0804 - без проб
+
+
+def test_noisy_probe_is_not_saved(params):
+    bus = emulator.BusEmulator([emulator.MeterEmulator(104, days_=5)])
+    psch = open_meter(params, NoisyProbePort(bus))
+
+    info = psch.read_meter_info(psch.port, 104)
+
+    assert not psch.global_error
+    assert info.block_size == PROFILE_BLOCK_LEN
+    assert '1103181104' not in load_json(params['meter_info_cache'])
+
+
+# Адреса, у которых CRC кадра пробы FFh сходится уже на его начале
+@pytest.mark.parametrize('counter_identifier', [104, 129, 130, 132, 135, 136, 139, 141, 142])
+@pytest.mark.parametrize('max_block', [0xC0, 0xFF])
+def test_probe_per_meter_id(params, counter_identifier, max_block):
+    bus = emulator.BusEmulator([emulator.MeterEmulator(counter_identifier, days_=1, max_block_=max_block)])
+    port = EmulatorPort(bus)
+    psch = PSCH(params, port)
+
+    assert psch.open_channel(port, counter_identifier, '000000')
+    assert psch.read_meter_info(port, counter_identifier).block_size == max_block
+    assert load_json(params['meter_info_cache'])['1103181104']['block_size'] == max_block
+
+
+def test_foreign_status_reply_is_not_a_rejection(params):
+    class ForeignReplyPort(EmulatorPort):
+        """
+        На длинные чтения отвечает ошибкой другой счётчик линии
+        """
+
+        def reply(self, frame_):
+            if frame_[1] == 0x0C and frame_[-3] > PROFILE_BLOCK_LEN:
+                return emulator.MeterEmulator(105, days_=0).reply(bytes((emulator.STATUS_BAD_COMMAND,)))
+
+            return super().reply(frame_)
+
+    psch = open_meter(params, ForeignReplyPort(emulator.BusEmulator([emulator.MeterEmulator(104, days_=1)])))
+
+    assert psch.read_meter_info(psch.port, 104).block_size == PROFILE_BLOCK_LEN
+    assert '1103181104' not in load_json(params['meter_info_cache'])
+
+
+class SearchCountingPort(EmulatorPort):
+    """
+    Считает поиски заголовка суток (0328) и чтения заголовков (0603)
+    """
+    def __init__(self, bus_):
+        super().__init__(bus_)
+        self.searches = 0
+        self.header_reads = 0
+
+    def reply(self, frame_):
+        if frame_[1:3] == b'\x03\x28':
+            self.searches += 1
+        elif frame_[1:3] == b'\x06\x03':
+            self.header_reads += 1
+
+        return super().reply(frame_)
+
+
+@pytest.mark.parametrize('index_offset, searches', [(0, 0), (5 * PROFILE_RECORD_LEN, 1), (None, 1)])
+def test_indexed_pointer_falls_back_to_search(params, tmp_path, index_offset, searches):
+    midnight = datetime.combine(date.today(), datetime.min.time())
+    day = make_date_param(date.today() - timedelta(days=2))
+    params = dict(params, profile_cache=str(tmp_path / 'profile_cache.sqlite'))
+
+    # Вчерашнее отключение сдвигает записи: расчётный адрес от текущего указателя не подтвердится
+    meter = emulator.MeterEmulator(104, days_=3, seed_=1, outages_=[(midnight - timedelta(hours=20),
+                                                                      midnight - timedelta(hours=18))])
+    address = meter.headers[bytes.fromhex(day)]
+
+    if index_offset is not None:
+        cache = ProfileCache(params['profile_cache'])
+        wrong = address + index_offset
+        cache.put_header(params['counter_factory_number'], day, wrong, meter.read_memory(wrong, 7)
+                         if index_offset == 0 else b'\x00' + bytes.fromhex(day) + b'\x01\x1e\x00')
+        cache.close()
+
+    port = SearchCountingPort(emulator.BusEmulator([meter]))
+    psch = open_meter(params, port)
+
+    assert psch.read_power_profile_pointer_on_date(port, 104, day) == address
+    assert not psch.global_error
+    assert port.searches == searches
+
+    if index_offset == 0:
+        assert port.header_reads == 1  # Только проверка заголовка из индекса
@@ -0,0 +1,82 @@
+"""
+Метрики: текстовый формат Prometheus по http-адресу /metrics разбирается обратно в те же метки и значения
+"""
+
+import re
+import urllib.request
+
+import pytest
+
+from psch.metrics import LATENCY_BUCKETS, Metrics
+
+# Строка образца: имя{метка="значение",...} число
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(,|$)')
+
+
+def parse_labels(text_):
+    result = []
+    pos = 0
+
+    while pos < len(text_):
+        m = LABEL.match(text_, pos)
+
+        assert m is not None, text_[pos:]
+
+        value = re.sub(r'\\(.)', lambda e_: '\n' if e_.group(1) == 'n' else e_.group(1), m.group(2))
+        result.append((m.group(1), value))
+        pos = m.end()
+
+    return tuple(result)
+
+
+def parse_prometheus(text_):
+    """
+    Образцы {(имя, метки): значение}, комментарии # HELP / # TYPE пропускаются
+    """
+
+    result = {}
+
+    for line in text_.splitlines():
+        if line.startswith('#') or not line:
+            continue
+
+        m = SAMPLE.match(line)
+
+        assert m is not None, line
+
+        result[(m.group(1), parse_labels(m.group(2) or ''))] = float(m.group(3))
+
+    return result
+
+
+@pytest.fixture
+def metrics():
+    result = Metrics()
+
+    yield result
+
+    result.close()
+
+
+@pytest.mark.parametrize('port', ['COM3', 'tcp://10.0.0.1:4001', 'C:\\ports\\"line 1"\nbus 2'])
+def test_metrics_endpoint_round_trip(metrics, port):
+    metrics.observe_exchange(port, '0C', 0.02, 9, 136, False, False)
+    metrics.observe_exchange(port, '0C', 0.3, 9, 0, False, True)
+    metrics.retry(port, '0C')
+
+    server = metrics.serve_http(0)
+
+    with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics', timeout=5) as response:
+        samples = parse_prometheus(response.read().decode())
+
+    labels = (('port', port), ('opcode', '0C'))
+
+    assert samples[('psch_requests_total', labels)] == 2
+    assert samples[('psch_bytes_received_total', labels)] == 136
+    assert samples[('psch_timeouts_total', labels)] == 1
+    assert samples[('psch_retries_total', labels)] == 1
+    assert samples[('psch_request_duration_seconds_count', labels)] == 2
+    assert samples[('psch_request_duration_seconds_bucket', labels + (('le', '0.025'),))] == 1
+    assert samples[('psch_request_duration_seconds_bucket', labels + (('le', '+Inf'),))] == 2
+    assert len([key for key in samples if key[0] == 'psch_request_duration_seconds_bucket']) == len(LATENCY_BUCKETS) + 1
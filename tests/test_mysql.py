@@ -0,0 +1,202 @@
+"""
+Запись профиля мощности в БД (SQLite вместо MySQL, как в bench.py): пачки UPSERT и запросы NOT EXISTS
+для схемы без уникального ключа, дозапись недостающих суток
+"""
+
+import struct
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from bench import SqliteConnection, add_counter, make_days, prepare_sqlite
+from helpers import EmulatorPort
+from psch import emulator, meter
+from psch.meter import PSCH
+from psch.protocol import make_date_param
+
+
+class CountingPort(EmulatorPort):
+    """
+    Считает чтения памяти № 03h
+    """
+    def __init__(self, bus_):
+        super().__init__(bus_)
+        self.memory_reads = 0
+
+    def reply(self, frame_):
+        if frame_[1] in (0x06, 0x0C):
+            self.memory_reads += 1
+
+        return super().reply(frame_)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    result = str(tmp_path / 'db.sqlite')
+    prepare_sqlite(result).close()
+
+    return result
+
+
+def open_psch(params_, port_, db_file_):
+    psch = PSCH(params_, port_)
+    psch.db = SqliteConnection(db_file_)
+    psch.mysql_unique_key = True
+    psch.mysql_counter_id = add_counter(psch.db, params_['counter_factory_number'])
+
+    assert psch.open_channel(port_, 104, '000000')
+
+    return psch
+
+
+def day_rows(db_file_):
+    """
+    Количество получасовок в БД по датам
+    """
+
+    db = SqliteConnection(db_file_)
+    cursor = db.cursor()
+    cursor.execute("select date(dt) as d, count(*) as c from loadprofiles group by date(dt)")
+    result = {row['d']: row['c'] for row in cursor.fetchall()}
+    db.close()
+
+    return result
+
+
+def read_values(db_file_):
+    """
+    Строки loadprofiles {dt: (activePowerConsumed, reactiveEnergyConsumed)}; дубли по dt не допускаются
+    """
+
+    db = SqliteConnection(db_file_)
+    cursor = db.cursor()
+    cursor.execute("select dt, activePowerConsumed, reactiveEnergyConsumed from loadprofiles")
+    rows = cursor.fetchall()
+    db.close()
+
+    result = {row['dt']: (row['activePowerConsumed'], row['reactiveEnergyConsumed']) for row in rows}
+
+    assert len(result) == len(rows)
+
+    return result
+
+
+@pytest.mark.parametrize('unique_key', [True, False])
+def test_power_profile_to_mysql_batches(params, tmp_path, monkeypatch, unique_key):
+    db_file = str(tmp_path / 'db.sqlite')
+    prepare_sqlite(db_file, unique_key).close()
+
+    batches = []
+
+    def execute_many(db_, query_, rows_):
+        batches.append(len(rows_))
+        return mysql_execute_many(db_, query_, rows_)
+
+    mysql_execute_many = meter.mysql_execute_many
+    monkeypatch.setattr(meter, 'mysql_execute_many', execute_many)
+    monkeypatch.setattr(meter, 'MYSQL_BATCH_SIZE', 50)
+
+    def write(seed_):
+        days = make_days(date(2021, 1, 1), 3, seed_)
+        days[1].received[5] = 0  # Час 05 не прочитан - не пишется
+        items = [item for day in days for item in day.items()]
+
+        psch = PSCH(params)
+        psch.db = SqliteConnection(db_file)
+        psch.mysql_unique_key = unique_key
+        psch.mysql_counter_id = add_counter(psch.db, params['counter_factory_number'])
+        psch.power_profile_to_mysql(items)
+        psch.mysql_close()
+
+        return {item.date_time: (item.a_plus, item.r_plus) for item in items if item.valid}
+
+    first = write(1)
+
+    assert len(first) == 3 * 48 - 2
+    assert batches == [50, 50, 42]
+    assert read_values(db_file) == first
+
+    # Повторная запись тех же суток не создаёт дублей
+    assert write(1) == first
+    assert read_values(db_file) == first
+
+    # Изменённые значения: UPSERT обновляет, запрос без ключа оставляет записанные
+    second = write(2)
+
+    assert second != first
+    assert read_values(db_file) == (second if unique_key else first)
+    assert batches == [50, 50, 42] * 3
+
+
+def test_incremental_skips_days_with_gaps_on_meter(params, db_file, tmp_path):
+    today = date.today()
+    midnight = datetime.combine(today, datetime.min.time())
+    complete, missing, gap, last = (today - timedelta(days=i) for i in (4, 3, 2, 1))
+
+    meter = emulator.MeterEmulator(104, days_=5, seed_=1, outages_=[
+        (midnight - timedelta(days=3), midnight - timedelta(days=2)),  # Сутки целиком
+        (midnight - timedelta(days=2, hours=-10), midnight - timedelta(days=2, hours=-14))])  # 10:00 - 14:00
+    bus = emulator.BusEmulator([meter])
+    params = dict(params, profile_cache=str(tmp_path / 'profile_cache.sqlite'))
+
+    def run():
+        port = CountingPort(bus)
+        psch = open_psch(params, port, db_file)
+        psch.power_profile_to_mysql_incremental(port, 104, 1250, 1, 4)
+
+        assert not psch.global_error
+
+        return port.memory_reads
+
+    assert run() > 0
+    assert day_rows(db_file) == {complete: 48, gap: 40, last: 48}
+
+    # Пропуски в памяти счётчика не перечитываются
+    assert run() == 0
+
+    # Получасовки, которые есть в счётчике, но не записаны в БД, перечитываются
+    db = SqliteConnection(db_file)
+    db.cursor().execute("delete from loadprofiles where dt > %s and dt <= %s",
+                        (datetime.combine(gap, datetime.min.time()), datetime.combine(gap, datetime.min.time()) +
+                         timedelta(hours=2)))
+    db.commit()
+    db.close()
+
+    assert day_rows(db_file)[gap] == 36
+    assert run() > 0
+    assert day_rows(db_file) == {complete: 48, gap: 40, last: 48}
+
+
+def test_lost_blocks_are_not_gaps(params, db_file, tmp_path):
+    class LosingPort(CountingPort):
+        """
+        Чтения памяти № 03h, в которые попадает первая запись вчерашних суток, не доходят до счётчика
+        """
+
+        def reply(self, frame_):
+            if self.lost_address is not None and frame_[1] == 0x0C:
+                address, count = struct.unpack('>HB', frame_[4:7])
+
+                if address <= self.lost_address < address + count:
+                    return None
+
+            return super().reply(frame_)
+
+    meter = emulator.MeterEmulator(104, days_=3, seed_=1)
+    bus = emulator.BusEmulator([meter])
+    params = dict(params, profile_cache=str(tmp_path / 'profile_cache.sqlite'), request_retries=1)
+    yesterday = date.today() - timedelta(days=1)
+
+    port = LosingPort(bus)
+    port.lost_address = meter.headers[bytes.fromhex(make_date_param(yesterday))]
+    psch = open_psch(params, port, db_file)
+    psch.power_profile_to_mysql_incremental(port, 104, 1250, 1, 2)
+
+    assert day_rows(db_file).get(yesterday, 0) < 48
+    assert psch.profile_cache.get_gaps(params['counter_factory_number']) == {}
+
+    port.lost_address = None
+    psch = open_psch(params, port, db_file)
+    psch.power_profile_to_mysql_incremental(port, 104, 1250, 1, 2)
+
+    assert day_rows(db_file) == {yesterday - timedelta(days=1): 48, yesterday: 48}
@@ -0,0 +1,81 @@
+"""
+Профиль мощности: вариант пересчёта через NumPy совпадает с DayProfile.values(),
+присваивание значений и дат получасовкам PowerProfileItem
+"""
+
+import struct
+from datetime import date, timedelta
+
+import pytest
+
+from psch.profile import PROFILE_CHANNEL_NAMES, PROFILE_DAY_WORDS, DayProfile, PowerProfileItem, profile_to_array
+
+
+def make_days(divide_, transform_):
+    """
+    Сутки, в которых подряд лежат все 16-битные слова 0000h..FFFFh
+    """
+
+    words = list(range(0x10000))
+    words += [0] * (-len(words) % PROFILE_DAY_WORDS)
+
+    result = []
+    start = date(2021, 1, 1)
+
+    for i in range(len(words) // PROFILE_DAY_WORDS):
+        day = DayProfile((start + timedelta(days=i)).strftime('%d%m%y'), divide_, transform_)
+        day.raw[:] = struct.pack(f'>{PROFILE_DAY_WORDS}H', *words[i * PROFILE_DAY_WORDS:(i + 1) * PROFILE_DAY_WORDS])
+        result.append(day)
+
+    return result
+
+
+@pytest.mark.parametrize('divide, transform', [(1250, 1), (5000, 1), (5000, 3), (1000, 7), (2500, 40)])
+def test_profile_to_array_matches_values(divide, transform):
+    numpy = pytest.importorskip('numpy')
+    days = make_days(divide, transform)
+    data = profile_to_array(days)
+
+    expected = [v for d in days for v in d.values()]
+    actual = numpy.column_stack([data[name] for name in PROFILE_CHANNEL_NAMES]).ravel().tolist()
+
+    assert actual == expected
+
+
+def test_item_value_survives_set_hour():
+    day = DayProfile('010121', 1250, 1)
+    item = PowerProfileItem(day, 0)
+
+    item.a_plus = 7.0
+    item.r_minus = 0.8
+    day.set_hour(1, bytes(range(16)))
+
+    assert item.a_plus == 7.0
+    assert item.r_minus == 0.8
+    assert struct.unpack_from('>H', day.raw, 0)[0] == 8750
+    assert PowerProfileItem(day, 2).a_plus == round(0x0001 / 1250, 2)
+
+
+def test_item_value_not_representable():
+    day = DayProfile('010121', 1250, 1)
+    item = PowerProfileItem(day, 0)
+
+    for value in (0.001, -1.0, 0x10000 / 1250):
+        with pytest.raises(ValueError):
+            item.a_plus = value
+
+    assert item.a_plus == 0.0
+
+
+def test_item_date_fields_assignable():
+    day = DayProfile('010121')
+    item = PowerProfileItem(day, 3)
+
+    assert (item.date_param, item.time_param) == ('2021-01-01', '01:30-02:00')
+
+    item.date_param = '2021-01-02'
+    item.time_param = '00:00-00:30'
+    item.date_time = '2021-01-02 00:30:00'
+
+    assert (item.date_param, item.time_param, item.date_time) == ('2021-01-02', '00:00-00:30', '2021-01-02 00:30:00')
+    assert PowerProfileItem(day, 3).date_param == '2021-01-01'
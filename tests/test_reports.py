@@ -0,0 +1,63 @@
+"""
+HTML-отчёты: четыре файла, строки текущего месяца, запись частями по REPORT_CHUNK_ROWS, заголовок графика
+"""
+
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from psch import reports
+from psch.reports import EPOCH, write_reports
+
+MONTH_START = datetime(2021, 3, 1)
+TITLE = 'ПС "Южная" \\ ввод 1\nл\'ес </script><script>alert(1)</script>'
+
+
+def make_rows(count_):
+    """
+    Получасовки с конца февраля: (dt, activePowerConsumed)
+    """
+
+    start = MONTH_START - timedelta(hours=count_ // 4)
+
+    return [(start + timedelta(minutes=30 * i), round(i * 0.01, 2)) for i in range(count_)]
+
+
+def read_report(file_name_):
+    """
+    Данные (массив ROWS) и заголовок графика (если есть) html-отчёта
+    """
+
+    with open(file_name_, encoding='utf-8') as f:
+        text = f.read()
+
+    assert text.endswith(reports.REPORT_END)
+    assert text.count('</script>') == 3  # Заголовок не закрывает тег скрипта
+
+    rows = json.loads(re.search(r'var ROWS = (\[.*\]);', text, re.S).group(1))
+    title = re.search(r'^title: (.*),$', text, re.M)
+
+    return rows, json.loads(title.group(1)) if title is not None else None
+
+
+@pytest.mark.parametrize('chunk_rows, count', [(2000, 0), (2000, 10), (7, 7), (7, 50), (7, 51)])
+def test_write_reports(tmp_path, monkeypatch, chunk_rows, count):
+    monkeypatch.setattr(reports, 'REPORT_CHUNK_ROWS', chunk_rows)
+
+    rows = make_rows(count)
+    report_dir = tmp_path / 'reports' / '1103181104'
+
+    write_reports(iter(rows), str(report_dir), TITLE, 3, 500, MONTH_START)
+
+    expected = [[(dt - EPOCH) // timedelta(milliseconds=1), value * 3, 500] for dt, value in rows]
+    month = [row for row, (dt, value) in zip(expected, rows) if dt >= MONTH_START]
+
+    assert 0 < len(month) < len(expected) or count == 0
+
+    for file_name, data, title in (('report_all.html', expected, f'{TITLE}; Все данные'),
+                                   ('report_month.html', month, f'{TITLE}; За текущий месяц'),
+                                   ('report_all_e.html', expected, None),
+                                   ('report_month_e.html', month, None)):
+        assert read_report(report_dir / file_name) == (data, title), file_name
@@ -0,0 +1,149 @@
+"""
+Кэш метаданных счётчиков: одновременная запись из потоков опроса.
+Дисковый кэш суток профиля мощности (ProfileCache): полные сутки, индекс заголовков, неполные сутки не хранятся
+"""
+
+import threading
+from datetime import date, datetime, timedelta
+
+from helpers import EmulatorPort
+from psch import emulator
+from psch.meter import PSCH
+from psch.protocol import make_date_param
+from psch.storage import ProfileCache, load_json, update_json
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    file_name = str(tmp_path / 'meter_info.json')
+
+    def worker(n_):
+        for i in range(20):
+            update_json(file_name, f'{n_}_{i}', {'block_size': i})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    assert len(load_json(file_name)) == 8 * 20
+    assert [p.name for p in tmp_path.iterdir()] == ['meter_info.json']  # Временные файлы не остаются
+
+
+def test_profile_cache_round_trip(tmp_path):
+    file_name = str(tmp_path / 'profile_cache.sqlite')
+    raw = bytes(range(256)) * 3
+    cache = ProfileCache(file_name)
+
+    cache.put('1103181104', '010121', 0x1234, b'\x00\x01\x01\x21\x01\x1e\x00', raw)
+    cache.put_header('1103181104', '020121', 0x1294, b'\x00\x02\x01\x21\x01\x1e\x00')
+    cache.close()
+
+    cache = ProfileCache(file_name)
+
+    assert cache.get('1103181104', '010121') == (0x1234, b'\x00\x01\x01\x21\x01\x1e\x00', raw)
+    assert cache.get('1103181104', '020121') is None  # Только заголовок
+    assert cache.get('1103181105', '010121') is None  # Другой счётчик
+
+    # Индекс заголовков: и сохранённые сутки, и только заголовки
+    assert cache.get_header('1103181104', '010121') == (0x1234, b'\x00\x01\x01\x21\x01\x1e\x00')
+    assert cache.get_header('1103181104', '020121') == (0x1294, b'\x00\x02\x01\x21\x01\x1e\x00')
+    assert cache.get_header('1103181104', '030121') is None
+
+    cache.close()
+
+
+class CountingPort(EmulatorPort):
+    """
+    Считает чтения памяти № 03h блоками (0C)
+    """
+    def __init__(self, bus_):
+        super().__init__(bus_)
+        self.block_reads = 0
+
+    def reply(self, frame_):
+        if frame_[1] == 0x0C:
+            self.block_reads += 1
+
+        return super().reply(frame_)
+
+
+def read_days(params_, meter_, date_from_, date_to_):
+    """
+    Сутки date_from_ .. date_to_ с эмулятора через кэш params_['profile_cache']
+    :return: ({ddmmyy: DayProfile}, чтений памяти блоками)
+    """
+
+    port = CountingPort(emulator.BusEmulator([meter_]))
+    psch = PSCH(params_, port)
+
+    assert psch.open_channel(port, 104, '000000')
+
+    result = {d.date_param: d for d in psch.iter_power_profile_range(port, 104, date_from_, date_to_, 1250, 1)}
+
+    assert not psch.global_error
+
+    psch.profile_cache.close()
+
+    return result, port.block_reads
+
+
+def test_profile_cache_stores_only_complete_days(params, tmp_path):
+    today = date.today()
+    midnight = datetime.combine(today, datetime.min.time())
+    params = dict(params, profile_cache=str(tmp_path / 'profile_cache.sqlite'))
+
+    # Позавчера счётчик был выключен с 10:00 до 12:00
+    meter = emulator.MeterEmulator(104, days_=4, seed_=1, outages_=[(midnight - timedelta(days=2, hours=-10),
+                                                                      midnight - timedelta(days=2, hours=-12))])
+    names = [make_date_param(today - timedelta(days=i)) for i in (3, 2, 1)]
+
+    days, reads = read_days(params, meter, today - timedelta(days=3), today - timedelta(days=1))
+
+    assert sorted(days) == sorted(names)
+    assert reads > 0
+
+    cache = ProfileCache(params['profile_cache'])
+    stored = {name: cache.get(params['counter_factory_number'], name) for name in names}
+
+    for name in (names[0], names[2]):
+        address, header, raw = stored[name]
+
+        assert address == meter.headers[bytes.fromhex(name)]
+        assert header == meter.read_memory(address, 7)
+        assert raw == bytes(days[name].raw)
+
+    assert stored[names[1]] is None  # Пропуск в памяти счётчика
+
+    # Заголовки есть и у неполных суток
+    for name in names:
+        assert cache.get_header(params['counter_factory_number'], name)[0] == meter.headers[bytes.fromhex(name)]
+
+    cache.close()
+
+    # Полные сутки в начале диапазона берутся из кэша без чтения памяти блоками
+    cached, reads = read_days(params, meter, today - timedelta(days=3), today - timedelta(days=3))
+
+    assert reads == 0
+    assert bytes(cached[names[0]].raw) == bytes(days[names[0]].raw)
+    assert all(cached[names[0]].received)
+
+
+def test_profile_cache_detects_overwritten_memory(params, tmp_path):
+    params = dict(params, profile_cache=str(tmp_path / 'profile_cache.sqlite'))
+    day = date.today() - timedelta(days=2)
+    name = make_date_param(day)
+
+    read_days(params, emulator.MeterEmulator(104, days_=3, seed_=1), day, day)
+
+    # Память счётчика перезаписана (другой адрес и данные суток)
+    meter = emulator.MeterEmulator(104, days_=3, seed_=2, start_pointer_=0x2000)
+    days, reads = read_days(params, meter, day, day)
+
+    address = meter.headers[bytes.fromhex(name)]
+    data = meter.read_memory(address, 24 * 24)
+
+    assert reads > 0
+    assert bytes(days[name].raw) == b''.join(data[i + 8:i + 24] for i in range(0, len(data), 24))
@@ -0,0 +1,117 @@
+"""
+Транспорт через шлюз: PSCH -> LinkPort -> Link.request -> ReplayServer
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from psch import transport
+from psch.meter import PSCH
+from psch.protocol import FrameCache
+
+
+@pytest.fixture
+def pool():
+    result = transport.GatewayPool()
+
+    yield result
+
+    async def close_links():
+        for link in result.links.values():
+            link.close()
+
+        await asyncio.sleep(0.05)  # ReplayServer.handle успевает получить конец потока
+
+    asyncio.run_coroutine_threadsafe(close_links(), result.loop).result(5)
+    result.close()
+
+
+def start_server(pool_, replies_):
+    server = transport.ReplayServer(replies_)
+    url = asyncio.run_coroutine_threadsafe(server.start(), pool_.loop).result(5)
+
+    return server, url
+
+
+def test_request_through_replay_server(pool, params):
+    frames = FrameCache()
+    request = frames.request(104, b'\x00')
+    server, url = start_server(pool, {request: frames.ok_answer(104)})
+
+    psch = PSCH(dict(params, port_name=url), pool.port(url, 0.3))
+
+    assert psch.test_counter(psch.port, 104)
+    assert not psch.global_error
+    assert server.requests == [request]
+
+
+def test_no_answer_is_retried(pool, params):
+    server, url = start_server(pool, {})
+
+    psch = PSCH(dict(params, port_name=url, port_timeout=0.05), pool.port(url, 0.05))
+
+    assert not psch.test_counter(psch.port, 104)
+    assert not psch.global_error  # Нет ответа - не ошибка соединения
+
+
+def test_reconnect_after_gateway_closed_connection(pool, params):
+    frames = FrameCache()
+    request = frames.request(104, b'\x00')
+    server, url = start_server(pool, {request: frames.ok_answer(104)})
+
+    port = pool.port(url, 0.3)
+    psch = PSCH(dict(params, port_name=url), port)
+
+    assert psch.test_counter(port, 104)
+
+    # Шлюз оборвал соединение
+    pool.loop.call_soon_threadsafe(port.link.transport.close)
+
+    for i in range(100):
+        if not port.link.connected:
+            break
+
+        time.sleep(0.01)
+
+    assert not port.link.connected
+
+    assert psch.test_counter(port, 104)
+    assert port.link.connected
+    assert server.requests == [request, request]
+
+
+def test_write_without_connection_raises(pool):
+    link = transport.Link('tcp://127.0.0.1:1', pool.loop)
+
+    with pytest.raises(ConnectionError):
+        link.write(b'\x00')
+
+
+def test_hung_request_times_out(pool, monkeypatch):
+    frames = FrameCache()
+    server, url = start_server(pool, {})
+    port = pool.port(url, 0.05)
+    monkeypatch.setattr(transport, 'REQUEST_MARGIN', 0.1)
+
+    # Линию занял другой запрос, который не заканчивается
+    asyncio.run_coroutine_threadsafe(port.link.request_lock.acquire(), pool.loop).result(5)
+
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        port.request(frames.request(104, b'\x00'), 4)
+
+    assert time.monotonic() - start < 1
+
+    pool.loop.call_soon_threadsafe(port.link.request_lock.release)
+
+
+def test_import_without_pyserial():
+    code = 'import sys, psch.transport; assert "serial" not in sys.modules'
+
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))